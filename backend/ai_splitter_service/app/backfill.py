@@ -0,0 +1,231 @@
+"""
+Splits expenses that are still missing a split (`split: {}`), e.g. after an outage.
+
+    python app/backfill.py [--group-id ID ...] [--since 2024-01-01] [--until 2024-02-01]
+                           [--concurrency 8] [--rate 20] [--chunk-size 200] [--dry-run]
+
+Expenses are streamed in (created_at, _id) order and split concurrently through the
+configured split engines (SPLIT_ENGINES, or --engines), at most --concurrency at a time
+and --rate per second. Each split is written with a conditional find_one_and_update (a
+chunk's writes run concurrently), and only while the split is still empty, so splits
+written meanwhile by the live consumer win. In the same transaction (where the server
+supports them) the group ledger is updated and an expense.split_changed event is written
+to the expense database's outbox, which expense_service's relay publishes; a split this
+run wrote therefore never goes unannounced, even if the run dies right after. After every
+chunk the position is saved in `backfill_checkpoints`; re-running the same command
+resumes there (--restart starts over). Expenses whose split failed stay
+empty and are picked up by a --restart run.
+
+--dry-run writes nothing: the gemini engine is swapped for the offline stub (which never
+fills the split cache) and no split, ledger, event or checkpoint is written.
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+
+CHECKPOINT_COLLECTION = "backfill_checkpoints"
+UNSPLIT = {"$in": [{}, None]}
+
+class RateLimiter:
+    """Spaces calls to at most `rate` per second (0 = unlimited)."""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            if self._next > now:
+                await asyncio.sleep(self._next - now)
+            self._next = max(now, self._next) + self.interval
+
+def job_name(args) -> str:
+    spec = f"{sorted(args.group_id or [])}|{args.since}|{args.until}"
+    return "splits:" + hashlib.sha1(spec.encode()).hexdigest()[:12]
+
+async def run(args) -> int:
+    # Imported after the CLI has adjusted the environment, since settings are read on import
+    from bson import ObjectId
+    from pymongo import ReturnDocument
+    from core.config import settings
+    from core.database import connect_to_mongo, close_mongo_connection, get_database, mongo
+    from core.engines import build_engines, split_expense
+    from splitwise_common.events import expense_split_changed_event
+    from splitwise_common.ledger import apply_split_change
+    from splitwise_common.outbox import enqueue, outbox_entry, transaction
+
+    for group_id in args.group_id or []:
+        if not ObjectId.is_valid(group_id):
+            print(f"Invalid group id: {group_id}")
+            return 2
+
+    await connect_to_mongo()
+    db = get_database()
+    engines = build_engines(settings.SPLIT_ENGINES)
+    name = job_name(args)
+
+    base_query = {"split": UNSPLIT}
+    if args.group_id:
+        base_query["group_id"] = {"$in": [ObjectId(g) for g in args.group_id]}
+    if args.since or args.until:
+        base_query["created_at"] = {}
+        if args.since:
+            base_query["created_at"]["$gte"] = datetime.fromisoformat(args.since)
+        if args.until:
+            base_query["created_at"]["$lt"] = datetime.fromisoformat(args.until)
+
+    checkpoint = None
+    if not args.restart and not args.dry_run:
+        checkpoint = await db[CHECKPOINT_COLLECTION].find_one({"_id": name})
+    query = dict(base_query)
+    if checkpoint:
+        print(f"Resuming {name} after {checkpoint['created_at'].isoformat()} / {checkpoint['last_id']}")
+        query = {"$and": [base_query, {"$or": [
+            {"created_at": {"$gt": checkpoint["created_at"]}},
+            {"created_at": checkpoint["created_at"], "_id": {"$gt": checkpoint["last_id"]}},
+        ]}]}
+
+    total = await db["expenses"].count_documents(query)
+    print(f"{'[dry run] ' if args.dry_run else ''}{total} unsplit expense(s) to process with engines {settings.SPLIT_ENGINES}")
+
+    members_by_group = {}
+    limiter = RateLimiter(args.rate)
+    slots = asyncio.Semaphore(args.concurrency)
+    paths = Counter()
+    processed = written = failed = 0
+    failed_ids = []
+    started = time.monotonic()
+
+    async def split_one(expense: dict):
+        nonlocal failed
+        group_id = expense["group_id"]
+        if group_id not in members_by_group:
+            group_doc = await db["groups"].find_one({"_id": group_id}, {"members": 1})
+            members_by_group[group_id] = group_doc.get("members", []) if group_doc else None
+        if members_by_group[group_id] is None:
+            return None
+        expense_data = {
+            "expense_id": str(expense["_id"]),
+            "group_id": str(group_id),
+            "amount": expense["amount"],
+            "paid_by": expense["paid_by"],
+            "participants": expense["participants"],
+            "description": expense["description"],
+        }
+        await limiter.wait()
+        async with slots:
+            try:
+                path, split = await split_expense(engines, expense_data, members_by_group[group_id])
+            except Exception as e:
+                failed += 1
+                failed_ids.append(str(expense["_id"]))
+                print(f"Could not split expense {expense['_id']}: {e}")
+                return None
+        paths[path] += 1
+        return split
+
+    projection = {"group_id": 1, "amount": 1, "paid_by": 1, "participants": 1, "description": 1, "created_at": 1}
+    cursor = db["expenses"].find(query, projection).sort([("created_at", 1), ("_id", 1)]).batch_size(args.chunk_size)
+    if args.limit:
+        cursor = cursor.limit(args.limit)
+
+    async def write_split(expense: dict, split: dict):
+        """Writes the split if it is still empty, with its ledger change and outbox event."""
+        async with transaction(mongo) as session:
+            doc = await db["expenses"].find_one_and_update(
+                {"_id": expense["_id"], "split": UNSPLIT},
+                {"$set": {"split": split}, "$inc": {"split_version": 1}},
+                projection={"group_id": 1, "paid_by": 1, "split": 1, "split_version": 1},
+                return_document=ReturnDocument.AFTER,
+                session=session
+            )
+            if doc is None:
+                return None
+            await enqueue(db, [outbox_entry("expense_events", "expense.split_changed", expense_split_changed_event(
+                doc, doc["split"], doc["split_version"]
+            ))], session=session)
+            await apply_split_change(db, doc["group_id"], doc["paid_by"], None, doc["split"], session=session)
+        return doc
+
+    async def handle_chunk(chunk: list):
+        nonlocal processed, written
+        splits = await asyncio.gather(*(split_one(e) for e in chunk))
+        done = [(e, s) for e, s in zip(chunk, splits) if s is not None]
+        processed += len(chunk)
+
+        if args.dry_run:
+            for expense, split in done[:3]:
+                print(f"  {expense['_id']} {expense['description']!r}: {split}")
+        elif done:
+            # One conditional write per expense tells which splits this run wrote; the
+            # others were split meanwhile, and the live consumer updated their ledgers.
+            # A failed write raises before the checkpoint moves, so a re-run retries it.
+            updated = await asyncio.gather(*(write_split(e, s) for e, s in done))
+            mine = [doc for doc in updated if doc is not None]
+            written += len(mine)
+            if len(mine) < len(done):
+                print(f"  {len(done) - len(mine)} expense(s) were split meanwhile; left unchanged.")
+
+        if not args.dry_run:
+            last = chunk[-1]
+            await db[CHECKPOINT_COLLECTION].update_one(
+                {"_id": name},
+                {"$set": {"created_at": last["created_at"], "last_id": last["_id"], "updated_at": datetime.utcnow()},
+                 "$inc": {"processed": len(chunk)}},
+                upsert=True
+            )
+
+        elapsed = time.monotonic() - started
+        rate = processed / elapsed if elapsed else 0.0
+        eta = (total - processed) / rate if rate else 0.0
+        print(f"{processed}/{total} processed, {written} written, {failed} failed, "
+              f"{rate:.1f}/s, ETA {eta:.0f}s, paths {dict(paths)}")
+
+    try:
+        chunk = []
+        async for expense in cursor:
+            chunk.append(expense)
+            if len(chunk) >= args.chunk_size:
+                await handle_chunk(chunk)
+                chunk = []
+        if chunk:
+            await handle_chunk(chunk)
+    finally:
+        close_mongo_connection()
+
+    if failed_ids:
+        print(f"{len(failed_ids)} expense(s) failed and are still unsplit; re-run with --restart to retry them.")
+    print("Done." if not args.dry_run else "Dry run finished; nothing was written.")
+    return 1 if failed_ids else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--group-id", action="append", help="Only this group (repeatable)")
+    parser.add_argument("--since", help="created_at lower bound (ISO date/time, inclusive)")
+    parser.add_argument("--until", help="created_at upper bound (ISO date/time, exclusive)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=0, help="Max expenses split per second (0 = unlimited)")
+    parser.add_argument("--chunk-size", type=int, default=200, help="Expenses per concurrent write batch and checkpoint")
+    parser.add_argument("--limit", type=int, default=0, help="Stop after this many expenses")
+    parser.add_argument("--engines", help="Overrides SPLIT_ENGINES for this run")
+    parser.add_argument("--restart", action="store_true", help="Ignore the saved checkpoint")
+    parser.add_argument("--dry-run", action="store_true", help="Split with the stub model and print samples without writing")
+    args = parser.parse_args()
+
+    if args.engines:
+        os.environ["SPLIT_ENGINES"] = args.engines
+    if args.dry_run:
+        # Neither call Gemini nor let a model answer land in the split cache
+        engines = os.environ.get("SPLIT_ENGINES", "rule,cache,gemini").split(",")
+        os.environ["SPLIT_ENGINES"] = ",".join("stub" if e.strip() == "gemini" else e for e in engines)
+        os.environ.setdefault("STUB_LATENCY_MS", "0")
+    sys.exit(asyncio.run(run(args)))
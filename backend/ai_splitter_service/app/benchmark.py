@@ -0,0 +1,161 @@
+"""
+Drives synthetic expense.created traffic through the real AI splitter consumer and
+reports split latency and throughput. With the stub model engine no network model
+is needed:
+
+    SPLIT_ENGINES=rule,cache,stub STUB_LATENCY_MS=800 python app/benchmark.py --messages 2000
+
+Events are published to a separate exchange/queue and consumed in this process by
+main.process_expense_created, against MongoDB and RabbitMQ from the usual settings.
+The scratch group, its expenses and its ledger are deleted afterwards.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timezone
+
+BENCH_EXCHANGE = "expense_events_bench"
+MEMBERS = ["alice", "bob", "carol", "dave", "erin"]
+# (template, needs the model): rule-decidable descriptions and ambiguous ones
+DESCRIPTIONS = [
+    ("Groceries", False),
+    ("Dinner except {p}", False),
+    ("Taxi, 2x for {p}", False),
+    ("Hotel, {p} 40%", False),
+    ("Pizza night, {p} had a bit more", True),
+    ("Concert tickets, {p} brought a friend", True),
+    ("Road trip fuel, {p} drove half the way", True),
+]
+
+def _percentile(samples: list, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+def _description(rng: random.Random, ambiguous_ratio: float, run_id: str, n: int) -> str:
+    pool = [d for d, model in DESCRIPTIONS if model == (rng.random() < ambiguous_ratio)]
+    # A unique suffix keeps ambiguous expenses from being answered by the split cache
+    return rng.choice(pool).format(p=rng.choice(MEMBERS)) + f" #{run_id}-{n}"
+
+async def run(args):
+    # Imported after the CLI has adjusted the environment, since settings are read on import
+    import aio_pika
+    from bson import ObjectId
+    import main as splitter
+    from core import rabbitmq
+    from core.database import connect_to_mongo, close_mongo_connection, get_database
+    from splitwise_common.ledger import LEDGER_COLLECTION
+    from core.metrics import consumer_metrics
+    from core.rabbitmq import connect_to_rabbitmq, close_rabbitmq_connection, consume_messages
+    from core.retry import RetryPolicy, dead_letter_queue_name
+
+    await connect_to_mongo()
+    await connect_to_rabbitmq()
+    db = get_database()
+    rng = random.Random(args.seed)
+    run_id = uuid.uuid4().hex[:8]
+    queue_name = f"ai_splitter_bench_{run_id}"
+
+    group_id = ObjectId()
+    await db["groups"].insert_one({"_id": group_id, "name": f"bench-{run_id}", "members": MEMBERS, "created_by": MEMBERS[0]})
+    events = []
+    expenses = []
+    for n in range(args.messages):
+        expense = {
+            "_id": ObjectId(),
+            "group_id": group_id,
+            "amount": round(rng.uniform(5, 500), 2),
+            "paid_by": rng.choice(MEMBERS),
+            "participants": MEMBERS,
+            "description": _description(rng, args.ambiguous_ratio, run_id, n),
+            "split": {},
+            "created_at": datetime.utcnow(),
+        }
+        expenses.append(expense)
+        events.append({
+            "expense_id": str(expense["_id"]),
+            "group_id": str(group_id),
+            "amount": expense["amount"],
+            "paid_by": expense["paid_by"],
+            "participants": expense["participants"],
+            "description": expense["description"],
+        })
+    await db["expenses"].insert_many(expenses)
+
+    sent, done = {}, {}
+    finished = asyncio.Event()
+
+    async def handler(message: aio_pika.IncomingMessage):
+        await splitter.process_expense_created(message)
+        done[json.loads(message.body)["expense_id"]] = time.perf_counter()
+        if len(done) >= args.messages:
+            finished.set()
+
+    # Failed benchmark messages must not reach the real retry queues: no retries here,
+    # straight to a scratch dead-letter queue
+    splitter.retry_policy = RetryPolicy(queue_name, [], get_channel=lambda: rabbitmq.channel, service_name="AI Splitter")
+    # Likewise, their expense.split_changed events stay on the scratch exchange
+    splitter.EVENTS_EXCHANGE = BENCH_EXCHANGE
+
+    queue = None
+    try:
+        await splitter.retry_policy.declare()
+        queue, _ = await consume_messages(queue_name, handler, splitter.settings.PREFETCH_COUNT, exchange_name=BENCH_EXCHANGE)
+        exchange = await rabbitmq.channel.declare_exchange(BENCH_EXCHANGE, aio_pika.ExchangeType.TOPIC, durable=True)
+
+        with contextlib.ExitStack() as stack:
+            if args.quiet:
+                stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+            started = time.perf_counter()
+            for event in events:
+                sent[event["expense_id"]] = time.perf_counter()
+                await exchange.publish(
+                    aio_pika.Message(body=json.dumps(event).encode(), content_type="application/json", timestamp=datetime.now(timezone.utc)),
+                    routing_key="expense.created"
+                )
+                if args.rate:
+                    await asyncio.sleep(1 / args.rate)
+            try:
+                await asyncio.wait_for(finished.wait(), timeout=args.timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        latencies = [(done[i] - sent[i]) * 1000 for i in done]
+        elapsed = (max(done.values()) - started) if done else 0.0
+        print(f"engines:            {splitter.settings.SPLIT_ENGINES}")
+        print(f"messages:           {len(done)}/{args.messages} handled ({consumer_metrics.failed} failed)")
+        print(f"throughput:         {len(done) / elapsed if elapsed else 0.0:.1f} msg/s")
+        print(f"split latency p50:  {statistics.median(latencies) if latencies else 0.0:.1f} ms")
+        print(f"split latency p99:  {_percentile(latencies, 0.99):.1f} ms")
+        print(f"paths:              {json.dumps(dict(consumer_metrics.split_paths))}")
+        print(f"engine stats:       {json.dumps({e.name: e.stats() for e in splitter.engines if e.stats()})}")
+    finally:
+        if queue is not None:
+            await queue.delete(if_unused=False, if_empty=False)
+        await rabbitmq.channel.queue_delete(dead_letter_queue_name(queue_name))
+        await db["expenses"].delete_many({"group_id": group_id})
+        await db["groups"].delete_one({"_id": group_id})
+        await db[LEDGER_COLLECTION].delete_one({"_id": group_id})
+        await close_rabbitmq_connection()
+        close_mongo_connection()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=0, help="Publish rate in msg/s (0 = as fast as possible)")
+    parser.add_argument("--ambiguous-ratio", type=float, default=0.5, help="Share of expenses only a model can split")
+    parser.add_argument("--engines", help="Overrides SPLIT_ENGINES (default here: rule,cache,stub)")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--verbose", dest="quiet", action="store_false", help="Keep the consumer's per-message logs")
+    args = parser.parse_args()
+
+    if args.engines:
+        os.environ["SPLIT_ENGINES"] = args.engines
+    os.environ.setdefault("SPLIT_ENGINES", "rule,cache,stub")
+    asyncio.run(run(args))
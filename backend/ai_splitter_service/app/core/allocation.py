@@ -0,0 +1,113 @@
+from typing import Dict, List, Sequence
+import numpy as np
+
+# Exact split allocation in integer cents.
+#
+# Every split is built with the largest-remainder method: each participant first gets
+# floor(total * weight / sum(weights)) cents, then the cents left over go one each to
+# the largest remainders, ties going to the participant listed first. The parts always
+# add up to the total exactly.
+#
+# Weights are integers internally. Float weights (percentages, model amounts, cached
+# ratios) are scaled by WEIGHT_SCALE and rounded first, so the scalar and the NumPy
+# batch API give identical results for the same input.
+
+WEIGHT_SCALE = 10_000
+
+def to_cents(amount: float) -> int:
+    return int(round(amount * 100))
+
+def from_cents(cents: Dict[str, int]) -> Dict[str, float]:
+    return {p: c / 100 for p, c in cents.items()}
+
+def _integer_weights(weights: Sequence[float]) -> List[int]:
+    if all(isinstance(w, (int, np.integer)) for w in weights):
+        ints = [int(w) for w in weights]
+    else:
+        ints = [int(round(float(w) * WEIGHT_SCALE)) for w in weights]
+    if any(w < 0 for w in ints):
+        raise ValueError("Split weights must not be negative")
+    if not any(ints):
+        raise ValueError("At least one split weight must be positive")
+    return ints
+
+def allocate_cents(total_cents: int, weights: Sequence[float]) -> List[int]:
+    """Splits total_cents in proportion to weights; the result has the same order as weights."""
+    ints = _integer_weights(weights)
+    weight_sum = sum(ints)
+    shares = [total_cents * w // weight_sum for w in ints]
+    remainders = [total_cents * w % weight_sum for w in ints]
+    leftover = total_cents - sum(shares)
+    for i in sorted(range(len(ints)), key=lambda i: (-remainders[i], i))[:leftover]:
+        shares[i] += 1
+    return shares
+
+def weighted_split(amount: float, weights: Dict[str, float]) -> Dict[str, float]:
+    """Allocates amount over the participants of `weights` (in its key order)."""
+    if not weights:
+        return {}
+    if to_cents(amount) == 0:
+        return {p: 0.0 for p in weights}
+    return from_cents(dict(zip(weights, allocate_cents(to_cents(amount), list(weights.values())))))
+
+def equal_split(amount: float, participants: Sequence[str]) -> Dict[str, float]:
+    return weighted_split(amount, {p: 1 for p in participants})
+
+def percentage_split(amount: float, percentages: Dict[str, float]) -> Dict[str, float]:
+    if abs(sum(percentages.values()) - 100) > 1e-6:
+        raise ValueError("Percentages must add up to 100")
+    return weighted_split(amount, percentages)
+
+def shares_split(amount: float, shares: Dict[str, float]) -> Dict[str, float]:
+    return weighted_split(amount, shares)
+
+def allocate_batch(total_cents: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+    Vectorized allocate_cents for many expenses at once.
+
+    total_cents: shape (n,) integers. weights: shape (n, k); rows with fewer than k
+    participants are padded with zero weights, which never receive cents. Returns an
+    (n, k) int64 array whose rows sum exactly to total_cents.
+    """
+    total_cents = np.asarray(total_cents, dtype=np.int64)
+    weights = np.asarray(weights)
+    if np.issubdtype(weights.dtype, np.integer):
+        ints = weights.astype(np.int64)
+    else:
+        ints = np.rint(weights * WEIGHT_SCALE).astype(np.int64)
+    if (ints < 0).any():
+        raise ValueError("Split weights must not be negative")
+    weight_sums = ints.sum(axis=1)
+    if (weight_sums == 0).any():
+        raise ValueError("Every row needs at least one positive split weight")
+
+    numerators = total_cents[:, None] * ints
+    shares = numerators // weight_sums[:, None]
+    remainders = numerators % weight_sums[:, None]
+    leftover = total_cents - shares.sum(axis=1)
+
+    # Rank each row's remainders, largest first; the stable sort keeps ties in column order
+    order = np.argsort(-remainders, axis=1, kind="stable")
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(ints.shape[1])[None, :].repeat(len(ints), axis=0), axis=1)
+    return shares + (ranks < leftover[:, None])
+
+def equal_split_batch(expenses: List[dict]) -> List[Dict[str, float]]:
+    """Equal splits for many expenses (dicts with amount and participants) in one allocate_batch call."""
+    if not expenses:
+        return []
+    # A participant listed twice still gets one share, as in equal_split
+    participants = [list(dict.fromkeys(e["participants"])) for e in expenses]
+    width = max(len(p) for p in participants) or 1
+    weights = np.zeros((len(expenses), width), dtype=np.int64)
+    for row, names in enumerate(participants):
+        weights[row, :len(names)] = 1
+    # Expenses without participants get a dummy weight and an empty split below
+    empty = weights.sum(axis=1) == 0
+    weights[empty, 0] = 1
+    totals = np.array([to_cents(e["amount"]) for e in expenses], dtype=np.int64)
+    allocated = allocate_batch(totals, weights)
+    return [
+        {p: int(c) / 100 for p, c in zip(names, allocated[row])}
+        for row, names in enumerate(participants)
+    ]
@@ -0,0 +1,122 @@
+import asyncio
+from core.database import get_database
+from core.metrics import consumer_metrics
+from core.split_cache import split_cache
+
+class SplitBatcher:
+    """
+    Collects expenses that need the model for up to `max_items` items or `max_wait_ms`
+    and splits them with one `model.split_batch` call. Each entry of the batch answer is
+    validated on its own; entries that are missing or invalid (or the whole batch, if the
+    call fails) fall back to the per-expense `model.split_one`.
+
+    Every model call, batch or single, takes one slot of `llm_slots`.
+    """
+
+    def __init__(self, model, max_items: int, max_wait_ms: float, max_concurrent_calls: int):
+        self.model = model
+        self.max_items = max_items
+        self.max_wait = max_wait_ms / 1000
+        self.llm_slots = asyncio.Semaphore(max_concurrent_calls)
+        self._pending = [] # (expense_data, group_members, future)
+        self._timer = None
+        self._tasks = set()
+        self.batches = 0
+        self.batched_items = 0
+        self.batch_failures = 0
+        self.item_fallbacks = 0
+
+    async def _call(self, fn, *args):
+        async with self.llm_slots:
+            consumer_metrics.llm_in_flight += 1
+            try:
+                return await fn(*args)
+            finally:
+                consumer_metrics.llm_in_flight -= 1
+
+    async def submit(self, expense_data: dict, group_members: list) -> dict:
+        if self.max_items <= 1:
+            return await self._call(self.model.split_one, expense_data, group_members)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((expense_data, group_members, future))
+        if len(self._pending) >= self.max_items:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: list):
+        error = None
+        try:
+            await self._split_batch(batch)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            # Whatever went wrong (the model, its answer, the cache, metrics), no caller may
+            # be left waiting on its future
+            for _, _, future in batch:
+                if future.done():
+                    continue
+                if isinstance(error, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(error or RuntimeError("Split batch finished without an answer"))
+
+    async def _split_batch(self, batch: list):
+        answers = {}
+        if len(batch) > 1:
+            try:
+                answers = await self._call(self.model.split_batch, [expense_data for expense_data, _, _ in batch])
+                self.batches += 1
+                self.batched_items += len(batch)
+            except Exception as e:
+                self.batch_failures += 1
+                print(f"AI Splitter: batch of {len(batch)} failed, splitting individually: {e}")
+
+        fallbacks = []
+        for expense_data, group_members, future in batch:
+            split = self.model.validate(expense_data, answers.get(expense_data["expense_id"]))
+            if split is None:
+                fallbacks.append((expense_data, group_members, future))
+                continue
+            if not future.done():
+                future.set_result(split)
+            if self.model.cacheable:
+                await split_cache.put(get_database(), expense_data, split)
+
+        if len(batch) > 1:
+            self.item_fallbacks += len(fallbacks)
+        await asyncio.gather(*(self._split_one(*item) for item in fallbacks))
+
+    async def _split_one(self, expense_data: dict, group_members: list, future: asyncio.Future):
+        try:
+            split = await self._call(self.model.split_one, expense_data, group_members)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(split)
+
+    def stats(self) -> dict:
+        return {
+            "max_items": self.max_items,
+            "max_wait_ms": self.max_wait * 1000,
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "avg_batch_size": round(self.batched_items / self.batches, 2) if self.batches else 0.0,
+            "batch_failures": self.batch_failures,
+            "item_fallbacks": self.item_fallbacks,
+        }
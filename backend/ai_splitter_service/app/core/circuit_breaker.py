@@ -0,0 +1,99 @@
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the model while the breaker is open."""
+
+class CircuitBreaker:
+    """
+    Stops calling the model while it is failing or slow.
+
+    The outcomes of the last `window` calls are kept; a call counts as bad when it raised
+    or took longer than `slow_call_seconds`. Once at least `min_calls` outcomes are known
+    and the bad ratio reaches `failure_ratio`, the breaker opens and callers use the local
+    fallback for `open_seconds`. It then lets a single probe call through (half-open):
+    a good probe closes it, a bad one opens it again. Every allowed call must end in
+    record() or, when it produced no outcome, release(); call() does both.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, window: int, min_calls: int, failure_ratio: float, open_seconds: float, slow_call_seconds: float):
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.open_seconds = open_seconds
+        self.slow_call_seconds = slow_call_seconds
+        self.state = self.CLOSED
+        self._outcomes = deque(maxlen=window) # True = bad call
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.times_opened = 0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN and time.monotonic() >= self._opened_at + self.open_seconds:
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        self.rejected += 1
+        return False
+
+    def record(self, ok: bool, elapsed: float):
+        bad = not ok or elapsed > self.slow_call_seconds
+        if self.state == self.HALF_OPEN:
+            if bad:
+                self._open()
+            else:
+                self.state = self.CLOSED
+                self._outcomes.clear()
+                print("AI Splitter: circuit breaker closed, model calls resumed.")
+            return
+        self._outcomes.append(bad)
+        if len(self._outcomes) >= self.min_calls and sum(self._outcomes) / len(self._outcomes) >= self.failure_ratio:
+            self._open()
+
+    @asynccontextmanager
+    async def call(self):
+        """
+        Guards one call: raises CircuitOpenError when it is not allowed, otherwise records
+        the outcome of the block. A cancelled block records nothing but frees the probe.
+        """
+        if not self.allow():
+            raise CircuitOpenError()
+        started = time.monotonic()
+        try:
+            yield
+        except Exception:
+            self.record(False, time.monotonic() - started)
+            raise
+        except BaseException:
+            self.release()
+            raise
+        self.record(True, time.monotonic() - started)
+
+    def release(self):
+        """For a call that ended without an outcome (e.g. cancelled): frees the probe slot."""
+        if self.state == self.HALF_OPEN:
+            self._probe_in_flight = False
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.times_opened += 1
+        print(f"AI Splitter: circuit breaker open, using equal splits for {self.open_seconds}s.")
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "recent_bad_ratio": round(sum(self._outcomes) / len(self._outcomes), 3) if self._outcomes else 0.0,
+            "times_opened": self.times_opened,
+            "rejected_calls": self.rejected,
+        }
@@ -0,0 +1,162 @@
+import asyncio
+import math
+import random
+from typing import Dict, List, Optional, Tuple
+from core.allocation import equal_split, equal_split_batch
+from core.batcher import SplitBatcher
+from core.config import settings
+from core.database import get_database
+from core.split_cache import split_cache
+from core.split_rules import rule_split
+
+# Split engines, tried in the order given by SPLIT_ENGINES (e.g. "rule,cache,gemini").
+#
+# Each engine returns (path, split) or None to hand the expense to the next one; the
+# path is what the consumer logs and counts ("rule:equal", "cache", "llm", ...).
+# Model engines (gemini, stub) always answer and are micro-batched through SplitBatcher,
+# so one of them should come last. The stub engine needs no network and has tunable
+# latency and error rate, for load tests and benchmarks.
+
+class SplitEngine:
+    name = "engine"
+
+    async def split(self, expense_data: dict, group_members: list) -> Optional[Tuple[str, Dict[str, float]]]:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+class RuleEngine(SplitEngine):
+    name = "rule"
+
+    async def split(self, expense_data: dict, group_members: list):
+        ruled = rule_split(expense_data)
+        return (f"rule:{ruled[0]}", ruled[1]) if ruled is not None else None
+
+class CachedEngine(SplitEngine):
+    name = "cache"
+
+    async def split(self, expense_data: dict, group_members: list):
+        cached = await split_cache.get(get_database(), expense_data)
+        return ("cache", cached) if cached is not None else None
+
+    def stats(self) -> dict:
+        return split_cache.stats()
+
+class ModelEngine(SplitEngine):
+    """
+    Base for engines backed by a model. Subclasses implement split_one, split_batch and
+    validate; requests go through a SplitBatcher that batches them and caps concurrency.
+    """
+    path = "llm"
+    # Whether validated batch answers may be stored in the split cache
+    cacheable = True
+
+    def __init__(self):
+        self.batcher = SplitBatcher(
+            self,
+            max_items=settings.SPLIT_BATCH_MAX_ITEMS,
+            max_wait_ms=settings.SPLIT_BATCH_MAX_WAIT_MS,
+            max_concurrent_calls=settings.MAX_CONCURRENT_LLM_CALLS,
+        )
+
+    async def split(self, expense_data: dict, group_members: list):
+        return self.path, await self.batcher.submit(expense_data, group_members)
+
+    async def split_one(self, expense_data: dict, group_members: list) -> Dict[str, float]:
+        raise NotImplementedError
+
+    async def split_batch(self, expenses: List[dict]) -> dict:
+        raise NotImplementedError
+
+    def validate(self, expense_data: dict, suggestion) -> Optional[Dict[str, float]]:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {"batcher": self.batcher.stats()}
+
+class GeminiEngine(ModelEngine):
+    name = "gemini"
+
+    def __init__(self):
+        super().__init__()
+        # Imported here so configurations without Gemini never load the SDK
+        from core import gemini_ai
+        self._gemini = gemini_ai
+
+    async def split_one(self, expense_data: dict, group_members: list):
+        return await self._gemini.get_smart_split(expense_data, group_members)
+
+    async def split_batch(self, expenses: List[dict]) -> dict:
+        return await self._gemini.get_smart_splits_batch(expenses)
+
+    def validate(self, expense_data: dict, suggestion):
+        return self._gemini.validate_split(expense_data, suggestion)
+
+    def stats(self) -> dict:
+        return {**super().stats(), **self._gemini.llm_metrics()}
+
+class StubModelError(Exception):
+    """Simulated model failure."""
+
+class StubEngine(ModelEngine):
+    """
+    Offline stand-in for the model: sleeps for a log-normal latency (median
+    STUB_LATENCY_MS, spread STUB_LATENCY_SIGMA) per call, fails with probability
+    STUB_ERROR_RATE, and otherwise returns an equal split.
+    """
+    name = "stub"
+    path = "stub"
+    cacheable = False
+
+    def __init__(self, latency_ms: float, sigma: float, error_rate: float, seed: Optional[int] = None):
+        super().__init__()
+        self.latency_ms = latency_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self.calls = 0
+        self.errors = 0
+
+    async def _call(self):
+        self.calls += 1
+        await asyncio.sleep(self._random.lognormvariate(math.log(max(self.latency_ms, 0.001)), self.sigma) / 1000)
+        if self._random.random() < self.error_rate:
+            self.errors += 1
+            raise StubModelError("simulated model error")
+
+    async def split_one(self, expense_data: dict, group_members: list):
+        await self._call()
+        return equal_split(expense_data["amount"], expense_data["participants"])
+
+    async def split_batch(self, expenses: List[dict]) -> dict:
+        await self._call()
+        return {e["expense_id"]: split for e, split in zip(expenses, equal_split_batch(expenses))}
+
+    def validate(self, expense_data: dict, suggestion):
+        return suggestion if isinstance(suggestion, dict) else None
+
+    def stats(self) -> dict:
+        return {**super().stats(), "calls": self.calls, "errors": self.errors}
+
+def build_engines(spec: str) -> List[SplitEngine]:
+    factories = {
+        "rule": RuleEngine,
+        "cache": CachedEngine,
+        "gemini": GeminiEngine,
+        "stub": lambda: StubEngine(settings.STUB_LATENCY_MS, settings.STUB_LATENCY_SIGMA, settings.STUB_ERROR_RATE),
+    }
+    names = [n.strip() for n in spec.split(",") if n.strip()]
+    unknown = [n for n in names if n not in factories]
+    if unknown or not names:
+        raise ValueError(f"Unknown SPLIT_ENGINES entries {unknown}; choose from {', '.join(factories)}")
+    if names[-1] not in ("gemini", "stub"):
+        raise ValueError("SPLIT_ENGINES must end with a model engine (gemini or stub)")
+    return [factories[n]() for n in names]
+
+async def split_expense(engines: List[SplitEngine], expense_data: dict, group_members: list) -> Tuple[str, Dict[str, float]]:
+    for engine in engines:
+        result = await engine.split(expense_data, group_members)
+        if result is not None:
+            return result
+    raise RuntimeError("No split engine produced a split")
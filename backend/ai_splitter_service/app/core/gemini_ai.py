@@ -1,111 +1,146 @@
+import asyncio
+from collections import Counter
 import google.generativeai as genai
+from core import allocation
+from core.circuit_breaker import CircuitBreaker, CircuitOpenError
 from core.config import settings
+from core.database import get_database
+from core.prompts import PromptTooLarge, batch_prompt, single_prompt, token_usage
+from core.split_cache import split_cache
 import json
 import re
 
 genai.configure(api_key=settings.GEMINI_API_KEY)
 
+# One client for the whole process; it is safe to share across concurrent calls
+model = genai.GenerativeModel('gemini-pro')
+
+breaker = CircuitBreaker(
+    window=settings.BREAKER_WINDOW,
+    min_calls=settings.BREAKER_MIN_CALLS,
+    failure_ratio=settings.BREAKER_FAILURE_RATIO,
+    open_seconds=settings.BREAKER_OPEN_SECONDS,
+    slow_call_seconds=settings.LLM_SLOW_CALL_SECONDS,
+)
+
+llm_calls = 0
+fallbacks = Counter() # reason -> equal splits returned instead of a model split
+
+async def _generate(prompt: str, estimated_tokens: int, expenses: int = 1) -> str:
+    """One model call with a deadline, recorded by the circuit breaker and token_usage."""
+    global llm_calls
+    async with breaker.call():
+        llm_calls += 1
+        response = await asyncio.wait_for(model.generate_content_async(prompt), timeout=settings.LLM_TIMEOUT_SECONDS)
+        text = response.text
+    token_usage.record(estimated_tokens, getattr(response, "usage_metadata", None), expenses)
+    return text
+
+def equal_split(expense_data: dict) -> dict:
+    # No participants, no split
+    return allocation.equal_split(expense_data['amount'], expense_data['participants'])
+
+def _fallback(expense_data: dict, reason: str) -> dict:
+    fallbacks[reason] += 1
+    return equal_split(expense_data)
+
+def llm_metrics() -> dict:
+    requested = llm_calls + breaker.rejected
+    total_fallbacks = sum(fallbacks.values())
+    return {
+        "calls": llm_calls,
+        "fallbacks": dict(fallbacks),
+        "fallback_rate": round(total_fallbacks / requested, 4) if requested else 0.0,
+        "breaker": breaker.stats(),
+        "tokens": token_usage.stats(),
+    }
+
 async def get_smart_split(expense_data: dict, group_members: list) -> dict:
-    model = genai.GenerativeModel('gemini-pro')
-
-    prompt = f"""
-    You are an intelligent expense splitter. Your task is to suggest a fair split of an expense among participants.
-    
-    Expense Details:
-    Description: {expense_data['description']}
-    Total Amount: {expense_data['amount']}
-    Paid By: {expense_data['paid_by']}
-    Participants (who benefited from/are part of this expense): {', '.join(expense_data['participants'])}
-    All available group members (for context, participants are a subset): {', '.join(group_members)}
-
-    Provide a dictionary where keys are participant usernames and values are the amounts they owe or are responsible for, rounding to 2 decimal places. The sum of the split amounts MUST equal the total amount.
-    
-    Example Output:
-    {{
-      "john": 10.50,
-      "alice": 10.50,
-      "bob": 21.00
-    }}
-
-    Consider common sense splits:
-    - If no specific instructions, split equally among participants.
-    - If the description implies one person took more/less, suggest a reasonable unequal split.
-    - If someone is explicitly excluded or didn't participate, they should not be in the split.
-
-    Provide only the JSON dictionary as output, no extra text or explanation.
-    """
-    
+    # group_members is not sent: the split only involves participants (core/prompts.py)
     try:
-        response = model.generate_content(prompt)
-        # Attempt to extract JSON from potentially wrapped response
-        response_text = response.text.strip()
-        
-        # Regex to find JSON object, even if it's wrapped in markdown or other text
-        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-        
-        if json_match:
-            json_str = json_match.group(0)
-            split_suggestion = json.loads(json_str)
-
-            # Basic validation of the split
-            total_suggested = sum(split_suggestion.values())
-            if abs(total_suggested - expense_data['amount']) > 0.02: # Allow for slight float discrepancies
-                print(f"Warning: AI suggested split total ({total_suggested}) does not match expense amount ({expense_data['amount']}). Adjusting to proportional split.")
-                # Fallback to equal split if AI's sum is too far off
-                num_participants = len(expense_data['participants'])
-                if num_participants > 0:
-                    equal_share = round(expense_data['amount'] / num_participants, 2)
-                    adjusted_split = {p: equal_share for p in expense_data['participants']}
-                    # Adjust last participant for perfect sum
-                    if adjusted_split:
-                        last_participant = expense_data['participants'][-1]
-                        adjusted_split[last_participant] += expense_data['amount'] - sum(adjusted_split.values())
-                        adjusted_split[last_participant] = round(adjusted_split[last_participant], 2)
-                    return adjusted_split
-                else:
-                    return {} # No participants, no split
-
-            # Ensure all suggested participants are actual participants and filter out others
-            final_split = {p: round(split_suggestion.get(p, 0.0), 2) for p in expense_data['participants']}
-            
-            # Recalculate sum to ensure it matches exactly due to rounding
-            current_sum = sum(final_split.values())
-            if abs(current_sum - expense_data['amount']) > 0.01:
-                # Distribute the small difference to one participant
-                if final_split:
-                    diff = expense_data['amount'] - current_sum
-                    first_participant = list(final_split.keys())[0]
-                    final_split[first_participant] += diff
-                    final_split[first_participant] = round(final_split[first_participant], 2)
-
-            return final_split
-
-        else:
-            print(f"Error: Could not extract JSON from AI response: {response_text}")
-            # Fallback to equal split if AI response is unparseable
-            num_participants = len(expense_data['participants'])
-            if num_participants > 0:
-                equal_share = round(expense_data['amount'] / num_participants, 2)
-                adjusted_split = {p: equal_share for p in expense_data['participants']}
-                if adjusted_split:
-                    last_participant = expense_data['participants'][-1]
-                    adjusted_split[last_participant] += expense_data['amount'] - sum(adjusted_split.values())
-                    adjusted_split[last_participant] = round(adjusted_split[last_participant], 2)
-                return adjusted_split
-            else:
-                return {}
+        prompt, estimated_tokens = single_prompt(expense_data)
+    except PromptTooLarge as e:
+        print(f"Warning: prompt for expense {expense_data['expense_id']} is over budget ({e}). Falling back to equal split.")
+        return _fallback(expense_data, "over_budget")
 
+    try:
+        response_text = (await _generate(prompt, estimated_tokens)).strip()
+    except CircuitOpenError:
+        return _fallback(expense_data, "breaker_open")
+    except asyncio.TimeoutError:
+        print(f"Error: Gemini call exceeded {settings.LLM_TIMEOUT_SECONDS}s deadline.")
+        return _fallback(expense_data, "timeout")
     except Exception as e:
-        print(f"Error calling Gemini API or parsing response: {e}")
-        # Fallback to equal split on error
-        num_participants = len(expense_data['participants'])
-        if num_participants > 0:
-            equal_share = round(expense_data['amount'] / num_participants, 2)
-            adjusted_split = {p: equal_share for p in expense_data['participants']}
-            if adjusted_split:
-                last_participant = expense_data['participants'][-1]
-                adjusted_split[last_participant] += expense_data['amount'] - sum(adjusted_split.values())
-                adjusted_split[last_participant] = round(adjusted_split[last_participant], 2)
-            return adjusted_split
-        else:
-            return {}
\ No newline at end of file
+        print(f"Error calling Gemini API: {e}")
+        return _fallback(expense_data, "error")
+
+    # Regex to find JSON object, even if it's wrapped in markdown or other text
+    json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+    if not json_match:
+        print(f"Error: Could not extract JSON from AI response: {response_text}")
+        return _fallback(expense_data, "unparseable")
+
+    try:
+        split_suggestion = json.loads(json_match.group(0))
+        # Basic validation of the split
+        total_suggested = sum(split_suggestion.values())
+    except (ValueError, TypeError, AttributeError) as e:
+        print(f"Error parsing AI response: {e}")
+        return _fallback(expense_data, "unparseable")
+
+    if abs(total_suggested - expense_data['amount']) > 0.02: # Allow for slight float discrepancies
+        print(f"Warning: AI suggested split total ({total_suggested}) does not match expense amount ({expense_data['amount']}). Falling back to equal split.")
+        return _fallback(expense_data, "invalid_total")
+
+    # Ensure all suggested participants are actual participants and filter out others,
+    # then re-allocate the suggested amounts in exact cents
+    try:
+        final_split = allocation.weighted_split(
+            expense_data['amount'], {p: float(split_suggestion.get(p, 0.0)) for p in expense_data['participants']}
+        )
+    except (TypeError, ValueError) as e:
+        print(f"Warning: AI suggested split is unusable ({e}). Falling back to equal split.")
+        return _fallback(expense_data, "invalid_total")
+
+    # Only model-produced splits are cached (main.py looks them up before calling us)
+    await split_cache.put(get_database(), expense_data, final_split)
+    return final_split
+
+def validate_split(expense_data: dict, suggestion) -> dict:
+    """
+    Checks a model-suggested split against the expense and re-allocates it in exact cents.
+    Returns None if it names non-participants, has invalid or negative amounts, or does
+    not add up to the expense amount.
+    """
+    participants = expense_data['participants']
+    if not isinstance(suggestion, dict) or set(suggestion) - set(participants):
+        return None
+    try:
+        values = {p: float(suggestion.get(p, 0.0)) for p in participants}
+    except (TypeError, ValueError):
+        return None
+    if any(v < 0 for v in values.values()) or abs(sum(values.values()) - expense_data['amount']) > 0.02:
+        return None
+
+    if not any(values.values()):
+        return allocation.from_cents({p: 0 for p in participants}) if allocation.to_cents(expense_data['amount']) == 0 else None
+    return allocation.weighted_split(expense_data['amount'], values)
+
+async def get_smart_splits_batch(expenses: list) -> dict:
+    """
+    Asks the model to split several expenses in one call.
+    Returns the raw JSON object keyed by expense_id; callers validate each entry with
+    validate_split. Expenses that did not fit the token budget are left out of the call
+    and so missing from the result. Raises on API errors or unparseable output.
+    """
+    prompt, estimated_tokens, included = batch_prompt(expenses)
+    if not included:
+        return {}
+    response_text = (await _generate(prompt, estimated_tokens, len(included))).strip()
+    json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+    if not json_match:
+        raise ValueError(f"Could not extract JSON from AI batch response: {response_text}")
+    result = json.loads(json_match.group(0))
+    if not isinstance(result, dict):
+        raise ValueError("AI batch response is not a JSON object")
+    return result
@@ -0,0 +1,73 @@
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+
+class ConsumerMetrics:
+    """
+    Counters for the expense_created consumer, logged periodically by main.py.
+
+    Queue lag is the time between the expense service publishing an event (the message
+    timestamp) and this worker starting on it.
+    """
+
+    def __init__(self):
+        self.received = 0
+        self.processed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.llm_in_flight = 0
+        # How each split was produced: rule:<name>, cache or llm
+        self.split_paths = Counter()
+        self._lags_ms = deque(maxlen=2048)
+        self._durations_ms = deque(maxlen=2048)
+        self._last_report = time.monotonic()
+        self._last_done = 0
+
+    def message_started(self, message) -> float:
+        self.received += 1
+        self.in_flight += 1
+        if message.timestamp is not None:
+            published = message.timestamp
+            if published.tzinfo is None:
+                published = published.replace(tzinfo=timezone.utc)
+            self._lags_ms.append(max(0.0, (datetime.now(timezone.utc) - published).total_seconds() * 1000))
+        return time.monotonic()
+
+    def message_finished(self, started: float, ok: bool):
+        self.in_flight -= 1
+        if ok:
+            self.processed += 1
+        else:
+            self.failed += 1
+        self._durations_ms.append((time.monotonic() - started) * 1000)
+
+    def record_path(self, path: str):
+        self.split_paths[path] += 1
+
+    def snapshot(self, queue_depth: int = None) -> dict:
+        now = time.monotonic()
+        done = self.processed + self.failed
+        elapsed = now - self._last_report
+        throughput = (done - self._last_done) / elapsed if elapsed > 0 else 0.0
+        self._last_report, self._last_done = now, done
+
+        def percentile(samples, q: float) -> float:
+            ordered = sorted(samples)
+            return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1) if ordered else 0.0
+
+        return {
+            "received": self.received,
+            "processed": self.processed,
+            "failed": self.failed,
+            "in_flight": self.in_flight,
+            "llm_in_flight": self.llm_in_flight,
+            "throughput_per_s": round(throughput, 2),
+            "queue_lag_ms_p50": percentile(self._lags_ms, 0.50),
+            "queue_lag_ms_p99": percentile(self._lags_ms, 0.99),
+            "processing_ms_p50": percentile(self._durations_ms, 0.50),
+            "processing_ms_p99": percentile(self._durations_ms, 0.99),
+            "queue_depth": queue_depth,
+            "split_paths": dict(self.split_paths),
+        }
+
+consumer_metrics = ConsumerMetrics()
@@ -0,0 +1,147 @@
+import json
+import math
+from collections import deque
+from typing import List, Optional, Tuple
+from core.config import settings
+
+# Prompt construction for the Gemini splitter.
+#
+# A prompt is a fixed instruction prefix followed by the expense data. The prefix is
+# built once at import and never varies, so it costs nothing per call and stays
+# byte-identical across calls. The expense part only carries what the split depends on:
+# the participants (not every group member, which made prompts grow with group size)
+# and a description truncated to PROMPT_MAX_DESCRIPTION_CHARS.
+#
+# Every prompt is checked against LLM_PROMPT_TOKEN_BUDGET before it is sent. Tokens are
+# estimated locally (about 4 characters per token, rounded up) to avoid a count_tokens
+# round-trip; the real prompt and output token counts reported by the API are recorded
+# in `token_usage` next to the estimates.
+
+CHARS_PER_TOKEN = 4
+
+SINGLE_PREFIX = """You are an intelligent expense splitter. Suggest a fair split of one expense among its participants.
+
+Return a JSON object whose keys are participant usernames and whose values are the amounts they owe, rounded to 2 decimal places. The amounts MUST sum to the total amount. Only use the listed participants.
+If the description gives no specific instructions, split equally. If it implies someone took more or less, or did not take part, reflect that.
+Example: {"john": 10.50, "alice": 10.50, "bob": 21.00}
+Provide only the JSON object, no extra text or explanation.
+
+"""
+
+BATCH_PREFIX = """You are an intelligent expense splitter. Suggest a fair split for each of the expenses below.
+
+For each expense, split its amount among its participants only, rounded to 2 decimal places. The amounts of each split MUST sum to that expense's amount.
+If the description gives no specific instructions, split equally. If it implies someone took more or less, or did not take part, reflect that.
+Return one JSON object mapping each expense_id to its split, for example:
+{"65f0c0ffee0000000000000a": {"john": 10.50, "alice": 10.50}, "65f0c0ffee0000000000000b": {"bob": 30.00}}
+Provide only the JSON object, no extra text or explanation.
+
+Expenses (one JSON object per line):
+"""
+
+class PromptTooLarge(Exception):
+    """The prompt for an expense would exceed LLM_PROMPT_TOKEN_BUDGET."""
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+SINGLE_PREFIX_TOKENS = estimate_tokens(SINGLE_PREFIX)
+BATCH_PREFIX_TOKENS = estimate_tokens(BATCH_PREFIX)
+
+def truncate_description(description: str) -> str:
+    description = " ".join((description or "").split())
+    limit = settings.PROMPT_MAX_DESCRIPTION_CHARS
+    if len(description) <= limit:
+        return description
+    token_usage.truncated_descriptions += 1
+    return description[:max(limit - 3, 0)].rstrip() + "..."
+
+def _expense_item(expense_data: dict) -> dict:
+    return {
+        "expense_id": expense_data["expense_id"],
+        "description": truncate_description(expense_data["description"]),
+        "amount": expense_data["amount"],
+        "paid_by": expense_data["paid_by"],
+        "participants": expense_data["participants"],
+    }
+
+def single_prompt(expense_data: dict) -> Tuple[str, int]:
+    """Prompt for one expense and its estimated token count; raises PromptTooLarge."""
+    body = (
+        f"Description: {truncate_description(expense_data['description'])}\n"
+        f"Total amount: {expense_data['amount']}\n"
+        f"Paid by: {expense_data['paid_by']}\n"
+        f"Participants: {', '.join(expense_data['participants'])}\n"
+    )
+    tokens = SINGLE_PREFIX_TOKENS + estimate_tokens(body)
+    if tokens > settings.LLM_PROMPT_TOKEN_BUDGET:
+        token_usage.over_budget += 1
+        raise PromptTooLarge(f"{tokens} estimated prompt tokens, budget {settings.LLM_PROMPT_TOKEN_BUDGET}")
+    return SINGLE_PREFIX + body, tokens
+
+def batch_prompt(expenses: List[dict]) -> Tuple[str, int, List[str]]:
+    """
+    Prompt for as many of `expenses` as fit the token budget, in order. Returns the
+    prompt, its estimated token count and the ids it covers; expenses left out are
+    simply missing from the answer, so the batcher splits them individually.
+    """
+    lines, included = [], []
+    tokens = BATCH_PREFIX_TOKENS
+    for expense_data in expenses:
+        line = json.dumps(_expense_item(expense_data), separators=(",", ":")) + "\n"
+        line_tokens = estimate_tokens(line)
+        if tokens + line_tokens > settings.LLM_PROMPT_TOKEN_BUDGET:
+            token_usage.left_out_of_batch += 1
+            continue
+        lines.append(line)
+        included.append(expense_data["expense_id"])
+        tokens += line_tokens
+    return BATCH_PREFIX + "".join(lines), tokens, included
+
+class TokenUsage:
+    """Prompt and output token counters for model calls, reported in llm_metrics()."""
+
+    def __init__(self):
+        self.calls = 0
+        self.expenses = 0
+        self.estimated_prompt_tokens = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.over_budget = 0
+        self.left_out_of_batch = 0
+        self.truncated_descriptions = 0
+        # Prompt tokens per expense of recent calls (a batch call's tokens are shared evenly)
+        self._per_expense = deque(maxlen=2048)
+
+    def record(self, estimated: int, usage_metadata: Optional[object], expenses: int):
+        self.calls += 1
+        self.expenses += expenses
+        self.estimated_prompt_tokens += estimated
+        prompt_tokens = getattr(usage_metadata, "prompt_token_count", 0) or estimated
+        self.prompt_tokens += prompt_tokens
+        self.output_tokens += getattr(usage_metadata, "candidates_token_count", 0) or 0
+        per_expense = prompt_tokens / max(expenses, 1)
+        self._per_expense.extend([per_expense] * max(expenses, 1))
+
+    def stats(self) -> dict:
+        ordered = sorted(self._per_expense)
+
+        def percentile(q: float) -> float:
+            return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1) if ordered else 0.0
+
+        return {
+            "budget": settings.LLM_PROMPT_TOKEN_BUDGET,
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "estimated_prompt_tokens": self.estimated_prompt_tokens,
+            "output_tokens": self.output_tokens,
+            "prompt_tokens_per_expense_avg": round(self.prompt_tokens / self.expenses, 1) if self.expenses else 0.0,
+            "prompt_tokens_per_expense_p50": percentile(0.50),
+            "prompt_tokens_per_expense_p99": percentile(0.99),
+            "output_tokens_per_expense_avg": round(self.output_tokens / self.expenses, 1) if self.expenses else 0.0,
+            "over_budget": self.over_budget,
+            "left_out_of_batch": self.left_out_of_batch,
+            "truncated_descriptions": self.truncated_descriptions,
+        }
+
+token_usage = TokenUsage()
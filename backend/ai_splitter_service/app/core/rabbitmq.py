@@ -1,9 +1,13 @@
+import json
+from datetime import datetime, timezone
 import aio_pika
-import asyncio
 from core.config import settings
 
+QUEUE_NAME = "ai_splitter_queue"
+
 connection = None
 channel = None
+_exchanges = {} # name -> declared exchange, for publishing
 
 async def connect_to_rabbitmq():
     global connection, channel
@@ -18,21 +22,52 @@ async def connect_to_rabbitmq():
 
 async def close_rabbitmq_connection():
     global connection
+    _exchanges.clear()
     if connection:
         await connection.close()
         print("AI Splitter Service: RabbitMQ connection closed.")
 
-async def consume_messages(queue_name: str, callback):
+async def consume_messages(queue_name: str, callback, prefetch_count: int, exchange_name: str = "expense_events"):
+    """
+    Starts consuming `queue_name` and returns (queue, consumer_tag), or None without a channel.
+
+    The broker keeps at most `prefetch_count` unacked messages on this channel; aio-pika
+    runs the callback for each delivered message concurrently, so prefetch_count is also
+    the number of messages being worked on at once.
+    """
     global channel
     if not channel:
         print("RabbitMQ channel not available for consumption.")
-        return
+        return None
+
+    await channel.set_qos(prefetch_count=prefetch_count)
 
     # Ensure exchange and queue are declared (idempotent operations)
-    exchange = await channel.declare_exchange("expense_events", aio_pika.ExchangeType.TOPIC, durable=True)
+    exchange = await channel.declare_exchange(exchange_name, aio_pika.ExchangeType.TOPIC, durable=True)
     queue = await channel.declare_queue(queue_name, durable=True)
     await queue.bind(exchange, "expense.created") # Bind to the specific routing key
 
-    print(f"AI Splitter Service: Consuming from queue: {queue_name}")
-    await queue.consume(callback)
-    await asyncio.Future() # Run forever
\ No newline at end of file
+    print(f"AI Splitter Service: Consuming from queue: {queue_name} (prefetch {prefetch_count})")
+    consumer_tag = await queue.consume(callback)
+    return queue, consumer_tag
+
+async def queue_depth(queue_name: str) -> int:
+    """Messages ready in the queue (not counting ones already delivered to consumers)."""
+    queue = await channel.declare_queue(queue_name, durable=True)
+    return queue.declaration_result.message_count
+
+async def publish_event(exchange_name: str, routing_key: str, event: dict):
+    """Publishes a persistent JSON event; returns once the broker has confirmed it."""
+    exchange = _exchanges.get(exchange_name)
+    if exchange is None:
+        exchange = await channel.declare_exchange(exchange_name, aio_pika.ExchangeType.TOPIC, durable=True)
+        _exchanges[exchange_name] = exchange
+    await exchange.publish(
+        aio_pika.Message(
+            body=json.dumps(event).encode(),
+            content_type="application/json",
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+            timestamp=datetime.now(timezone.utc)
+        ),
+        routing_key=routing_key
+    )
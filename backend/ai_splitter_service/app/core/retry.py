@@ -0,0 +1,15 @@
+from core import rabbitmq
+from core.config import settings
+from splitwise_common.retry import (  # noqa: F401 (re-exported)
+    ATTEMPT_HEADER, PermanentFailure, RetryPolicy, backoff_delays, dead_letter_queue_name, retry_queue_name,
+)
+
+# Retry and dead-letter topology of the splitter's queue (splitwise_common/retry.py).
+
+def default_policy(queue_name: str) -> RetryPolicy:
+    return RetryPolicy(
+        queue_name,
+        backoff_delays(settings.RETRY_BASE_DELAY_SECONDS, settings.RETRY_BACKOFF_FACTOR, settings.MAX_DELIVERY_ATTEMPTS),
+        get_channel=lambda: rabbitmq.channel,
+        service_name="AI Splitter",
+    )
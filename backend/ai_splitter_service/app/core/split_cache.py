@@ -0,0 +1,139 @@
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure, PyMongoError
+from core.allocation import weighted_split
+from core.config import settings
+
+# Cache of LLM split results, stored as ratios of the amount so a repeated expense
+# ("Rent", "Netflix") with a different amount can reuse them.
+#
+# Two tiers, both expiring after SPLIT_CACHE_TTL_SECONDS:
+#   - an in-process LRU
+#   - the `split_cache` Mongo collection (TTL index), shared by all splitter instances
+#
+# Only splits the model actually produced are cached, never the equal-split fallback.
+
+SPLIT_CACHE_COLLECTION = "split_cache"
+
+_NON_WORD = re.compile(r"[^\w%]+")
+
+def normalize_description(description: str) -> str:
+    return _NON_WORD.sub(" ", (description or "").lower()).strip()
+
+def cache_key(description: str, participants: List[str]) -> str:
+    raw = normalize_description(description) + "\x00" + "\x00".join(sorted(set(participants)))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+def to_ratios(split: Dict[str, float], amount: float) -> Dict[str, float]:
+    return {p: share / amount for p, share in split.items()}
+
+def scale_ratios(ratios: Dict[str, float], amount: float) -> Dict[str, float]:
+    """Applies cached ratios to a new amount, allocated in exact cents."""
+    return weighted_split(amount, ratios)
+
+class SplitCache:
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.memory_hits = 0
+        self.mongo_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.errors = 0
+
+    def _remember(self, key: str, ratios: Dict[str, float], expires_at: float):
+        self._entries[key] = (expires_at, ratios)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get(self, db, expense_data: dict) -> Optional[Dict[str, float]]:
+        """Cached split for the expense scaled to its amount, or None."""
+        amount = expense_data.get("amount") or 0
+        if amount <= 0:
+            return None
+        key = cache_key(expense_data.get("description"), expense_data.get("participants", []))
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, ratios = entry
+            if expires_at >= time.monotonic():
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return scale_ratios(ratios, amount)
+            del self._entries[key]
+
+        try:
+            # The TTL monitor only runs once a minute, so check the age here as well
+            doc = await db[SPLIT_CACHE_COLLECTION].find_one({
+                "_id": key,
+                "created_at": {"$gt": datetime.utcnow() - timedelta(seconds=self.ttl_seconds)}
+            })
+        except PyMongoError as e:
+            self.errors += 1
+            print(f"AI Splitter: split cache lookup failed: {e}")
+            doc = None
+        if doc is None:
+            self.misses += 1
+            return None
+
+        ratios = {p: ratio for p, ratio in doc["ratios"]}
+        remaining = self.ttl_seconds - (datetime.utcnow() - doc["created_at"]).total_seconds()
+        self._remember(key, ratios, time.monotonic() + remaining)
+        self.mongo_hits += 1
+        return scale_ratios(ratios, amount)
+
+    async def put(self, db, expense_data: dict, split: Dict[str, float]):
+        amount = expense_data.get("amount") or 0
+        if amount <= 0 or not split:
+            return
+        key = cache_key(expense_data.get("description"), expense_data.get("participants", []))
+        ratios = to_ratios(split, amount)
+        self._remember(key, ratios, time.monotonic() + self.ttl_seconds)
+        try:
+            # Usernames may contain '.', so ratios are stored as pairs rather than a sub-document
+            await db[SPLIT_CACHE_COLLECTION].replace_one(
+                {"_id": key},
+                {"ratios": [[p, r] for p, r in ratios.items()], "created_at": datetime.utcnow()},
+                upsert=True
+            )
+            self.stores += 1
+        except PyMongoError as e:
+            self.errors += 1
+            print(f"AI Splitter: split cache store failed: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.mongo_hits + self.misses
+        hits = self.memory_hits + self.mongo_hits
+        return {
+            "size": len(self._entries),
+            "memory_hits": self.memory_hits,
+            "mongo_hits": self.mongo_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "errors": self.errors,
+        }
+
+split_cache = SplitCache(
+    max_entries=settings.SPLIT_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.SPLIT_CACHE_TTL_SECONDS,
+)
+
+async def ensure_split_cache_indexes(db):
+    try:
+        await db[SPLIT_CACHE_COLLECTION].create_indexes([
+            IndexModel([("created_at", 1)], name="created_at_ttl", expireAfterSeconds=int(settings.SPLIT_CACHE_TTL_SECONDS))
+        ])
+    except OperationFailure as e:
+        # An existing index with a different TTL needs collMod; keep running with it
+        print(f"AI Splitter: could not create split cache TTL index: {e}")
@@ -0,0 +1,100 @@
+import re
+from typing import Dict, List, Optional, Tuple
+from core.allocation import allocate_cents, to_cents
+
+# Deterministic split rules tried before the model. Each recognises one kind of
+# instruction in the expense description:
+#
+#   equal    "Groceries"                          no hints at all
+#   except   "Dinner except bob", "bob didn't"    equal among the rest
+#   percent  "alice 60%", "30% for bob"           unnamed participants share the remainder
+#   shares   "2x for alice", "bob x3"             unnamed participants count as 1 share
+#   exact    "alice 12.50", "$20 for bob"         unnamed participants share the remainder
+#
+# Anything that mixes kinds, names a participant without an instruction, or still
+# contains a hint word ("half", "more", ...) after the recognised parts are removed
+# is ambiguous: rule_split returns None and the expense goes to the LLM.
+
+AMBIGUITY_HINTS = re.compile(
+    r"\b(more|less|half|double|twice|triple|extra|only|didn'?t|did not|not|except|excluding|without|minus"
+    r"|shares?|covers?|covering|treat(?:ed|ing)?|owes?|pays?|paid)\b|%|\d\s*x\b|\bx\s*\d"
+)
+
+_NUMBER = r"(\d+(?:\.\d+)?)"
+_CURRENCY = r"[$€£₹]"
+
+def _allocate(total_cents: int, weights: Dict[str, float]) -> Dict[str, int]:
+    return dict(zip(weights, allocate_cents(total_cents, list(weights.values()))))
+
+def _consume(pattern: str, text: str) -> Tuple[List[re.Match], str]:
+    matches = list(re.finditer(pattern, text))
+    return matches, re.sub(pattern, " ", text)
+
+def rule_split(expense_data: dict) -> Optional[Tuple[str, Dict[str, float]]]:
+    """Returns (rule name, split) when the description is unambiguous, otherwise None."""
+    amount = expense_data.get("amount") or 0
+    participants = list(dict.fromkeys(expense_data.get("participants") or []))
+    names = {p.lower(): p for p in participants}
+    if not participants or amount < 0 or len(names) != len(participants):
+        return None
+    total_cents = to_cents(amount)
+    text = " ".join((expense_data.get("description") or "").lower().split())
+
+    name_alt = "|".join(re.escape(n) for n in sorted(names, key=len, reverse=True))
+    name = rf"(?<![\w.@])(?:{name_alt})(?!\w)"
+
+    # Exclusions first; they combine with any of the other rules
+    excluded = set()
+    matches, text = _consume(rf"\b(?:except|excluding|without|minus|but not)\s+({name}(?:\s*(?:,|and|&)\s*{name})*)", text)
+    for m in matches:
+        excluded.update(names[n] for n in re.findall(name, m.group(1)))
+    matches, text = _consume(rf"({name})\s+(?:didn'?t\b|did not\b|not included|excluded|skipped|sat out|is out|was out)", text)
+    excluded.update(names[m.group(1)] for m in matches)
+    included = [p for p in participants if p not in excluded]
+    if not included:
+        return None
+
+    assigned: Dict[str, Dict[str, float]] = {}
+    for kind, patterns in (
+        ("percent", [rf"({name})\s*[:=]?\s*{_NUMBER}\s*%", rf"{_NUMBER}\s*%\s*(?:for|from|to|by)?\s*({name})"]),
+        ("shares", [rf"({name})\s*(?:x\s*{_NUMBER}\b|[:=]?\s*{_NUMBER}\s*(?:x\b|shares?\b))", rf"{_NUMBER}\s*x\s*(?:for|to)?\s*({name})"]),
+        ("exact", [rf"({name})\s*(?:[:=]|pays|owes)?\s*{_CURRENCY}?\s*{_NUMBER}(?![\d.%x])", rf"{_CURRENCY}\s*{_NUMBER}\s+(?:for|from)\s+({name})"]),
+    ):
+        for pattern in patterns:
+            matches, text = _consume(pattern, text)
+            for m in matches:
+                groups = [g for g in m.groups() if g is not None]
+                who, value = (groups[0], groups[1]) if groups[0] in names else (groups[1], groups[0])
+                member = names[who]
+                if member not in included or member in assigned.get(kind, {}):
+                    return None
+                assigned.setdefault(kind, {})[member] = float(value)
+
+    if len(assigned) > 1 or AMBIGUITY_HINTS.search(text) or re.search(name, text):
+        return None
+
+    if not assigned:
+        cents = _allocate(total_cents, {p: 1 for p in included})
+        rule = "except" if excluded else "equal"
+    else:
+        rule, values = next(iter(assigned.items()))
+        unassigned = [p for p in included if p not in values]
+        if rule == "percent":
+            remaining = 100 - sum(values.values())
+            if remaining < -0.01 or (not unassigned and abs(remaining) > 0.01) or (unassigned and remaining <= 0):
+                return None
+            weights = {**values, **{p: remaining / len(unassigned) for p in unassigned}}
+            cents = _allocate(total_cents, {p: weights[p] for p in included if weights[p] > 0})
+        elif rule == "shares":
+            weights = {p: values.get(p, 1) for p in included}
+            if any(w <= 0 for w in weights.values()):
+                return None
+            cents = _allocate(total_cents, weights)
+        else:
+            exact = {p: to_cents(v) for p, v in values.items()}
+            remaining = total_cents - sum(exact.values())
+            if remaining < 0 or (not unassigned and remaining != 0) or (unassigned and remaining == 0):
+                return None
+            cents = {**exact, **(_allocate(remaining, {p: 1 for p in unassigned}) if unassigned else {})}
+
+    return rule, {p: cents[p] / 100 for p in participants if p in cents}
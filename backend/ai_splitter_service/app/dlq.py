@@ -0,0 +1,91 @@
+"""
+Inspects and replays the AI splitter's dead-letter queue.
+
+    python app/dlq.py list [--limit 20]     show dead-lettered messages (they stay queued)
+    python app/dlq.py replay [--limit N]    send messages back to the main queue with a fresh attempt count
+    python app/dlq.py purge                 drop everything in the dead-letter queue
+"""
+import argparse
+import asyncio
+import json
+import sys
+import aio_pika
+from core import rabbitmq
+from core.rabbitmq import QUEUE_NAME, connect_to_rabbitmq, close_rabbitmq_connection
+from core.retry import ATTEMPT_HEADER, dead_letter_queue_name
+
+async def list_messages(limit: int):
+    # Messages are fetched without acking on a throwaway channel; closing it requeues them all
+    channel = await rabbitmq.connection.channel()
+    try:
+        queue = await channel.declare_queue(dead_letter_queue_name(QUEUE_NAME), durable=True)
+        print(f"{queue.declaration_result.message_count} message(s) in {queue.name}")
+        for _ in range(limit):
+            message = await queue.get(no_ack=False, fail=False)
+            if message is None:
+                break
+            headers = message.headers or {}
+            print(json.dumps({
+                "attempts": headers.get(ATTEMPT_HEADER),
+                "failed_at": headers.get("x-failed-at"),
+                "error": headers.get("x-error"),
+                "published_at": message.timestamp.isoformat() if message.timestamp else None,
+                "body": message.body.decode(errors="replace"),
+            }))
+    finally:
+        await channel.close()
+
+async def replay(limit: int) -> int:
+    queue = await rabbitmq.channel.declare_queue(dead_letter_queue_name(QUEUE_NAME), durable=True)
+    # Only what is dead-lettered now: a replayed message that fails again comes back to
+    # this queue, and pulling until it is empty would never end
+    available = queue.declaration_result.message_count
+    if limit > 0:
+        available = min(available, limit)
+    replayed = 0
+    while replayed < available:
+        message = await queue.get(no_ack=False, fail=False)
+        if message is None:
+            break
+        headers = {k: v for k, v in (message.headers or {}).items() if k not in (ATTEMPT_HEADER, "x-error", "x-failed-at")}
+        await rabbitmq.channel.default_exchange.publish(
+            aio_pika.Message(
+                body=message.body,
+                headers=headers,
+                content_type=message.content_type,
+                delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                timestamp=message.timestamp,
+            ),
+            routing_key=QUEUE_NAME
+        )
+        await message.ack()
+        replayed += 1
+    print(f"Replayed {replayed} message(s) to {QUEUE_NAME}.")
+    return replayed
+
+async def purge():
+    queue = await rabbitmq.channel.declare_queue(dead_letter_queue_name(QUEUE_NAME), durable=True)
+    await queue.purge()
+    print(f"Purged {queue.name}.")
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["list", "replay", "purge"])
+    parser.add_argument("--limit", type=int, default=None, help="list: default 20; replay: default all")
+    args = parser.parse_args()
+
+    if await connect_to_rabbitmq() is None:
+        return 1
+    try:
+        if args.command == "list":
+            await list_messages(args.limit or 20)
+        elif args.command == "replay":
+            await replay(args.limit or 0)
+        else:
+            await purge()
+        return 0
+    finally:
+        await close_rabbitmq_connection()
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -1,63 +1,168 @@
 import asyncio
 import json
+import signal
 from bson import ObjectId
 import aio_pika
+from pymongo import ReturnDocument
+from core.config import settings
 from core.database import connect_to_mongo, close_mongo_connection, get_database
-from core.rabbitmq import connect_to_rabbitmq, close_rabbitmq_connection, consume_messages
-from core.gemini_ai import get_smart_split
+from core import rabbitmq
+from core.rabbitmq import QUEUE_NAME, connect_to_rabbitmq, close_rabbitmq_connection, consume_messages, publish_event, queue_depth
+from core.engines import build_engines, split_expense
+from splitwise_common.events import expense_split_changed_event
+from splitwise_common.ledger import apply_split_change
+from core.metrics import consumer_metrics
+from core.retry import PermanentFailure, default_policy
+from core.split_cache import ensure_split_cache_indexes
+
+# Tried in order until one produces a split (core/engines.py)
+engines = build_engines(settings.SPLIT_ENGINES)
+
+# Failed messages wait in delay queues, then dead-letter after MAX_DELIVERY_ATTEMPTS (core/retry.py)
+retry_policy = default_policy(QUEUE_NAME)
+
+# Where expense.split_changed events go (the benchmark points this at its scratch exchange)
+EVENTS_EXCHANGE = "expense_events"
+
+# An expense whose split has not been written yet
+UNSPLIT = {"$in": [{}, None]}
+
+# Handlers currently running, so shutdown can wait for their acks
+active_handlers = set()
+
+async def split_expense_created(body: bytes):
+    """Splits one expense.created event and stores the split. Raises on failure."""
+    try:
+        expense_data = json.loads(body.decode())
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        raise PermanentFailure("Received malformed JSON message.")
+    expense_id = expense_data.get("expense_id")
+    group_id = expense_data.get("group_id")
+
+    if not expense_id or not group_id:
+        raise PermanentFailure("Invalid expense_created event: missing expense_id or group_id")
+    if not ObjectId.is_valid(expense_id) or not ObjectId.is_valid(group_id):
+        raise PermanentFailure("Invalid expense_created event: malformed expense_id or group_id")
+
+    db = get_database()
+
+    # Fetch group members to provide context for AI
+    group_doc = await db["groups"].find_one({"_id": ObjectId(group_id)})
+    if not group_doc:
+        print(f"Group {group_id} not found for expense {expense_id}. Cannot smart split.")
+        return
+
+    group_members = group_doc.get("members", [])
+
+    # Cheapest engine first (by default: local rules, then the split cache, then a
+    # micro-batched smart split from AI)
+    path, smart_split = await split_expense(engines, expense_data, group_members)
+    consumer_metrics.record_path(path)
+
+    # Only an expense without a split is written: expense.created is delivered at least
+    # once, and a redelivery must not overwrite a split the user has edited since. The
+    # previous split is needed for the ledger delta.
+    previous = await db["expenses"].find_one_and_update(
+        {"_id": ObjectId(expense_id), "split": UNSPLIT},
+        {"$set": {"split": smart_split}, "$inc": {"split_version": 1}},
+        projection={"group_id": 1, "paid_by": 1, "split": 1, "split_version": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+
+    if previous is not None:
+        await apply_split_change(db, previous["group_id"], previous["paid_by"], previous.get("split"), smart_split)
+        # For Payment Service's pair balances. If this fails the message is retried (below)
+        await publish_event(EVENTS_EXCHANGE, "expense.split_changed", expense_split_changed_event(
+            previous, smart_split, previous.get("split_version", 0) + 1
+        ))
+        print(f"Successfully updated expense {expense_id} with smart split ({path}): {smart_split}")
+        return
+
+    current = await db["expenses"].find_one(
+        {"_id": ObjectId(expense_id)}, {"group_id": 1, "paid_by": 1, "split": 1, "split_version": 1}
+    )
+    if current is None:
+        print(f"Failed to update expense {expense_id} (expense not found).")
+        return
+    # Already split (a duplicate event, a user edit, or an earlier attempt whose publish
+    # failed). Re-announcing the current version is harmless: consumers drop duplicates.
+    await publish_event(EVENTS_EXCHANGE, "expense.split_changed", expense_split_changed_event(
+        current, current.get("split"), current.get("split_version", 0)
+    ))
+    print(f"Expense {expense_id} already has a split (v{current.get('split_version', 0)}); left unchanged.")
 
 async def process_expense_created(message: aio_pika.IncomingMessage):
-    async with message.process():
-        print(f"AI Splitter: Received message: {message.body.decode()}")
+    active_handlers.add(asyncio.current_task())
+    started = consumer_metrics.message_started(message)
+    ok = False
+    try:
+        print(f"AI Splitter: Received message (attempt {retry_policy.attempt(message)}): {message.body.decode(errors='replace')}")
         try:
-            expense_data = json.loads(message.body.decode())
-            expense_id = expense_data.get("expense_id")
-            group_id = expense_data.get("group_id")
-
-            if not expense_id or not group_id:
-                print("Invalid expense_created event: missing expense_id or group_id")
-                return
-
-            db = get_database()
-
-            # Fetch group members to provide context for AI
-            group_doc = await db["groups"].find_one({"_id": ObjectId(group_id)})
-            if not group_doc:
-                print(f"Group {group_id} not found for expense {expense_id}. Cannot smart split.")
-                return
-            
-            group_members = group_doc.get("members", [])
-
-            # Get smart split from AI
-            smart_split = await get_smart_split(expense_data, group_members)
-            
-            # Update the expense in MongoDB
-            update_result = await db["expenses"].update_one(
-                {"_id": ObjectId(expense_id)},
-                {"$set": {"split": smart_split}}
-            )
-
-            if update_result.modified_count > 0:
-                print(f"Successfully updated expense {expense_id} with smart split: {smart_split}")
-            else:
-                print(f"Failed to update expense {expense_id} (expense not found or no change).")
-
-        except json.JSONDecodeError:
-            print("Error: Received malformed JSON message.")
+            await split_expense_created(message.body)
+        except PermanentFailure as e:
+            print(f"Error: {e}")
+            await retry_policy.handle_failure(message, e, permanent=True)
         except Exception as e:
+            # Transient (Mongo, model, ...): retried later from a delay queue
             print(f"Error processing expense_created event: {e}")
+            await retry_policy.handle_failure(message, e)
+        else:
+            await message.ack()
+            ok = True
+    finally:
+        consumer_metrics.message_finished(started, ok)
+        active_handlers.discard(asyncio.current_task())
+
+async def report_metrics():
+    while True:
+        await asyncio.sleep(settings.METRICS_INTERVAL_SECONDS)
+        try:
+            depth = await queue_depth(QUEUE_NAME)
+        except Exception:
+            depth = None
+        engine_stats = {engine.name: engine.stats() for engine in engines if engine.stats()}
+        print(f"AI Splitter: metrics {json.dumps({**consumer_metrics.snapshot(depth), 'retries': retry_policy.stats(), 'engines': engine_stats})}")
 
 async def main():
-    connect_to_mongo()
+    await connect_to_mongo()
+    await ensure_split_cache_indexes(get_database())
     await connect_to_rabbitmq()
-    
-    # Start consuming messages
-    await consume_messages("ai_splitter_queue", process_expense_created)
 
-if __name__ == "__main__":
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    reporter = None
     try:
-        asyncio.run(main())
-    except KeyboardInterrupt:
+        if rabbitmq.channel is None:
+            return
+        await retry_policy.declare()
+
+        # Start consuming messages
+        consumer = await consume_messages(QUEUE_NAME, process_expense_created, settings.PREFETCH_COUNT)
+        if consumer is None:
+            return
+        queue, consumer_tag = consumer
+        reporter = asyncio.create_task(report_metrics())
+
+        await stop.wait()
         print("AI Splitter Service shutting down.")
-        asyncio.run(close_rabbitmq_connection())
-        close_mongo_connection()
\ No newline at end of file
+
+        # Stop new deliveries, then let the messages already being handled finish and ack.
+        # Anything still unacked when the connection closes is redelivered by the broker.
+        await queue.cancel(consumer_tag)
+        if active_handlers:
+            print(f"AI Splitter: Waiting for {len(active_handlers)} in-flight message(s).")
+            _, pending = await asyncio.wait(set(active_handlers), timeout=settings.SHUTDOWN_GRACE_SECONDS)
+            if pending:
+                print(f"AI Splitter: {len(pending)} message(s) unfinished after {settings.SHUTDOWN_GRACE_SECONDS}s; they will be redelivered.")
+        print(f"AI Splitter: final metrics {json.dumps(consumer_metrics.snapshot())}")
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+        await close_rabbitmq_connection()
+        close_mongo_connection()
+
+if __name__ == "__main__":
+    asyncio.run(main())
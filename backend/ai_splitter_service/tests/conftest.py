@@ -0,0 +1,9 @@
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# The splitter imports its modules as `core.x` (it runs as `python app/main.py`), and the
+# image ships backend/common next to them
+sys.path.insert(0, os.path.join(HERE, "..", "app"))
+sys.path.insert(0, os.path.join(HERE, "..", "..", "common"))
@@ -0,0 +1,91 @@
+import random
+import numpy as np
+import pytest
+from core.allocation import (
+    allocate_batch, allocate_cents, equal_split, equal_split_batch, percentage_split, to_cents, weighted_split,
+)
+
+SEEDS = range(20)
+
+def random_weights(rng: random.Random, k: int, floats: bool):
+    weights = [rng.uniform(0, 5) if floats else rng.randint(0, 7) for _ in range(k)]
+    if not any(weights):
+        weights[rng.randrange(k)] = 1
+    return weights
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_allocate_cents_sums_exactly(seed):
+    rng = random.Random(seed)
+    for _ in range(200):
+        total = rng.randint(0, 10_000_000)
+        weights = random_weights(rng, rng.randint(1, 12), floats=rng.random() < 0.5)
+        shares = allocate_cents(total, weights)
+        assert sum(shares) == total
+        assert all(share >= 0 for share in shares)
+        # Zero weights never receive cents
+        assert all(share == 0 for share, w in zip(shares, weights) if w == 0)
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_allocate_cents_stays_within_a_cent_of_the_exact_share(seed):
+    rng = random.Random(seed)
+    for _ in range(200):
+        total = rng.randint(0, 1_000_000)
+        weights = random_weights(rng, rng.randint(1, 12), floats=False)
+        for share, w in zip(allocate_cents(total, weights), weights):
+            assert abs(share - total * w / sum(weights)) < 1
+
+def test_allocate_cents_gives_leftover_cents_to_the_first_listed():
+    assert allocate_cents(100, [1, 1, 1]) == [34, 33, 33]
+    assert allocate_cents(200, [1, 1, 1]) == [67, 67, 66]
+
+def test_allocate_cents_rejects_bad_weights():
+    with pytest.raises(ValueError):
+        allocate_cents(100, [1, -1])
+    with pytest.raises(ValueError):
+        allocate_cents(100, [0, 0])
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_allocate_batch_matches_allocate_cents(seed):
+    rng = random.Random(seed)
+    floats = seed % 2 == 0
+    n, k = rng.randint(1, 50), rng.randint(1, 10)
+    totals = np.array([rng.randint(0, 10_000_000) for _ in range(n)], dtype=np.int64)
+    rows = []
+    for _ in range(n):
+        # Shorter rows are padded with zero weights, as equal_split_batch does
+        used = random_weights(rng, rng.randint(1, k), floats)
+        rows.append(used + [0] * (k - len(used)))
+    weights = np.array(rows, dtype=np.float64 if floats else np.int64)
+
+    allocated = allocate_batch(totals, weights)
+    assert (allocated.sum(axis=1) == totals).all()
+    for total, row, shares in zip(totals, rows, allocated):
+        assert list(shares) == allocate_cents(int(total), row)
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_equal_split_batch_matches_equal_split(seed):
+    rng = random.Random(seed)
+    names = ["ann", "bob", "cy", "dee", "eve"]
+    expenses = [
+        {"amount": rng.randint(0, 500_000) / 100, "participants": [rng.choice(names) for _ in range(rng.randint(0, 7))]}
+        for _ in range(100)
+    ]
+    for expense, split in zip(expenses, equal_split_batch(expenses)):
+        assert split == equal_split(expense["amount"], expense["participants"])
+        if split:
+            assert sum(to_cents(amount) for amount in split.values()) == to_cents(expense["amount"])
+
+def test_equal_split_batch_counts_a_repeated_participant_once():
+    assert equal_split_batch([{"amount": 10.0, "participants": ["x", "x", "y"]}]) == [{"x": 5.0, "y": 5.0}]
+
+def test_equal_split_batch_of_nothing():
+    assert equal_split_batch([]) == []
+    assert equal_split_batch([{"amount": 12.0, "participants": []}]) == [{}]
+
+def test_percentage_split_needs_100_percent():
+    assert percentage_split(10.0, {"a": 50, "b": 50}) == {"a": 5.0, "b": 5.0}
+    with pytest.raises(ValueError):
+        percentage_split(10.0, {"a": 50, "b": 40})
+
+def test_weighted_split_of_zero():
+    assert weighted_split(0.0, {"a": 1, "b": 3}) == {"a": 0.0, "b": 0.0}
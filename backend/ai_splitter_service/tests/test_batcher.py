@@ -0,0 +1,51 @@
+import asyncio
+from core.batcher import SplitBatcher
+
+class FakeModel:
+    cacheable = False
+
+    def __init__(self, batch_error=None, validate_error=None):
+        self.batch_error = batch_error
+        self.validate_error = validate_error
+        self.batch_calls = 0
+        self.single_calls = 0
+
+    async def split_batch(self, expenses):
+        self.batch_calls += 1
+        if self.batch_error:
+            raise self.batch_error
+        return {e["expense_id"]: {"a": e["amount"]} for e in expenses}
+
+    async def split_one(self, expense_data, group_members):
+        self.single_calls += 1
+        return {"single": expense_data["amount"]}
+
+    def validate(self, expense_data, answer):
+        if self.validate_error:
+            raise self.validate_error
+        return answer
+
+def submit_all(batcher, count):
+    async def run():
+        return await asyncio.wait_for(asyncio.gather(
+            *(batcher.submit({"expense_id": str(i), "amount": float(i)}, ["a"]) for i in range(count)),
+            return_exceptions=True
+        ), timeout=2)
+    return asyncio.run(run())
+
+def test_one_batch_call_answers_every_item():
+    model = FakeModel()
+    results = submit_all(SplitBatcher(model, max_items=4, max_wait_ms=10, max_concurrent_calls=2), 4)
+    assert results == [{"a": float(i)} for i in range(4)]
+    assert (model.batch_calls, model.single_calls) == (1, 0)
+
+def test_failed_batch_falls_back_to_single_calls():
+    model = FakeModel(batch_error=RuntimeError("model down"))
+    results = submit_all(SplitBatcher(model, max_items=3, max_wait_ms=10, max_concurrent_calls=2), 3)
+    assert results == [{"single": float(i)} for i in range(3)]
+    assert model.single_calls == 3
+
+def test_unexpected_error_fails_the_callers_instead_of_hanging():
+    error = KeyError("bad answer")
+    results = submit_all(SplitBatcher(FakeModel(validate_error=error), max_items=3, max_wait_ms=10, max_concurrent_calls=2), 3)
+    assert results == [error] * 3
@@ -0,0 +1,129 @@
+import asyncio
+import pytest
+from core import circuit_breaker
+from core.circuit_breaker import CircuitBreaker
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", clock)
+    return clock
+
+def breaker():
+    return CircuitBreaker(window=4, min_calls=4, failure_ratio=0.5, open_seconds=30, slow_call_seconds=2)
+
+def test_stays_closed_below_the_failure_ratio(clock):
+    cb = breaker()
+    for ok in (True, True, True, False, True, True):
+        assert cb.allow()
+        cb.record(ok, 0.1)
+    assert cb.state == CircuitBreaker.CLOSED
+
+def test_needs_min_calls_before_opening(clock):
+    cb = breaker()
+    for _ in range(3):
+        cb.record(False, 0.1)
+    assert cb.state == CircuitBreaker.CLOSED
+    cb.record(True, 0.1)
+    assert cb.state == CircuitBreaker.OPEN
+
+def test_slow_calls_count_as_bad(clock):
+    cb = breaker()
+    for elapsed in (0.1, 0.1, 5, 5):
+        cb.record(True, elapsed)
+    assert cb.state == CircuitBreaker.OPEN
+    assert not cb.allow()
+    assert cb.stats()["rejected_calls"] == 1
+
+def test_half_open_allows_a_single_probe(clock):
+    cb = breaker()
+    for _ in range(4):
+        cb.record(False, 0.1)
+    clock.now += 29
+    assert not cb.allow()
+    clock.now += 1
+    assert cb.allow()
+    assert cb.state == CircuitBreaker.HALF_OPEN
+    assert not cb.allow()
+
+    cb.record(True, 0.1)
+    assert cb.state == CircuitBreaker.CLOSED
+    assert cb.allow()
+    assert cb.stats()["recent_bad_ratio"] == 0.0
+
+def test_bad_probe_opens_again(clock):
+    cb = breaker()
+    for _ in range(4):
+        cb.record(False, 0.1)
+    clock.now += 30
+    assert cb.allow()
+    cb.record(False, 0.1)
+    assert cb.state == CircuitBreaker.OPEN
+    assert cb.times_opened == 2
+    clock.now += 29
+    assert not cb.allow()
+
+def test_released_probe_lets_the_next_call_probe(clock):
+    cb = breaker()
+    for _ in range(4):
+        cb.record(False, 0.1)
+    clock.now += 30
+    assert cb.allow()
+    cb.release()
+    assert cb.state == CircuitBreaker.HALF_OPEN
+    assert cb.allow()
+    assert not cb.allow()
+
+def test_release_while_closed_changes_nothing(clock):
+    cb = breaker()
+    cb.release()
+    assert cb.allow() and cb.state == CircuitBreaker.CLOSED
+
+def test_cancelled_probe_does_not_wedge_the_breaker(clock):
+    cb = breaker()
+    for _ in range(4):
+        cb.record(False, 0.1)
+    clock.now += 30
+
+    async def probe(started):
+        async with cb.call():
+            started.set()
+            await asyncio.sleep(10)
+
+    async def run():
+        started = asyncio.Event()
+        task = asyncio.create_task(probe(started))
+        await started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert cb.state == CircuitBreaker.HALF_OPEN
+    assert cb.allow()
+
+def test_call_records_outcomes(clock):
+    cb = breaker()
+
+    async def fail():
+        async with cb.call():
+            raise ValueError("model error")
+
+    for _ in range(4):
+        with pytest.raises(ValueError):
+            asyncio.run(fail())
+    assert cb.state == CircuitBreaker.OPEN
+
+    async def ok():
+        async with cb.call():
+            pass
+
+    with pytest.raises(circuit_breaker.CircuitOpenError):
+        asyncio.run(ok())
@@ -0,0 +1,54 @@
+import random
+import pytest
+from core.split_rules import rule_split
+
+def expense(description, amount=30.0, participants=("alice", "bob", "carol")):
+    return {"description": description, "amount": amount, "participants": list(participants)}
+
+@pytest.mark.parametrize("description, rule, split", [
+    ("Groceries", "equal", {"alice": 10.0, "bob": 10.0, "carol": 10.0}),
+    ("Dinner except bob", "except", {"alice": 15.0, "carol": 15.0}),
+    ("Taxi, carol didn't come", "except", {"alice": 15.0, "bob": 15.0}),
+    ("Hotel alice 50%", "percent", {"alice": 15.0, "bob": 7.5, "carol": 7.5}),
+    ("Pizza 2x for bob", "shares", {"alice": 7.5, "bob": 15.0, "carol": 7.5}),
+    ("Tickets alice 12", "exact", {"alice": 12.0, "bob": 9.0, "carol": 9.0}),
+    ("Drinks $20 for carol", "exact", {"alice": 5.0, "bob": 5.0, "carol": 20.0}),
+])
+def test_recognised_descriptions(description, rule, split):
+    assert rule_split(expense(description)) == (rule, split)
+
+@pytest.mark.parametrize("description", [
+    "alice pays more",
+    "half for bob",
+    "alice 50% and bob 2x",
+    "bob brought snacks",
+    "alice 60% bob 60%",
+    "alice 10 bob 10 carol 5",
+    "except alice bob and carol",
+])
+def test_ambiguous_descriptions_go_to_the_model(description):
+    assert rule_split(expense(description)) is None
+
+def test_duplicate_participants_are_ignored():
+    assert rule_split(expense("Lunch", participants=("alice", "bob", "alice"))) == ("equal", {"alice": 15.0, "bob": 15.0})
+
+def test_splits_always_add_up():
+    rng = random.Random(13)
+    names = ["alice", "bob", "carol", "dave", "erin"]
+    templates = ["Groceries", "except {0}", "{0} {p}%", "{n}x for {0}", "{0} {c}", "{0} didn't"]
+    recognised = 0
+    for _ in range(500):
+        participants = rng.sample(names, rng.randint(1, len(names)))
+        description = rng.choice(templates).format(
+            rng.choice(participants), p=rng.randint(1, 99), n=rng.randint(2, 4), c=rng.randint(1, 40)
+        )
+        amount = rng.randint(1, 100000) / 100
+        result = rule_split(expense(description, amount, participants))
+        if result is None:
+            continue
+        recognised += 1
+        _, split = result
+        assert set(split) <= set(participants)
+        assert all(value >= 0 for value in split.values())
+        assert round(sum(split.values()) * 100) == round(amount * 100)
+    assert recognised > 250
@@ -64,14 +64,8 @@ async def signup(user_data: UserCreate):
     if users_collection is None:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Users collection not found in database")
 
-    # Check for unique username
-    if await users_collection.find_one({"username": user_data.username}):
-        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Username already registered")
-
-    # Check for unique email
-    if await users_collection.find_one({"email": user_data.email}):
-        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Email already registered")
-
+    # Uniqueness of username and email is enforced by the unique indexes in app/core/indexes.py,
+    # so signup is a single insert and conflicts surface as DuplicateKeyError below.
     hashed_password = get_password_hash(user_data.password)
 
     # Create a dictionary directly for insertion to ensure MongoDB generates _id
@@ -85,15 +79,14 @@ async def signup(user_data: UserCreate):
     
     try:
         result = await users_collection.insert_one(user_data_to_insert)
-        created_user = await users_collection.find_one({"_id": result.inserted_id})
-        if created_user is None:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="User creation failed unexpectedly.")
-
-        return CurrentUser(username=created_user["username"], email=created_user["email"], id=str(created_user["_id"]))
+        return CurrentUser(username=user_data_to_insert["username"], email=user_data_to_insert["email"], id=str(result.inserted_id))
     except DuplicateKeyError as e:
-        # Check if the duplicate key error is on username or email unique index (if defined)
-        # This part requires specific index setup in MongoDB for it to be precise.
-        # For now, a generic 409 is fine.
+        # keyPattern names the unique index that rejected the insert
+        key_pattern = (e.details or {}).get("keyPattern", {})
+        if "username" in key_pattern:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Username already registered")
+        if "email" in key_pattern:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Email already registered")
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="User with this username or email already exists.")
     except Exception as e:
         print(f"Error during signup: {e}")
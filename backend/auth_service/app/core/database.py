@@ -1,26 +1,23 @@
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+from splitwise_common.mongo import MongoConnection
 from app.core.config import settings
 
-client = None
-db = None
+# The pooled Motor client for Auth Service (splitwise_common/mongo.py)
+mongo = MongoConnection("Auth Service", settings)
 
 async def connect_to_mongo():
-    global client, db
-    try:
-        client = MongoClient(settings.MONGO_DB_URL)
-        db = client.get_database()
-        client.admin.command('ismaster') # Check connection
-        print(f"Auth Service: Connected to MongoDB at {settings.MONGO_DB_URL}")
-    except ConnectionFailure as e:
-        print(f"Auth Service: Could not connect to MongoDB: {e}")
-        exit(1)
+    await mongo.connect()
 
 def close_mongo_connection():
-    global client
-    if client:
-        client.close()
-        print("Auth Service: MongoDB connection closed.")
+    mongo.close()
 
 def get_database():
-    return db
\ No newline at end of file
+    return mongo.db
+
+def get_client():
+    return mongo.client
+
+def supports_transactions() -> bool:
+    return mongo.transactions_supported
+
+def get_pool_metrics() -> dict:
+    return mongo.metrics()
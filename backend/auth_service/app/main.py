@@ -1,17 +1,17 @@
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
-from app.core.database import connect_to_mongo, close_mongo_connection
+from app.core.database import connect_to_mongo, close_mongo_connection, get_database, get_pool_metrics
+from app.core.indexes import ensure_indexes
 from app.api.v1.endpoints import auth
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Before application startup
-    # connect_to_mongo is not an awaitable function in your database.py, so remove await
-    await  connect_to_mongo() 
+    await connect_to_mongo()
+    await ensure_indexes(get_database())
     yield
     # After application shutdown
-    # close_mongo_connection is not an awaitable function
-    await close_mongo_connection() 
+    close_mongo_connection()
 
 app = FastAPI(
     title="Auth Service",
@@ -25,4 +25,8 @@ app.include_router(auth.router, prefix="/auth", tags=["Auth"])
 # Health check endpoint
 @app.get("/health")
 async def health_check():
-    return {"status": "ok", "service": "Auth Service"}
\ No newline at end of file
+    return {"status": "ok", "service": "Auth Service"}
+
+@app.get("/metrics")
+async def metrics():
+    return {"service": "Auth Service", "mongo_pool": get_pool_metrics()}
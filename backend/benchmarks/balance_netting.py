@@ -0,0 +1,131 @@
+"""
+Compares netting a user's succeeded payments per counterparty in Python (the old
+get_user_balances pipeline, which $push-ed every payment into two arrays) with netting
+them inside the aggregation, the approach payment_service/app/core/netting.py uses for
+the pair balance rebuild.
+
+    MONGO_DB_URL=mongodb://localhost:27017 python backend/benchmarks/balance_netting.py --payments 1000,10000,100000
+
+For each size, one heavy user gets that many succeeded payments spread over
+--counterparties users (in both directions). Reported per approach: p50 latency, bytes
+returned by the server, and documents returned. The old pipeline fails once the pushed
+arrays exceed the 16 MB document limit; that is reported rather than raised.
+
+Everything is written to a scratch database that is dropped afterwards.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+from datetime import datetime
+import bson
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+BENCH_DB = "bench_balance_netting"
+HEAVY_USER = "heavy"
+
+
+def legacy_pipeline(username: str) -> list:
+    # As get_user_balances ran it before the netting moved into the aggregation
+    return [
+        {"$match": {"$or": [{"payer": username}, {"payee": username}], "status": "succeeded"}},
+        {"$group": {
+            "_id": None,
+            "total_paid_out": {"$sum": {"$cond": [{"$eq": ["$payer", username]}, "$amount", 0]}},
+            "total_paid_in": {"$sum": {"$cond": [{"$eq": ["$payee", username]}, "$amount", 0]}},
+            "payments_made": {"$push": {"$cond": [{"$eq": ["$payer", username]}, {"payee": "$payee", "amount": "$amount"}, "$$REMOVE"]}},
+            "payments_received": {"$push": {"$cond": [{"$eq": ["$payee", username]}, {"payer": "$payer", "amount": "$amount"}, "$$REMOVE"]}},
+        }}
+    ]
+
+def user_netting_pipeline(username: str) -> list:
+    """
+    Net payments between `username` and each counterparty:
+    {"_id": counterparty, "net_cents": n, "payments": k}; n > 0 means `username` paid more.
+    """
+    paid_by_user = {"$eq": ["$payer", username]}
+    cents = {"$toLong": {"$round": [{"$multiply": ["$amount", 100]}, 0]}}
+    return [
+        {"$match": {"$or": [{"payer": username}, {"payee": username}], "status": "succeeded"}},
+        {"$group": {
+            "_id": {"$cond": [paid_by_user, "$payee", "$payer"]},
+            "net_cents": {"$sum": {"$cond": [paid_by_user, cents, {"$multiply": [-1, cents]}]}},
+            "payments": {"$sum": 1},
+        }},
+    ]
+
+async def legacy(db, username: str):
+    docs = await db["payments"].aggregate(legacy_pipeline(username)).to_list(1)
+    net = {}
+    if docs:
+        for p in docs[0].get("payments_made", []):
+            net[p["payee"]] = net.get(p["payee"], 0.0) + p["amount"]
+        for p in docs[0].get("payments_received", []):
+            net[p["payer"]] = net.get(p["payer"], 0.0) - p["amount"]
+    return docs, {user: round(amount * 100) for user, amount in net.items() if round(amount * 100)}
+
+async def netted(db, username: str):
+    docs = await db["payments"].aggregate(user_netting_pipeline(username)).to_list(None)
+    return docs, {d["_id"]: d["net_cents"] for d in docs if d["net_cents"]}
+
+async def seed(db, payments: int, counterparties: int, rng: random.Random):
+    await db["payments"].delete_many({})
+    docs = []
+    for _ in range(payments):
+        other = f"user{rng.randrange(counterparties)}"
+        payer, payee = (HEAVY_USER, other) if rng.random() < 0.5 else (other, HEAVY_USER)
+        docs.append({"payer": payer, "payee": payee, "amount": rng.randint(100, 20_000) / 100,
+                     "status": "succeeded" if rng.random() < 0.9 else "requires_payment_method",
+                     "created_at": datetime.utcnow()})
+        if len(docs) == 10_000:
+            await db["payments"].insert_many(docs)
+            docs = []
+    if docs:
+        await db["payments"].insert_many(docs)
+
+async def measure(fn, db, iterations: int):
+    timings, result = [], None
+    try:
+        for _ in range(iterations):
+            started = time.perf_counter()
+            result = await fn(db, HEAVY_USER)
+            timings.append((time.perf_counter() - started) * 1000)
+    except OperationFailure as e:
+        return None, f"failed: {e.details.get('codeName', e.code) if e.details else e}"
+    docs, net = result
+    size = sum(len(bson.encode(d)) for d in docs)
+    return net, f"{statistics.median(timings):>9.2f}ms {size:>12,}B {len(docs):>6} docs"
+
+async def main(url: str, sizes: list, counterparties: int, iterations: int):
+    client = AsyncIOMotorClient(url)
+    db = client[BENCH_DB]
+    try:
+        await db["payments"].create_indexes([
+            IndexModel([("payer", ASCENDING), ("status", ASCENDING)], name="payer_status"),
+            IndexModel([("payee", ASCENDING), ("status", ASCENDING)], name="payee_status"),
+        ])
+        rng = random.Random(7)
+        print(f"{'payments':>9}  {'legacy ($push + Python)':<40} {'netted in $group':<40}")
+        for payments in sizes:
+            await seed(db, payments, counterparties, rng)
+            legacy_net, legacy_report = await measure(legacy, db, iterations)
+            netted_net, netted_report = await measure(netted, db, iterations)
+            if legacy_net is not None and legacy_net != netted_net:
+                netted_report += "  (MISMATCH)"
+            print(f"{payments:>9}  {legacy_report:<40} {netted_report:<40}")
+    finally:
+        await client.drop_database(BENCH_DB)
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=os.getenv("MONGO_DB_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--payments", default="1000,10000,100000", help="Comma-separated payment counts for the heavy user")
+    parser.add_argument("--counterparties", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.url, [int(n) for n in args.payments.split(",")], args.counterparties, args.iterations))
@@ -0,0 +1,87 @@
+"""
+Times the settle-up planners in expense_service/app/core/settlement.py on synthetic
+group balances and reports how many transfers each plan needs.
+
+    python backend/benchmarks/settlement.py --sizes 10,100,1000,5000 --runs 20
+
+Distributions (balances in cents, always summing to zero):
+    uniform     every member owes or is owed a uniform random amount
+    one_payer   one member paid for everyone, who each owe a similar share
+    skewed      a few large creditors, many small debtors (Pareto amounts)
+    round       amounts in whole currency units, so many balances cancel exactly
+
+No database is needed. For groups up to --exact-max members the exact planner is run
+as well, to show how far greedy is from the minimum.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "expense_service"))
+
+from app.core.settlement import exact_settlement, greedy_settlement  # noqa: E402
+
+
+def _balance(amounts: list) -> dict:
+    # The last member absorbs the rounding so the group sums to zero
+    amounts[-1] -= sum(amounts)
+    return {f"user{i}": cents for i, cents in enumerate(amounts)}
+
+def uniform(rng: random.Random, n: int) -> dict:
+    return _balance([rng.randint(-50_000, 50_000) for _ in range(n)])
+
+def one_payer(rng: random.Random, n: int) -> dict:
+    return _balance([0] + [-rng.randint(1_500, 2_500) for _ in range(n - 1)])
+
+def skewed(rng: random.Random, n: int) -> dict:
+    creditors = max(1, n // 50)
+    return _balance([int(rng.paretovariate(1.2) * 100_000) for _ in range(creditors)] +
+                    [-int(rng.paretovariate(2.5) * 1_000) for _ in range(n - creditors)])
+
+def round_amounts(rng: random.Random, n: int) -> dict:
+    return _balance([rng.choice([-1, 1]) * rng.randint(1, 20) * 500 for _ in range(n)])
+
+DISTRIBUTIONS = {"uniform": uniform, "one_payer": one_payer, "skewed": skewed, "round": round_amounts}
+
+def _check(balances: dict, transfers: list):
+    remaining = dict(balances)
+    for debtor, creditor, cents in transfers:
+        remaining[debtor] += cents
+        remaining[creditor] -= cents
+    assert not any(remaining.values()), "plan does not settle the group"
+
+def _time(planner, balances: dict, runs: int):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        transfers = planner(balances)
+        timings.append((time.perf_counter() - started) * 1000)
+    _check(balances, transfers)
+    return statistics.median(timings), max(timings), len(transfers)
+
+def main(sizes: list, runs: int, exact_max: int, seed: int):
+    rng = random.Random(seed)
+    print(f"{'distribution':12} {'members':>8} {'owing/owed':>10} {'greedy p50':>11} {'greedy max':>11} "
+          f"{'transfers':>9} {'exact p50':>10} {'exact':>6}")
+    for name, generate in DISTRIBUTIONS.items():
+        for n in sizes:
+            balances = generate(rng, n)
+            nonzero = sum(1 for cents in balances.values() if cents)
+            p50, worst, count = _time(greedy_settlement, balances, runs)
+            exact = ""
+            if nonzero <= exact_max:
+                exact_p50, _, exact_count = _time(exact_settlement, balances, max(1, runs // 10))
+                exact = f"{exact_p50:>8.2f}ms {exact_count:>6}"
+            print(f"{name:12} {n:>8} {nonzero:>10} {p50:>9.2f}ms {worst:>9.2f}ms {count:>9} {exact}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="5,10,12,100,1000,5000", help="Comma-separated group sizes")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--exact-max", type=int, default=12, help="Also run the exact planner up to this many members with a balance")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    main([int(n) for n in args.sizes.split(",")], args.runs, args.exact_max, args.seed)
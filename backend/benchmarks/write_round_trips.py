@@ -0,0 +1,169 @@
+"""
+Compares the Mongo round trips of each mutating endpoint before and after
+write paths stopped re-reading the document they had just written.
+
+Each endpoint's write shape is replayed directly against MongoDB (no HTTP,
+no auth) so the numbers isolate database latency:
+
+    MONGO_DB_URL=mongodb://localhost:27017 python backend/benchmarks/write_round_trips.py --iterations 500
+
+Everything is written to a scratch database that is dropped afterwards.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import uuid
+from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+
+BENCH_DB = "bench_write_round_trips"
+
+
+def _new_user(username: str) -> dict:
+    return {"username": username, "email": f"{username}@example.com", "passwordHash": "x", "friends": [], "created_at": datetime.utcnow()}
+
+def _new_expense() -> dict:
+    return {"group_id": uuid.uuid4().hex, "amount": 42.0, "paid_by": "alice", "participants": ["alice", "bob"],
+            "description": "bench", "split": {}, "created_at": datetime.utcnow()}
+
+
+# --- one (before, after) pair per endpoint; each takes the db and a prepared doc id/name ---
+
+async def create_expense_before(db, _):
+    result = await db["expenses"].insert_one(_new_expense())
+    return await db["expenses"].find_one({"_id": result.inserted_id})
+
+async def create_expense_after(db, _):
+    doc = _new_expense()
+    result = await db["expenses"].insert_one(doc)
+    doc["_id"] = result.inserted_id
+    return doc
+
+async def update_split_before(db, expense_id):
+    await db["expenses"].update_one({"_id": expense_id}, {"$set": {"split": {"alice": 21.0, "bob": 21.0}}})
+    return await db["expenses"].find_one({"_id": expense_id})
+
+async def update_split_after(db, expense_id):
+    return await db["expenses"].find_one_and_update(
+        {"_id": expense_id}, {"$set": {"split": {"alice": 21.0, "bob": 21.0}}}, return_document=ReturnDocument.AFTER
+    )
+
+async def create_group_before(db, _):
+    result = await db["groups"].insert_one({"name": "bench", "members": ["alice"], "created_by": "alice", "created_at": datetime.utcnow()})
+    return await db["groups"].find_one({"_id": result.inserted_id})
+
+async def create_group_after(db, _):
+    doc = {"name": "bench", "members": ["alice"], "created_by": "alice", "created_at": datetime.utcnow()}
+    result = await db["groups"].insert_one(doc)
+    doc["_id"] = result.inserted_id
+    return doc
+
+async def add_members_before(db, group_id):
+    await db["groups"].update_one({"_id": group_id}, {"$addToSet": {"members": {"$each": ["bob", "carol"]}}})
+    return await db["groups"].find_one({"_id": group_id})
+
+async def add_members_after(db, group_id):
+    return await db["groups"].find_one_and_update(
+        {"_id": group_id}, {"$addToSet": {"members": {"$each": ["bob", "carol"]}}}, return_document=ReturnDocument.AFTER
+    )
+
+async def create_payment_before(db, _):
+    result = await db["payments"].insert_one({"payer": "alice", "payee": "bob", "amount": 10.0, "status": "requires_payment_method", "created_at": datetime.utcnow()})
+    return await db["payments"].find_one({"_id": result.inserted_id})
+
+async def create_payment_after(db, _):
+    doc = {"payer": "alice", "payee": "bob", "amount": 10.0, "status": "requires_payment_method", "created_at": datetime.utcnow()}
+    result = await db["payments"].insert_one(doc)
+    doc["_id"] = result.inserted_id
+    return doc
+
+async def confirm_payment_before(db, payment_id):
+    await db["payments"].update_one({"_id": payment_id}, {"$set": {"status": "succeeded", "completed_at": datetime.utcnow()}})
+    return await db["payments"].find_one({"_id": payment_id})
+
+async def confirm_payment_after(db, payment_id):
+    return await db["payments"].find_one_and_update(
+        {"_id": payment_id}, {"$set": {"status": "succeeded", "completed_at": datetime.utcnow()}}, return_document=ReturnDocument.AFTER
+    )
+
+async def signup_before(db, _):
+    username = uuid.uuid4().hex[:16]
+    await db["users"].find_one({"username": username})
+    await db["users"].find_one({"email": f"{username}@example.com"})
+    result = await db["users"].insert_one(_new_user(username))
+    return await db["users"].find_one({"_id": result.inserted_id})
+
+async def signup_after(db, _):
+    doc = _new_user(uuid.uuid4().hex[:16])
+    result = await db["users"].insert_one(doc)
+    doc["_id"] = result.inserted_id
+    return doc
+
+async def add_friend_before(db, username):
+    await db["users"].update_one({"username": username, "friends": {"$ne": "friend"}}, {"$addToSet": {"friends": "friend"}})
+    return await db["users"].find_one({"username": username})
+
+async def add_friend_after(db, username):
+    return await db["users"].find_one_and_update(
+        {"username": username}, {"$addToSet": {"friends": "friend"}}, projection={"friends": 1}, return_document=ReturnDocument.BEFORE
+    )
+
+ENDPOINTS = [
+    # (endpoint, before, after, fixture collection or None)
+    ("POST /expenses", create_expense_before, create_expense_after, None),
+    ("PATCH /expenses/{id}/split", update_split_before, update_split_after, "expenses"),
+    ("POST /groups", create_group_before, create_group_after, None),
+    ("POST /groups/{id}/members/add", add_members_before, add_members_after, "groups"),
+    ("POST /payments", create_payment_before, create_payment_after, None),
+    ("POST /payments/{id}/confirm", confirm_payment_before, confirm_payment_after, "payments"),
+    ("POST /auth/signup", signup_before, signup_after, None),
+    ("POST /users/friends/add", add_friend_before, add_friend_after, "users"),
+]
+
+async def _fixture(db, collection_name):
+    if collection_name is None:
+        return None
+    if collection_name == "users":
+        username = uuid.uuid4().hex[:16]
+        await db["users"].insert_one(_new_user(username))
+        return username
+    result = await db[collection_name].insert_one({"name": "fixture", "members": ["alice"], "split": {}, "status": "pending", "created_at": datetime.utcnow()})
+    return result.inserted_id
+
+async def _time(fn, db, arg, iterations: int) -> list:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await fn(db, arg)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+def _p(samples: list, q: float) -> float:
+    return statistics.quantiles(samples, n=100)[int(q) - 1]
+
+async def main(url: str, iterations: int):
+    client = AsyncIOMotorClient(url)
+    db = client[BENCH_DB]
+    try:
+        print(f"{'endpoint':32} {'before p50':>11} {'after p50':>10} {'before p95':>11} {'after p95':>10} {'saved':>7}")
+        for endpoint, before, after, fixture in ENDPOINTS:
+            arg = await _fixture(db, fixture)
+            await _time(after, db, arg, 10)  # warm the pool
+            before_ms = await _time(before, db, arg, iterations)
+            after_ms = await _time(after, db, arg, iterations)
+            saved = 1 - statistics.median(after_ms) / statistics.median(before_ms)
+            print(f"{endpoint:32} {statistics.median(before_ms):>9.2f}ms {statistics.median(after_ms):>8.2f}ms "
+                  f"{_p(before_ms, 95):>9.2f}ms {_p(after_ms, 95):>8.2f}ms {saved:>6.0%}")
+    finally:
+        await client.drop_database(BENCH_DB)
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=os.getenv("MONGO_DB_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.url, args.iterations))
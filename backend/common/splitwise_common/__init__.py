@@ -0,0 +1,5 @@
+# Code shared by the backend services.
+#
+# Each service image copies this package next to its own `app` package (see the
+# service Dockerfiles, which build with backend/ as the context), so it is imported as
+# `splitwise_common.x`. Outside Docker, put backend/common on PYTHONPATH.
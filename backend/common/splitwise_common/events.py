@@ -0,0 +1,29 @@
+# Payload builders for events published to the expense_events exchange, by expense_service
+# and ai_splitter_service alike. Consumers (ai_splitter_service, payment_service,
+# reporting_service) rely on these field names.
+
+def expense_created_event(expense: dict) -> dict:
+    return {
+        "expense_id": str(expense["_id"]),
+        "group_id": str(expense["group_id"]),
+        "amount": expense["amount"],
+        "paid_by": expense["paid_by"],
+        "participants": expense["participants"],
+        "description": expense["description"]
+    }
+
+def expense_split_changed_event(expense: dict, split: dict, split_version: int, deleted: bool = False) -> dict:
+    """
+    Current split of an expense after a change (an empty split when deleted).
+
+    The event carries the whole split, not a delta, and split_version grows with every
+    change to it, so consumers can drop duplicates and out-of-order deliveries.
+    """
+    return {
+        "expense_id": str(expense["_id"]),
+        "group_id": str(expense["group_id"]),
+        "paid_by": expense["paid_by"],
+        "split": split or {},
+        "split_version": split_version,
+        "deleted": deleted
+    }
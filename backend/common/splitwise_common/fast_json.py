@@ -0,0 +1,35 @@
+from datetime import datetime
+from typing import Iterable, Tuple
+import orjson
+from bson import ObjectId
+from fastapi.responses import Response
+
+# Opt-in fast path for read endpoints (FAST_JSON_RESPONSES=true).
+# Documents come straight from our own collections, so instead of copying them into
+# response models and letting FastAPI validate and serialize them again, they are
+# converted once and dumped with orjson. Field lists double as Mongo projections.
+
+def projection(fields: Tuple[str, ...]) -> dict:
+    return {field: 1 for field in fields if field != "id"}
+
+def to_jsonable(doc: dict, fields: Tuple[str, ...]) -> dict:
+    """Single pass over the projected fields: _id -> id, ObjectId -> str, datetime -> ISO string."""
+    out = {}
+    for field in fields:
+        value = doc.get("_id" if field == "id" else field)
+        if isinstance(value, ObjectId):
+            value = str(value)
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        out[field] = value
+    return out
+
+def to_jsonable_many(docs: Iterable[dict], fields: Tuple[str, ...]) -> list:
+    return [to_jsonable(doc, fields) for doc in docs]
+
+class FastJSONResponse(Response):
+    """JSON response for already-converted, trusted content; skips response_model validation."""
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
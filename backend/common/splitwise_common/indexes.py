@@ -0,0 +1,59 @@
+from pymongo.errors import OperationFailure
+
+# Applies a service's index registry and checks its hot queries with explain().
+#
+# Each service declares INDEXES ({collection: [IndexModel, ...]}) and HOT_QUERIES
+# ([(label, collection, filter, sort), ...]) in its app/core/indexes.py. ensure_indexes()
+# runs from the lifespan on every startup; create_indexes is idempotent for identical
+# specs, so restarts are cheap. Startup fails if a unique index is missing and cannot be
+# built (e.g. the data already has duplicates). Running a service's registry module
+# checks that none of its hot queries falls back to a collection scan:
+#   python -m app.core.indexes
+
+async def ensure_indexes(db, indexes: dict, service_name: str):
+    for collection_name, models in indexes.items():
+        try:
+            await db[collection_name].create_indexes(models)
+        except OperationFailure as e:
+            # e.g. duplicate data blocking an index. Unique indexes are the only thing keeping
+            # duplicates out (writes rely on DuplicateKeyError), so refuse to start without them.
+            existing = await db[collection_name].index_information()
+            missing = [m.document["name"] for m in models if m.document.get("unique") and m.document["name"] not in existing]
+            if missing:
+                raise RuntimeError(f"{service_name}: Unique index(es) {', '.join(missing)} on {collection_name} could not be created: {e}") from e
+            print(f"{service_name}: Could not create indexes on {collection_name}: {e}")
+
+def plan_stages(plan) -> list:
+    """Collects every 'stage' in an explain() plan tree."""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(plan_stages(item))
+    return stages
+
+async def check_hot_queries(db, hot_queries: list) -> bool:
+    ok = True
+    for label, collection_name, query, sort in hot_queries:
+        cursor = db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        stages = plan_stages(explain["queryPlanner"]["winningPlan"])
+        verdict = "COLLSCAN" if "COLLSCAN" in stages else "ok"
+        print(f"[{verdict}] {label}: {' -> '.join(stages)}")
+        ok = ok and verdict == "ok"
+    return ok
+
+async def run_check(mongo, indexes: dict, hot_queries: list) -> int:
+    """Entry point of `python -m app.core.indexes`; `mongo` is the service's MongoConnection."""
+    await mongo.connect()
+    try:
+        await ensure_indexes(mongo.db, indexes, mongo.service_name)
+        return 0 if await check_hot_queries(mongo.db, hot_queries) else 1
+    finally:
+        mongo.close()
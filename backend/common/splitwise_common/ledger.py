@@ -0,0 +1,60 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Optional
+from urllib.parse import unquote
+
+# Materialized per-group ledger, one document per group in `group_ledgers`:
+#
+#   {
+#     "_id": <group ObjectId>,
+#     "balances": {member: net_cents},        # > 0: the group owes them, < 0: they owe the group
+#     "pairs": {lo: {hi: cents}},             # lo < hi; > 0: hi owes lo, < 0: lo owes hi
+#     "updated_at": datetime
+#   }
+#
+# Amounts are integer cents so repeated $inc never drifts. Every change to an expense's
+# split applies (new split - old split) with a single $inc. expense_service (manual splits,
+# deletes) and ai_splitter_service (the splits it writes) both update ledgers through
+# this module; expense_service/app/core/ledger.py reads them and owns the rebuild command.
+
+LEDGER_COLLECTION = "group_ledgers"
+
+def to_cents(amount: float) -> int:
+    return int(round(amount * 100))
+
+def member_key(username: str) -> str:
+    # Usernames become field names; '.' and '$' are not allowed there
+    return username.replace("%", "%25").replace(".", "%2E").replace("$", "%24")
+
+def member_from_key(key: str) -> str:
+    return unquote(key)
+
+def ledger_delta(paid_by: str, split: Dict[str, float], sign: int = 1) -> Dict[str, int]:
+    """$inc document for adding (sign=1) or removing (sign=-1) one expense's split."""
+    inc = defaultdict(int)
+    for member, amount in split.items():
+        cents = sign * to_cents(amount)
+        if member == paid_by or not cents:
+            continue
+        inc[f"balances.{member_key(paid_by)}"] += cents
+        inc[f"balances.{member_key(member)}"] -= cents
+        lo, hi = sorted((paid_by, member))
+        inc[f"pairs.{member_key(lo)}.{member_key(hi)}"] += cents if lo == paid_by else -cents
+    return inc
+
+async def apply_split_change(db, group_id, paid_by: str, old_split: Optional[dict], new_split: Optional[dict], session=None):
+    """Moves a group's ledger from one expense's old split to its new one (None: no split)."""
+    inc = defaultdict(int)
+    for field, cents in ledger_delta(paid_by, new_split or {}, 1).items():
+        inc[field] += cents
+    for field, cents in ledger_delta(paid_by, old_split or {}, -1).items():
+        inc[field] += cents
+    inc = {field: cents for field, cents in inc.items() if cents}
+    if not inc:
+        return
+    await db[LEDGER_COLLECTION].update_one(
+        {"_id": group_id},
+        {"$inc": inc, "$set": {"updated_at": datetime.utcnow()}},
+        upsert=True,
+        session=session
+    )
@@ -0,0 +1,116 @@
+import sys
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+from pymongo.errors import ConnectionFailure
+
+# One pooled async Motor client per process. Each service wraps a MongoConnection in its
+# own app/core/database.py (connect_to_mongo, get_database, ...) with its settings.
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """
+    Counts connection pool events so each service can report how busy its
+    Mongo pool is. Listener callbacks run on driver threads; plain integer
+    increments are fine under the GIL.
+    """
+
+    def __init__(self):
+        self.connections_created = 0
+        self.connections_closed = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.checkout_failures = 0
+        self.pool_clears = 0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self.pool_clears += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self.connections_created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self.connections_closed += 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        self.checkouts += 1
+
+    def connection_checked_in(self, event):
+        self.checkins += 1
+
+    def snapshot(self) -> dict:
+        return {
+            "open_connections": self.connections_created - self.connections_closed,
+            "in_use": self.checkouts - self.checkins,
+            "connections_created": self.connections_created,
+            "connections_closed": self.connections_closed,
+            "checkouts": self.checkouts,
+            "checkout_failures": self.checkout_failures,
+            "pool_clears": self.pool_clears,
+        }
+
+
+class MongoConnection:
+    """
+    The process's Motor client, configured from a service's settings (MONGO_DB_URL and
+    the MONGO_* pool options). `service_name` prefixes its log lines.
+    """
+
+    def __init__(self, service_name: str, settings):
+        self.service_name = service_name
+        self.settings = settings
+        self.pool_metrics = PoolMetricsListener()
+        self.client = None
+        self.db = None
+        self.transactions_supported = False
+
+    async def connect(self):
+        settings = self.settings
+        try:
+            self.client = AsyncIOMotorClient(
+                settings.MONGO_DB_URL,
+                maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+                minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+                maxIdleTimeMS=settings.MONGO_MAX_IDLE_TIME_MS,
+                connectTimeoutMS=settings.MONGO_CONNECT_TIMEOUT_MS,
+                serverSelectionTimeoutMS=settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                socketTimeoutMS=settings.MONGO_SOCKET_TIMEOUT_MS,
+                event_listeners=[self.pool_metrics],
+            )
+            self.db = self.client.get_database()
+            hello = await self.client.admin.command('hello') # Fail fast if the server is unreachable
+            # Multi-document transactions need a replica set or a sharded cluster
+            self.transactions_supported = "setName" in hello or hello.get("msg") == "isdbgrid"
+            print(f"{self.service_name}: Connected to MongoDB at {settings.MONGO_DB_URL} (transactions: {self.transactions_supported})")
+        except ConnectionFailure as e:
+            print(f"{self.service_name}: Could not connect to MongoDB: {e}")
+            sys.exit(1)
+
+    def close(self):
+        if self.client:
+            self.client.close()
+            print(f"{self.service_name}: MongoDB connection closed.")
+
+    def metrics(self) -> dict:
+        return {
+            "max_pool_size": self.settings.MONGO_MAX_POOL_SIZE,
+            "min_pool_size": self.settings.MONGO_MIN_POOL_SIZE,
+            **self.pool_metrics.snapshot(),
+        }
@@ -0,0 +1,276 @@
+import asyncio
+import json
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import List
+from pymongo import ASCENDING, IndexModel, UpdateOne
+from pymongo.errors import BulkWriteError
+
+# Transactional outbox for domain events.
+#
+# Request handlers never talk to RabbitMQ: they write their events to the `outbox`
+# collection together with the change itself, and OutboxRelay publishes them in the
+# background through the service's confirmed EventPublisher. Delivery is at-least-once;
+# consumers must tolerate duplicates. Each service wires one relay up in its
+# app/core/outbox.py and starts it from the lifespan.
+
+OUTBOX_COLLECTION = "outbox"
+# Longest wait between publish attempts of one entry, and of the relay after an error
+MAX_RETRY_DELAY_SECONDS = 300
+
+def outbox_entry(exchange_name: str, routing_key: str, event: dict) -> dict:
+    return {
+        "exchange": exchange_name,
+        "routing_key": routing_key,
+        "event": event,
+        "status": "pending",
+        "attempts": 0,
+        "created_at": datetime.utcnow(),
+    }
+
+def outbox_indexes(retention_seconds: int) -> List[IndexModel]:
+    """Indexes for the service's index registry (app/core/indexes.py)."""
+    return [
+        # Relay claims pending entries oldest first
+        IndexModel([("status", ASCENDING), ("_id", ASCENDING)], name="status_id"),
+        # Sent entries are purged after the retention window; pending ones have no sent_at
+        IndexModel([("sent_at", ASCENDING)], name="sent_at_ttl", expireAfterSeconds=retention_seconds),
+    ]
+
+OUTBOX_HOT_QUERY = ("outbox relay claim", OUTBOX_COLLECTION, {"status": "pending"}, [("_id", ASCENDING)])
+
+@asynccontextmanager
+async def transaction(mongo):
+    """
+    Yields a session with an open transaction on `mongo` (a MongoConnection), or None on a
+    standalone server, where writes then happen one by one.
+    """
+    if not mongo.transactions_supported:
+        yield None
+        return
+    async with await mongo.client.start_session() as session:
+        async with session.start_transaction():
+            yield session
+
+async def enqueue(db, entries: List[dict], session=None):
+    """
+    Writes outbox entries for a change that is already stored (e.g. an update), in the
+    change's transaction when given its `session`. Without a transaction, a crash
+    before this write loses the event; consumers that keep derived state must offer a
+    rebuild (or expire it) for that case.
+
+    Any process sharing the database can enqueue; the owning service's relay publishes
+    the entries at its next poll.
+    """
+    await db[OUTBOX_COLLECTION].insert_many(entries, session=session)
+
+class OutboxRelay:
+    """
+    Background task that publishes pending outbox entries in batches.
+
+    Entries are claimed with a short lease so several service instances can run a relay
+    without publishing the same batch concurrently; a crashed instance's lease simply
+    expires. Publishes go through the shared EventPublisher and are broker-confirmed
+    before the entries are marked sent. An entry that fails to publish waits an
+    exponentially growing delay before its next attempt; after `max_attempts` it is
+    marked `failed` and left for an operator instead of being retried forever.
+
+    `mongo` is the service's MongoConnection and `publisher` its EventPublisher.
+    """
+
+    def __init__(self, mongo, publisher, batch_size: int, poll_interval: float, lease_seconds: float, max_attempts: int):
+        self.mongo = mongo
+        self.publisher = publisher
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.instance_id = uuid.uuid4().hex
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.relayed = 0
+        self.publish_failures = 0
+        self.failed = 0
+        self.relay_errors = 0
+        self.batches = 0
+
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        Module-level transaction() that also wakes the relay once the change is written.
+        Outbox entries written with the session are committed together with the change
+        they announce.
+        """
+        async with transaction(self.mongo) as session:
+            yield session
+        self.notify()
+
+    async def insert_with_outbox(self, db, collection_name: str, docs: List[dict], entries: List[dict]):
+        """
+        Inserts `docs` and their outbox `entries` (entries[i] is the event of docs[i])
+        atomically when the deployment supports transactions; a failed insert aborts the
+        whole transaction, so no event goes out without its document.
+
+        On a standalone server the outbox is written first, held back from the relay by a
+        lease: after the unordered insert the entries of documents that failed to insert are
+        deleted and the rest released. A crash in between leaves the lease to expire, so the
+        events are published anyway; one for a document that does not exist is ignored by
+        consumers, while a stored document's event is never lost.
+
+        insert_many sets `_id` on the given dicts. Raises BulkWriteError as insert_many does.
+        """
+        if self.mongo.transactions_supported:
+            async with self.transaction() as session:
+                await db[OUTBOX_COLLECTION].insert_many(entries, session=session)
+                await db[collection_name].insert_many(docs, ordered=False, session=session)
+            return
+
+        held_until = datetime.utcnow() + timedelta(seconds=self.lease_seconds)
+        for entry in entries:
+            entry["lease_until"] = held_until
+            entry["lease_owner"] = "insert"
+        await db[OUTBOX_COLLECTION].insert_many(entries)
+        failed = set()
+        try:
+            await db[collection_name].insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            failed = {err["index"] for err in e.details.get("writeErrors", [])}
+            raise
+        finally:
+            if failed:
+                await db[OUTBOX_COLLECTION].delete_many({"_id": {"$in": [entries[i]["_id"] for i in failed]}})
+            inserted = [entry["_id"] for i, entry in enumerate(entries) if i not in failed]
+            if inserted:
+                await db[OUTBOX_COLLECTION].update_many(
+                    {"_id": {"$in": inserted}, "lease_owner": "insert"},
+                    {"$unset": {"lease_until": "", "lease_owner": ""}}
+                )
+            self.notify()
+
+    async def enqueue(self, db, entries: List[dict], session=None):
+        """Module-level enqueue(); wakes the relay right away when not in a transaction."""
+        await enqueue(db, entries, session=session)
+        if session is None:
+            self.notify()
+
+    def notify(self):
+        """Wakes the relay right away instead of at the next poll."""
+        self._wakeup.set()
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def retry_delay(self, attempts: int) -> float:
+        return min(self.poll_interval * 2 ** attempts, MAX_RETRY_DELAY_SECONDS)
+
+    async def _run(self):
+        errors = 0
+        while True:
+            try:
+                claimed = await self.relay_once()
+                errors = 0
+            except Exception as e:
+                # Anything escaping relay_once (Mongo, the broker, a bug) must not end the
+                # task: the outbox would silently stop draining
+                self.relay_errors += 1
+                delay = self.retry_delay(errors)
+                errors += 1
+                print(f"{self.mongo.service_name}: Outbox relay error ({type(e).__name__}: {e}); retrying in {delay:g}s")
+                await asyncio.sleep(delay)
+                continue
+            if claimed < self.batch_size:
+                # Caught up; sleep until notified or the next poll
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def _claim_batch(self, db) -> List[dict]:
+        now = datetime.utcnow()
+        claimable = {"status": "pending", "$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}]}
+        candidates = await db[OUTBOX_COLLECTION].find(claimable, {"_id": 1}).sort("_id", 1).limit(self.batch_size).to_list(self.batch_size)
+        if not candidates:
+            return []
+        ids = [c["_id"] for c in candidates]
+        await db[OUTBOX_COLLECTION].update_many(
+            {"_id": {"$in": ids}, **claimable},
+            {"$set": {"lease_until": now + timedelta(seconds=self.lease_seconds), "lease_owner": self.instance_id}}
+        )
+        return await db[OUTBOX_COLLECTION].find(
+            {"_id": {"$in": ids}, "status": "pending", "lease_owner": self.instance_id}
+        ).sort("_id", 1).to_list(len(ids))
+
+    async def relay_once(self) -> int:
+        """Claims and publishes one batch. Returns the number of entries claimed."""
+        db = self.mongo.db
+        entries = await self._claim_batch(db)
+        if not entries:
+            return 0
+
+        async def publish(entry: dict):
+            # Serialized here so one bad event fails only its own entry
+            await self.publisher.publish(entry["exchange"], entry["routing_key"], json.dumps(entry["event"]))
+
+        results = await asyncio.gather(*(publish(e) for e in entries), return_exceptions=True)
+        sent_ids = [e["_id"] for e, r in zip(entries, results) if not isinstance(r, BaseException)]
+        failures = [(e, r) for e, r in zip(entries, results) if isinstance(r, BaseException)]
+
+        if sent_ids:
+            await db[OUTBOX_COLLECTION].update_many(
+                {"_id": {"$in": sent_ids}},
+                {"$set": {"status": "sent", "sent_at": datetime.utcnow()}, "$unset": {"lease_until": "", "lease_owner": ""}}
+            )
+        given_up = 0
+        if failures:
+            now = datetime.utcnow()
+            ops = []
+            for entry, error in failures:
+                attempts = entry.get("attempts", 0) + 1
+                last_error = f"{type(error).__name__}: {error}"[:1000]
+                if attempts >= self.max_attempts:
+                    given_up += 1
+                    update = {"$set": {"status": "failed", "attempts": attempts, "last_error": last_error, "failed_at": now},
+                              "$unset": {"lease_until": "", "lease_owner": ""}}
+                else:
+                    # The lease doubles as the backoff: nobody claims the entry before it ends
+                    update = {"$set": {"attempts": attempts, "last_error": last_error,
+                                       "lease_until": now + timedelta(seconds=self.retry_delay(attempts)), "lease_owner": "retry"}}
+                ops.append(UpdateOne({"_id": entry["_id"]}, update))
+            await db[OUTBOX_COLLECTION].bulk_write(ops, ordered=False)
+            print(f"{self.mongo.service_name}: {len(failures)} outbox entries not published "
+                  f"({given_up} marked failed after {self.max_attempts} attempts): {failures[0][1]}")
+
+        self.batches += 1
+        self.relayed += len(sent_ids)
+        self.publish_failures += len(failures)
+        self.failed += given_up
+        return len(entries)
+
+    async def metrics(self) -> dict:
+        oldest = await self.mongo.db[OUTBOX_COLLECTION].find_one({"status": "pending"}, {"created_at": 1}, sort=[("_id", 1)])
+        failed_entries = await self.mongo.db[OUTBOX_COLLECTION].count_documents({"status": "failed"})
+        return {
+            "relayed": self.relayed,
+            "publish_failures": self.publish_failures,
+            "failed": self.failed,
+            # Entries given up on, by any instance, still waiting for an operator
+            "failed_entries": failed_entries,
+            "relay_errors": self.relay_errors,
+            "batches": self.batches,
+            # How far behind the relay is: age of the oldest unpublished event
+            "oldest_pending_age_seconds": (
+                round((datetime.utcnow() - oldest["created_at"]).total_seconds(), 3) if oldest else 0.0
+            ),
+        }
@@ -0,0 +1,90 @@
+import asyncio
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable
+import aio_pika
+
+# Confirmed event publishing over a service's shared RabbitMQ channel. The channel must
+# be opened with publisher_confirms=True (see the services' app/core/rabbitmq.py).
+
+class PublishError(Exception):
+    """Raised when an event could not be handed to the broker."""
+
+class EventPublisher:
+    """
+    Publishes events over the shared channel with publisher confirms.
+
+    Exchanges are declared once and cached; the robust channel re-declares them after a
+    reconnect. Each publish awaits its own broker confirm, but up to `max_in_flight`
+    publishes may be outstanding at once, so concurrent publishers (e.g. a gathered
+    batch) pipeline their confirms instead of paying one round trip after another.
+    """
+
+    def __init__(self, max_in_flight: int, get_channel: Callable):
+        self.max_in_flight = max_in_flight
+        self.get_channel = get_channel # The service's current channel (None until connected)
+        self._window = asyncio.Semaphore(max_in_flight)
+        self._exchanges = {}
+        self._declare_lock = asyncio.Lock()
+        self._unconfirmed = {} # publish token -> monotonic start time
+        self._latencies_ms = deque(maxlen=2048)
+        self.published = 0
+        self.failed = 0
+
+    async def _get_exchange(self, exchange_name: str):
+        exchange = self._exchanges.get(exchange_name)
+        if exchange is None:
+            async with self._declare_lock:
+                exchange = self._exchanges.get(exchange_name)
+                if exchange is None:
+                    exchange = await self.get_channel().declare_exchange(exchange_name, aio_pika.ExchangeType.TOPIC, durable=True)
+                    self._exchanges[exchange_name] = exchange
+        return exchange
+
+    async def publish(self, exchange_name: str, routing_key: str, message: str):
+        if not self.get_channel():
+            self.failed += 1
+            raise PublishError("RabbitMQ channel not available")
+
+        exchange = await self._get_exchange(exchange_name)
+        async with self._window:
+            token = object()
+            started = time.monotonic()
+            self._unconfirmed[token] = started
+            try:
+                await exchange.publish(
+                    aio_pika.Message(
+                        body=message.encode(),
+                        content_type="application/json",
+                        delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                        timestamp=datetime.now(timezone.utc)
+                    ),
+                    routing_key=routing_key
+                )
+            except Exception as e:
+                self.failed += 1
+                raise PublishError(f"Publish to {exchange_name} [{routing_key}] failed: {e}") from e
+            finally:
+                del self._unconfirmed[token]
+            self._latencies_ms.append((time.monotonic() - started) * 1000)
+            self.published += 1
+
+    def metrics(self) -> dict:
+        latencies = sorted(self._latencies_ms)
+        now = time.monotonic()
+        oldest = min(self._unconfirmed.values(), default=None)
+
+        def percentile(q: float) -> float:
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 3) if latencies else 0.0
+
+        return {
+            "published": self.published,
+            "failed": self.failed,
+            "in_flight": len(self._unconfirmed),
+            "max_in_flight": self.max_in_flight,
+            "publish_latency_ms_p50": percentile(0.50),
+            "publish_latency_ms_p99": percentile(0.99),
+            # Age of the oldest publish still waiting for its broker confirm
+            "confirm_lag_ms": round((now - oldest) * 1000, 3) if oldest is not None else 0.0,
+        }
@@ -0,0 +1,108 @@
+from datetime import datetime, timezone
+from typing import Callable, List
+import aio_pika
+
+# Retry and dead-letter topology for a consumed queue `q`:
+#
+#   q.retry.<delay>ms   one queue per backoff step, with x-message-ttl = delay and
+#                       dead-lettering back to `q` through the default exchange
+#   q.dlq               messages that failed permanently or ran out of attempts
+#
+# A failed message is re-published to the retry queue for its attempt and then acked,
+# so it waits outside `q` and never holds up fresh messages. Per-queue TTLs (rather than
+# per-message ones) keep a long delay from blocking shorter ones behind it. The attempt
+# count travels in the x-attempt header. Nothing is added to `q`'s own arguments, so
+# existing queues keep working. Each consuming service builds its policy in its own
+# modules (ai_splitter_service/app/core/retry.py, payment_service/app/core/balances.py).
+
+ATTEMPT_HEADER = "x-attempt"
+
+class PermanentFailure(Exception):
+    """A message that can never succeed (e.g. malformed); it goes straight to the DLQ."""
+
+def backoff_delays(base_seconds: float, factor: float, max_attempts: int) -> List[float]:
+    """Delay before retry 1, 2, ... (max_attempts - 1 retries in total)."""
+    return [base_seconds * factor ** i for i in range(max(max_attempts - 1, 0))]
+
+def retry_queue_name(queue_name: str, delay_seconds: float) -> str:
+    return f"{queue_name}.retry.{int(delay_seconds * 1000)}ms"
+
+def dead_letter_queue_name(queue_name: str) -> str:
+    return f"{queue_name}.dlq"
+
+class RetryPolicy:
+    """
+    Retries and dead-letters the messages of one queue. `get_channel` returns the
+    service's current channel (None until connected); `service_name` prefixes the logs.
+    """
+
+    def __init__(self, queue_name: str, delays: List[float], get_channel: Callable, service_name: str):
+        self.queue_name = queue_name
+        self.delays = delays
+        self.get_channel = get_channel
+        self.service_name = service_name
+        self.max_attempts = len(delays) + 1
+        self.retried = 0
+        self.dead_lettered = 0
+
+    async def declare(self):
+        for delay in self.delays:
+            await self.get_channel().declare_queue(
+                retry_queue_name(self.queue_name, delay),
+                durable=True,
+                arguments={
+                    "x-message-ttl": int(delay * 1000),
+                    "x-dead-letter-exchange": "",
+                    "x-dead-letter-routing-key": self.queue_name,
+                }
+            )
+        await self.get_channel().declare_queue(dead_letter_queue_name(self.queue_name), durable=True)
+
+    @staticmethod
+    def attempt(message: aio_pika.IncomingMessage) -> int:
+        """1 for the first delivery, 2 for the first retry, ..."""
+        return int((message.headers or {}).get(ATTEMPT_HEADER, 0)) + 1
+
+    async def _republish(self, message: aio_pika.IncomingMessage, routing_key: str, headers: dict):
+        # Publisher confirms are on (aio-pika's default), so the copy is stored before the original is acked
+        await self.get_channel().default_exchange.publish(
+            aio_pika.Message(
+                body=message.body,
+                headers={**(message.headers or {}), **headers},
+                content_type=message.content_type,
+                delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                timestamp=message.timestamp,
+            ),
+            routing_key=routing_key
+        )
+
+    async def handle_failure(self, message: aio_pika.IncomingMessage, error: Exception, permanent: bool = False):
+        """Schedules a retry, or dead-letters the message; acks the original either way."""
+        attempt = self.attempt(message)
+        try:
+            if permanent or attempt >= self.max_attempts:
+                await self._republish(message, dead_letter_queue_name(self.queue_name), {
+                    ATTEMPT_HEADER: attempt,
+                    "x-error": f"{type(error).__name__}: {error}"[:1000],
+                    "x-failed-at": datetime.now(timezone.utc).isoformat(),
+                })
+                self.dead_lettered += 1
+                print(f"{self.service_name}: dead-lettered message after attempt {attempt}: {error}")
+            else:
+                delay = self.delays[attempt - 1]
+                await self._republish(message, retry_queue_name(self.queue_name, delay), {ATTEMPT_HEADER: attempt})
+                self.retried += 1
+                print(f"{self.service_name}: attempt {attempt} failed ({error}); retrying in {delay:g}s.")
+        except Exception as e:
+            # Could not park it anywhere; let the broker redeliver it instead
+            print(f"{self.service_name}: could not schedule retry, requeueing: {e}")
+            await message.nack(requeue=True)
+            return
+        await message.ack()
+
+    def stats(self) -> dict:
+        return {
+            "max_attempts": self.max_attempts,
+            "retried": self.retried,
+            "dead_lettered": self.dead_lettered,
+        }
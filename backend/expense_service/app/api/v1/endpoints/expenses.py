@@ -1,9 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from app.core.config import settings
 from app.core.database import get_database
-from app.core.rabbitmq import publish_message
+from app.core.bulk_import import BulkImportReport, LineTooLong, iter_rows, flush_chunk
+from splitwise_common.events import expense_created_event, expense_split_changed_event
+from splitwise_common.fast_json import FastJSONResponse, projection, to_jsonable, to_jsonable_many
+from app.core.ledger import LEDGER_COLLECTION, apply_split_change, ledger_balances_cents, ledger_view
+from app.core.membership_cache import get_group_members
+from app.core.outbox import enqueue, insert_with_outbox, outbox_entry, outbox_relay
+from app.core.settlement import settle
+from app.core.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, KEYSET_SORT, encode_cursor, keyset_filter
 from app.models.expense import ExpenseInDB
-from app.schemas.expense import ExpenseCreate, ExpenseResponse, ExpenseUpdateSplit
+from app.schemas.expense import ExpenseCreate, ExpenseResponse, ExpenseUpdateSplit, BulkImportResult, GroupBalances, GroupSettlement, GroupDebt
+from pydantic import ValidationError
 
 # REMOVE THESE TWO LINES:
 # from app.api.v1.endpoints.auth import get_current_user # Re-use get_current_user
@@ -14,34 +24,48 @@ from app.core.security import get_current_user # <--- Correct import from local
 from app.schemas.auth import CurrentUser      # <--- Correct import from local schemas/auth.py
 
 from bson import ObjectId
+from pymongo import ReturnDocument
 import json
+import orjson
 
 
 router = APIRouter()
 
-@router.post("/expenses", response_model=ExpenseResponse, status_code=status.HTTP_201_CREATED)
-async def create_expense(expense_data: ExpenseCreate, current_user: CurrentUser = Depends(get_current_user)):
-    db = get_database()
+# Documents pulled from Mongo per round trip when streaming NDJSON
+STREAM_BATCH_SIZE = 500
+
+EXPENSE_FIELDS = ("id", "group_id", "amount", "paid_by", "participants", "description", "split", "created_at")
+EXPENSE_PROJECTION = projection(EXPENSE_FIELDS)
+
+def _expense_to_dict(exp: dict) -> dict:
+    return to_jsonable(exp, EXPENSE_FIELDS)
 
+async def _authorize_new_expense(db, expense_data: ExpenseCreate, current_user: CurrentUser):
+    """Raises HTTPException unless the user and all participants belong to the expense's group."""
     if not ObjectId.is_valid(expense_data.group_id):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid Group ID format.")
 
     # Verify group exists and current user is a member
-    group_doc = await db["groups"].find_one({"_id": ObjectId(expense_data.group_id)})
-    if not group_doc:
+    members = await get_group_members(db, ObjectId(expense_data.group_id))
+    if members is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Group not found.")
     
-    if current_user.username not in group_doc["members"]:
+    if current_user.username not in members:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are not a member of this group.")
 
     # Verify all participants are members of the group
-    if not all(p in group_doc["members"] for p in expense_data.participants):
-        non_members = [p for p in expense_data.participants if p not in group_doc["members"]]
+    if not all(p in members for p in expense_data.participants):
+        non_members = [p for p in expense_data.participants if p not in members]
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, 
             detail=f"Some participants are not members of the group: {', '.join(non_members)}"
         )
 
+@router.post("/expenses", response_model=ExpenseResponse, status_code=status.HTTP_201_CREATED)
+async def create_expense(expense_data: ExpenseCreate, current_user: CurrentUser = Depends(get_current_user)):
+    db = get_database()
+    await _authorize_new_expense(db, expense_data, current_user)
+
     # Initially, split is empty. AI Splitter will fill this.
     expense_in_db = ExpenseInDB(
         group_id=ObjectId(expense_data.group_id),
@@ -52,22 +76,15 @@ async def create_expense(expense_data: ExpenseCreate, current_user: CurrentUser
         split={} # Initialize empty, AI will update
     )
 
-    result = await db["expenses"].insert_one(expense_in_db.dict(by_alias=True))
-    created_expense = await db["expenses"].find_one({"_id": result.inserted_id})
-    
-    # Publish event to RabbitMQ for AI Splitter
-    expense_event_data = {
-        "expense_id": str(created_expense["_id"]),
-        "group_id": str(created_expense["group_id"]),
-        "amount": created_expense["amount"],
-        "paid_by": created_expense["paid_by"],
-        "participants": created_expense["participants"],
-        "description": created_expense["description"]
-    }
-    await publish_message(
-        exchange_name="expense_events",
-        routing_key="expense.created",
-        message=json.dumps(expense_event_data)
+    # The inserted document is already final; no need to read it back.
+    # The _id is assigned up front so the expense.created event can be written with it.
+    created_expense = expense_in_db.dict(by_alias=True)
+    created_expense["_id"] = ObjectId()
+
+    # The AI Splitter's event goes to the outbox with the expense; the relay publishes it
+    await insert_with_outbox(
+        db, "expenses", [created_expense],
+        [outbox_entry("expense_events", "expense.created", expense_created_event(created_expense))]
     )
 
     return ExpenseResponse(
@@ -81,6 +98,71 @@ async def create_expense(expense_data: ExpenseCreate, current_user: CurrentUser
         created_at=created_expense["created_at"].isoformat()
     )
 
+@router.post("/expenses/bulk", response_model=BulkImportResult)
+async def bulk_import_expenses(request: Request, current_user: CurrentUser = Depends(get_current_user)):
+    """
+    Imports many expenses paid by the current user from a CSV (`text/csv`) or NDJSON
+    (`application/x-ndjson`) request body. The body is parsed as it streams in and written
+    with unordered insert_many in chunks, each with its expense.created outbox entries.
+    Rows that fail validation or insertion are reported individually. A line longer than
+    BULK_IMPORT_MAX_LINE_BYTES stops the import with 413; rows before it stay imported.
+    """
+    content_type = request.headers.get("content-type", "")
+    if "csv" in content_type:
+        fmt = "csv"
+    elif "ndjson" in content_type or "jsonl" in content_type:
+        fmt = "ndjson"
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Send the import as text/csv or application/x-ndjson."
+        )
+
+    db = get_database()
+    report = BulkImportReport(max_reported_errors=settings.BULK_IMPORT_MAX_REPORTED_ERRORS)
+    docs: List[dict] = []
+    row_numbers: List[int] = []
+
+    try:
+        async for row_number, row in iter_rows(request.stream(), fmt, settings.BULK_IMPORT_MAX_LINE_BYTES):
+            report.received += 1
+            if isinstance(row, Exception):
+                report.add_error(row_number, f"Could not parse row: {row}")
+                continue
+            try:
+                expense_data = ExpenseCreate(**row)
+                # Member sets come from the membership cache, so each group is looked up once
+                await _authorize_new_expense(db, expense_data, current_user)
+            except ValidationError as e:
+                report.add_error(row_number, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+                continue
+            except HTTPException as e:
+                report.add_error(row_number, e.detail)
+                continue
+
+            docs.append(ExpenseInDB(
+                group_id=ObjectId(expense_data.group_id),
+                amount=expense_data.amount,
+                paid_by=current_user.username,
+                participants=expense_data.participants,
+                description=expense_data.description,
+                split={}
+            ).dict(by_alias=True))
+            row_numbers.append(row_number)
+
+            if len(docs) >= settings.BULK_IMPORT_CHUNK_SIZE:
+                await flush_chunk(db, docs, row_numbers, report)
+    except LineTooLong as e:
+        await flush_chunk(db, docs, row_numbers, report)
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"A line after {report.received} row(s) is longer than {e.max_line_bytes} bytes; "
+                   f"the {report.inserted} expense(s) before it were imported."
+        )
+
+    await flush_chunk(db, docs, row_numbers, report)
+    return report.result()
+
 @router.get("/expenses/{expense_id}", response_model=ExpenseResponse)
 async def get_expense_details(expense_id: str, current_user: CurrentUser = Depends(get_current_user)):
     db = get_database()
@@ -88,15 +170,18 @@ async def get_expense_details(expense_id: str, current_user: CurrentUser = Depen
     if not ObjectId.is_valid(expense_id):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid Expense ID format.")
 
-    expense = await db["expenses"].find_one({"_id": ObjectId(expense_id)})
+    expense = await db["expenses"].find_one({"_id": ObjectId(expense_id)}, EXPENSE_PROJECTION)
     if not expense:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Expense not found.")
     
     # Verify user is part of the group associated with the expense
-    group_doc = await db["groups"].find_one({"_id": expense["group_id"]})
-    if not group_doc or current_user.username not in group_doc["members"]:
+    members = await get_group_members(db, expense["group_id"])
+    if members is None or current_user.username not in members:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You do not have access to this expense.")
 
+    if settings.FAST_JSON_RESPONSES:
+        return FastJSONResponse(_expense_to_dict(expense))
+
     return ExpenseResponse(
         id=str(expense["_id"]),
         group_id=str(expense["group_id"]),
@@ -109,94 +194,224 @@ async def get_expense_details(expense_id: str, current_user: CurrentUser = Depen
     )
 
 @router.get("/groups/{group_id}/expenses", response_model=List[ExpenseResponse])
-async def get_group_expenses(group_id: str, current_user: CurrentUser = Depends(get_current_user)):
+async def get_group_expenses(
+    group_id: str,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    stream: bool = False,
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    Lists a group's expenses newest first.
+
+    Paginated mode returns at most `limit` expenses and, when more remain, the cursor for
+    the next page in the `X-Next-Cursor` header (pass it back as `after`).
+    With `stream=true` the expenses are sent as NDJSON straight off the Mongo cursor;
+    `limit` is then optional and no page is buffered in memory.
+    """
     db = get_database()
 
     if not ObjectId.is_valid(group_id):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid Group ID format.")
 
-    group_doc = await db["groups"].find_one({"_id": ObjectId(group_id)})
-    if not group_doc:
+    members = await get_group_members(db, ObjectId(group_id))
+    if members is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Group not found.")
 
-    if current_user.username not in group_doc["members"]:
+    if current_user.username not in members:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are not a member of this group.")
 
-    expenses = await db["expenses"].find({"group_id": ObjectId(group_id)}).sort("created_at", -1).to_list(None)
-
-    return [
-        ExpenseResponse(
-            id=str(exp["_id"]),
-            group_id=str(exp["group_id"]),
-            amount=exp["amount"],
-            paid_by=exp["paid_by"],
-            participants=exp["participants"],
-            description=exp["description"],
-            split=exp["split"],
-            created_at=exp["created_at"].isoformat()
-        ) for exp in expenses
-    ]
+    try:
+        query = {"group_id": ObjectId(group_id), **keyset_filter(after)}
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    if stream:
+        cursor = db["expenses"].find(query, EXPENSE_PROJECTION).sort(KEYSET_SORT).batch_size(STREAM_BATCH_SIZE)
+        if limit:
+            cursor = cursor.limit(limit)
+
+        async def ndjson_lines():
+            async for exp in cursor:
+                if settings.FAST_JSON_RESPONSES:
+                    yield orjson.dumps(_expense_to_dict(exp)) + b"\n"
+                else:
+                    yield json.dumps(_expense_to_dict(exp)) + "\n"
+
+        return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+    page_size = limit or DEFAULT_PAGE_SIZE
+    # Fetch one extra document to learn whether another page exists
+    expenses = await db["expenses"].find(query, EXPENSE_PROJECTION).sort(KEYSET_SORT).limit(page_size + 1).to_list(page_size + 1)
+    headers = {}
+    if len(expenses) > page_size:
+        expenses = expenses[:page_size]
+        headers["X-Next-Cursor"] = encode_cursor(expenses[-1])
+
+    if settings.FAST_JSON_RESPONSES:
+        return FastJSONResponse(to_jsonable_many(expenses, EXPENSE_FIELDS), headers=headers)
+
+    response.headers.update(headers)
+
+    return [ExpenseResponse(**_expense_to_dict(exp)) for exp in expenses]
+
+async def _raise_split_rejected(db, expense_id: ObjectId, split: dict, current_user: CurrentUser):
+    """Reads the expense a guarded split update did not match and raises the reason."""
+    expense = await db["expenses"].find_one({"_id": expense_id}, {"paid_by": 1, "participants": 1})
+    if not expense:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Expense not found.")
+    if expense["paid_by"] != current_user.username:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are not authorized to update this expense's split.")
+    if not all(p in expense["participants"] for p in split):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Split includes non-participants.")
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Total split amount does not match expense amount.")
 
 @router.patch("/expenses/{expense_id}/split", response_model=ExpenseResponse)
 async def update_expense_split(expense_id: str, split_data: ExpenseUpdateSplit, current_user: CurrentUser = Depends(get_current_user)):
+    """
+    Replaces an expense's split. The split, the group ledger and the expense.split_changed
+    outbox entry are written in one transaction, so none of them can change without the others.
+    """
     db = get_database()
     
     if not ObjectId.is_valid(expense_id):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid Expense ID format.")
 
-    expense = await db["expenses"].find_one({"_id": ObjectId(expense_id)})
-    if not expense:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Expense not found.")
-    
-    # Only the user who created the expense or an admin could manually adjust the split (for simplicity, creator only)
-    if expense["paid_by"] != current_user.username:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are not authorized to update this expense's split.")
-    
-    # Ensure all participants in the new split are part of the expense's original participants
-    if not all(p in expense["participants"] for p in split_data.split.keys()):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Split includes non-participants.")
+    # The checks live in the filter, so a valid update needs no read first: only the payer
+    # (creator) may change the split, every member of it must be a participant and the
+    # total must match the amount (allowing for small floating point errors)
+    total = sum(split_data.split.values())
+    guard = {
+        "_id": ObjectId(expense_id),
+        "paid_by": current_user.username,
+        "amount": {"$gte": total - 0.01, "$lte": total + 0.01},
+    }
+    if split_data.split:
+        guard["participants"] = {"$all": list(split_data.split)}
 
-    # Ensure total amount in split matches expense amount (allowing for small floating point errors)
-    if abs(sum(split_data.split.values()) - expense["amount"]) > 0.01:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Total split amount does not match expense amount.")
+    async with outbox_relay.transaction() as session:
+        # BEFORE gives the split actually replaced, even if the AI splitter wrote one meanwhile
+        previous_expense = await db["expenses"].find_one_and_update(
+            guard,
+            {"$set": {"split": split_data.split}, "$inc": {"split_version": 1}},
+            return_document=ReturnDocument.BEFORE,
+            session=session
+        )
+        if previous_expense is not None:
+            if previous_expense["split"] == split_data.split:
+                # Aborts the transaction; without one only split_version moved on
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No changes made to expense split.")
 
-    update_result = await db["expenses"].update_one(
-        {"_id": ObjectId(expense_id)},
-        {"$set": {"split": split_data.split}}
-    )
+            await apply_split_change(
+                db, previous_expense["group_id"], previous_expense["paid_by"], previous_expense["split"], split_data.split,
+                session=session
+            )
+            # Payment Service keeps cross-group pair balances from these events
+            await enqueue(db, [outbox_entry("expense_events", "expense.split_changed", expense_split_changed_event(
+                previous_expense, split_data.split, previous_expense.get("split_version", 0) + 1
+            ))], session=session)
 
-    if update_result.modified_count == 0:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No changes made to expense split or expense not found.")
+    if previous_expense is None:
+        await _raise_split_rejected(db, ObjectId(expense_id), split_data.split, current_user)
 
-    updated_expense = await db["expenses"].find_one({"_id": ObjectId(expense_id)})
     return ExpenseResponse(
-        id=str(updated_expense["_id"]),
-        group_id=str(updated_expense["group_id"]),
-        amount=updated_expense["amount"],
-        paid_by=updated_expense["paid_by"],
-        participants=updated_expense["participants"],
-        description=updated_expense["description"],
-        split=updated_expense["split"],
-        created_at=updated_expense["created_at"].isoformat()
+        id=str(previous_expense["_id"]),
+        group_id=str(previous_expense["group_id"]),
+        amount=previous_expense["amount"],
+        paid_by=previous_expense["paid_by"],
+        participants=previous_expense["participants"],
+        description=previous_expense["description"],
+        split=split_data.split,
+        created_at=previous_expense["created_at"].isoformat()
     )
 
 @router.delete("/expenses/{expense_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_expense(expense_id: str, current_user: CurrentUser = Depends(get_current_user)):
+    """Deletes an expense together with its share of the group ledger, announcing it through the outbox."""
     db = get_database()
     
     if not ObjectId.is_valid(expense_id):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid Expense ID format.")
 
-    expense = await db["expenses"].find_one({"_id": ObjectId(expense_id)})
-    if not expense:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Expense not found.")
-    
-    # Only the user who paid for the expense can delete it
-    if expense["paid_by"] != current_user.username:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are not authorized to delete this expense.")
+    async with outbox_relay.transaction() as session:
+        # Only the user who paid for the expense can delete it
+        deleted_expense = await db["expenses"].find_one_and_delete(
+            {"_id": ObjectId(expense_id), "paid_by": current_user.username},
+            projection={"group_id": 1, "paid_by": 1, "split": 1, "split_version": 1},
+            session=session
+        )
+        if deleted_expense is not None:
+            await apply_split_change(
+                db, deleted_expense["group_id"], deleted_expense["paid_by"], deleted_expense.get("split"), None,
+                session=session
+            )
+            await enqueue(db, [outbox_entry("expense_events", "expense.split_changed", expense_split_changed_event(
+                deleted_expense, {}, deleted_expense.get("split_version", 0) + 1, deleted=True
+            ))], session=session)
 
-    delete_result = await db["expenses"].delete_one({"_id": ObjectId(expense_id)})
-    if delete_result.deleted_count == 0:
+    if deleted_expense is None:
+        if await db["expenses"].find_one({"_id": ObjectId(expense_id)}, {"_id": 1}):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are not authorized to delete this expense.")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Expense not found.")
     
-    return {} # No content for 204
\ No newline at end of file
+    return {} # No content for 204
+
+@router.get("/groups/{group_id}/balances", response_model=GroupBalances)
+async def get_group_balances(group_id: str, current_user: CurrentUser = Depends(get_current_user)):
+    """
+    Net balance per member and who owes whom, read from the group's materialized ledger
+    (app/core/ledger.py) instead of aggregating its expenses.
+    """
+    db = get_database()
+
+    if not ObjectId.is_valid(group_id):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid Group ID format.")
+
+    members = await get_group_members(db, ObjectId(group_id))
+    if members is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Group not found.")
+
+    if current_user.username not in members:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are not a member of this group.")
+
+    ledger = await db[LEDGER_COLLECTION].find_one({"_id": ObjectId(group_id)})
+    return GroupBalances(group_id=group_id, **ledger_view(ledger))
+
+
+@router.get("/groups/{group_id}/settlement", response_model=GroupSettlement)
+async def get_group_settlement(
+    group_id: str,
+    mode: str = Query("auto", regex="^(auto|greedy|exact)$"),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    Transfers that settle the group, planned from its ledger balances (app/core/settlement.py).
+    mode=exact gives the fewest transfers but is limited to small groups; greedy scales to
+    thousands of members and needs at most n - 1 transfers for n members with a balance;
+    auto picks exact when the group is small enough.
+    """
+    db = get_database()
+
+    if not ObjectId.is_valid(group_id):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid Group ID format.")
+
+    members = await get_group_members(db, ObjectId(group_id))
+    if members is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Group not found.")
+
+    if current_user.username not in members:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are not a member of this group.")
+
+    ledger = await db[LEDGER_COLLECTION].find_one({"_id": ObjectId(group_id)}, {"balances": 1})
+    try:
+        used_mode, transfers = settle(ledger_balances_cents(ledger), mode, settings.SETTLEMENT_EXACT_MAX_MEMBERS)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    return GroupSettlement(
+        group_id=group_id,
+        mode=used_mode,
+        transfer_count=len(transfers),
+        transfers=[GroupDebt(from_user=debtor, to_user=creditor, amount=cents / 100) for debtor, creditor, cents in transfers]
+    )
\ No newline at end of file
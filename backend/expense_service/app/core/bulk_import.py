@@ -0,0 +1,122 @@
+import csv
+import json
+from typing import AsyncIterator, List, Tuple, Union
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from app.core.database import supports_transactions
+from splitwise_common.events import expense_created_event
+from app.core.outbox import insert_with_outbox, outbox_entry
+from app.schemas.expense import BulkImportResult, BulkRowError
+
+# Streaming parsers and chunked writer for POST /expenses/bulk.
+# Only the current line and one insert chunk are held in memory at a time.
+
+CSV_PARTICIPANT_SEPARATOR = ";"
+
+class LineTooLong(ValueError):
+    def __init__(self, max_line_bytes: int):
+        super().__init__(f"line exceeds {max_line_bytes} bytes")
+        self.max_line_bytes = max_line_bytes
+
+class BulkImportReport:
+    def __init__(self, max_reported_errors: int):
+        self.max_reported_errors = max_reported_errors
+        self.received = 0
+        self.inserted = 0
+        self.failed = 0
+        self.errors: List[BulkRowError] = []
+
+    def add_error(self, row: int, error: str):
+        self.failed += 1
+        if len(self.errors) < self.max_reported_errors:
+            self.errors.append(BulkRowError(row=row, error=error))
+
+    def result(self) -> BulkImportResult:
+        return BulkImportResult(
+            received=self.received,
+            inserted=self.inserted,
+            failed=self.failed,
+            errors=self.errors,
+            errors_truncated=self.failed > len(self.errors)
+        )
+
+async def iter_lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[bytes]:
+    """
+    Splits the body into undecoded lines; raises LineTooLong as soon as one grows past
+    max_line_bytes. Decoding is left to iter_rows so a bad line only fails its own row.
+    """
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if len(line) > max_line_bytes:
+                raise LineTooLong(max_line_bytes)
+            yield line.rstrip(b"\r")
+        if len(buffer) > max_line_bytes:
+            raise LineTooLong(max_line_bytes)
+    if buffer:
+        yield buffer.rstrip(b"\r")
+
+async def iter_rows(chunks: AsyncIterator[bytes], fmt: str, max_line_bytes: int) -> AsyncIterator[Tuple[int, Union[dict, Exception]]]:
+    """
+    Yields (row_number, row) pairs, or (row_number, exception) for rows that cannot be parsed.
+
+    CSV needs a header row with group_id, amount, participants and description columns;
+    participants are separated by ';'. Quoted fields may not span lines.
+    NDJSON rows are objects with the same fields, participants as a list.
+    Lines must be UTF-8; a line that is not is reported as an unparseable row. Lines longer than max_line_bytes abort the stream with LineTooLong.
+    """
+    header = None
+    row_number = 0
+    async for line in iter_lines(chunks, max_line_bytes):
+        if not line.strip():
+            continue
+        if fmt == "csv" and header is None:
+            # Undecodable column names simply match no field, so every row reports what is missing
+            header_line = line.decode("utf-8", errors="replace").lstrip("\ufeff")
+            header = [column.strip() for column in next(csv.reader([header_line]))]
+            continue
+
+        row_number += 1
+        try:
+            line = line.decode("utf-8")
+            if fmt == "csv":
+                row = dict(zip(header, next(csv.reader([line]))))
+                row["participants"] = [
+                    p.strip() for p in row.get("participants", "").split(CSV_PARTICIPANT_SEPARATOR) if p.strip()
+                ]
+            else:
+                row = json.loads(line)
+                if not isinstance(row, dict):
+                    raise ValueError("expected a JSON object")
+        except (ValueError, csv.Error) as e:
+            yield row_number, e
+            continue
+        yield row_number, row
+
+async def flush_chunk(db, docs: List[dict], row_numbers: List[int], report: BulkImportReport):
+    """Inserts one chunk unordered together with its expense.created outbox entries and records per-row failures."""
+    if not docs:
+        return
+
+    for doc in docs:
+        doc["_id"] = ObjectId()
+    entries = [outbox_entry("expense_events", "expense.created", expense_created_event(doc)) for doc in docs]
+
+    failed = {}
+    try:
+        await insert_with_outbox(db, "expenses", docs, entries)
+    except BulkWriteError as e:
+        if supports_transactions():
+            # The transaction was aborted, so nothing from this chunk was written
+            failed = {index: e.details.get("writeErrors", [{}])[0].get("errmsg", "write error") for index in range(len(docs))}
+        else:
+            failed = {err["index"]: err.get("errmsg", "write error") for err in e.details.get("writeErrors", [])}
+
+    for index, message in failed.items():
+        report.add_error(row_numbers[index], f"Insert failed: {message}")
+    report.inserted += len(docs) - len(failed)
+
+    docs.clear()
+    row_numbers.clear()
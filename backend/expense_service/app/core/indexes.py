@@ -0,0 +1,37 @@
+import asyncio
+import sys
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from app.core.config import settings
+from bson import ObjectId
+from splitwise_common import indexes as registry
+from splitwise_common.outbox import OUTBOX_HOT_QUERY, outbox_indexes
+from app.core.database import mongo
+
+# Index registry for Expense Service, applied by splitwise_common/indexes.py on every startup.
+# Running this module checks that every hot query below is served by an index:
+#   python -m app.core.indexes
+
+INDEXES = {
+    "expenses": [
+        # Keyset pagination of a group's expenses, newest first
+        IndexModel([("group_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="group_created_at"),
+        # The AI splitter's backfill (ai_splitter_service/app/backfill.py) walks unsplit
+        # expenses oldest first; the filter on `split` is applied while fetching, but the
+        # sort comes from the index instead of a blocking in-memory sort
+        IndexModel([("created_at", ASCENDING), ("_id", ASCENDING)], name="created_at_id"),
+    ],
+    "outbox": outbox_indexes(settings.OUTBOX_RETENTION_SECONDS),
+}
+
+HOT_QUERIES = [
+    # (label, collection, filter, sort)
+    ("group expenses page", "expenses", {"group_id": ObjectId()}, [("created_at", DESCENDING), ("_id", DESCENDING)]),
+    ("backfill of unsplit expenses", "expenses", {"split": {"$in": [{}, None]}}, [("created_at", ASCENDING), ("_id", ASCENDING)]),
+    OUTBOX_HOT_QUERY,
+]
+
+async def ensure_indexes(db):
+    await registry.ensure_indexes(db, INDEXES, mongo.service_name)
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(registry.run_check(mongo, INDEXES, HOT_QUERIES)))
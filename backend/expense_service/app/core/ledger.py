@@ -0,0 +1,101 @@
+import argparse
+import asyncio
+import sys
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Optional
+from bson import ObjectId
+from splitwise_common.ledger import (  # noqa: F401 (re-exported)
+    LEDGER_COLLECTION, apply_split_change, ledger_delta, member_from_key,
+)
+from app.core.database import connect_to_mongo, close_mongo_connection, get_database
+
+# Reads of the materialized per-group ledgers and their rebuild. The document layout and
+# the incremental updates live in splitwise_common/ledger.py, shared with the AI splitter.
+# The rebuild command below recomputes ledgers from the expenses themselves.
+#
+#   python -m app.core.ledger rebuild [--group-id <id>]
+
+def ledger_view(ledger: Optional[dict]) -> dict:
+    """Decodes a ledger document into member balances and pairwise debts (in currency units)."""
+    ledger = ledger or {}
+    balances = {member_from_key(k): cents / 100 for k, cents in ledger.get("balances", {}).items() if cents}
+    debts = []
+    for lo_key, row in ledger.get("pairs", {}).items():
+        for hi_key, cents in row.items():
+            if cents > 0:
+                debts.append({"from_user": member_from_key(hi_key), "to_user": member_from_key(lo_key), "amount": cents / 100})
+            elif cents < 0:
+                debts.append({"from_user": member_from_key(lo_key), "to_user": member_from_key(hi_key), "amount": -cents / 100})
+    return {"balances": balances, "debts": debts}
+
+def ledger_balances_cents(ledger: Optional[dict]) -> Dict[str, int]:
+    """Member -> net balance in cents (> 0: the group owes them), zero balances left out."""
+    return {member_from_key(k): cents for k, cents in (ledger or {}).get("balances", {}).items() if cents}
+
+async def rebuild(db, group_id: Optional[ObjectId] = None) -> int:
+    """
+    Recomputes ledgers from scratch by streaming expenses grouped by group_id.
+    Ledgers of groups that no longer have any expenses are deleted.
+    Writes racing with a rebuild can be lost for the group being rebuilt; run it when
+    the splitter is idle or re-run it for the affected group.
+    """
+    query = {"group_id": group_id} if group_id else {}
+    started = datetime.utcnow()
+    cursor = db["expenses"].find(query, {"group_id": 1, "paid_by": 1, "split": 1}).sort("group_id", 1)
+
+    rebuilt = 0
+    current_group, totals = None, defaultdict(int)
+
+    async def flush():
+        nonlocal rebuilt
+        if current_group is None:
+            return
+        doc = {"balances": {}, "pairs": {}, "updated_at": datetime.utcnow()}
+        for field, cents in totals.items():
+            if not cents:
+                continue
+            parts = field.split(".")
+            if parts[0] == "balances":
+                doc["balances"][parts[1]] = cents
+            else:
+                doc["pairs"].setdefault(parts[1], {})[parts[2]] = cents
+        await db[LEDGER_COLLECTION].replace_one({"_id": current_group}, doc, upsert=True)
+        rebuilt += 1
+
+    async for expense in cursor:
+        if expense["group_id"] != current_group:
+            await flush()
+            current_group, totals = expense["group_id"], defaultdict(int)
+        for field, cents in ledger_delta(expense["paid_by"], expense.get("split") or {}).items():
+            totals[field] += cents
+    await flush()
+
+    # Every ledger written above (or by a racing $inc) carries updated_at >= started;
+    # anything older belongs to a group whose expenses are all gone.
+    stale = {"updated_at": {"$lt": started}}
+    if group_id:
+        stale["_id"] = group_id
+    await db[LEDGER_COLLECTION].delete_many(stale)
+    return rebuilt
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description="Maintain the materialized group ledgers.")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--group-id", help="Only rebuild this group's ledger")
+    args = parser.parse_args()
+
+    if args.group_id and not ObjectId.is_valid(args.group_id):
+        print(f"Invalid group id: {args.group_id}")
+        return 2
+
+    await connect_to_mongo()
+    try:
+        count = await rebuild(get_database(), ObjectId(args.group_id) if args.group_id else None)
+        print(f"Rebuilt {count} group ledger(s).")
+        return 0
+    finally:
+        close_mongo_connection()
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,81 @@
+import time
+from collections import OrderedDict
+from typing import FrozenSet, Optional
+from bson import ObjectId
+from app.core.config import settings
+
+class MembershipCache:
+    """
+    Bounded LRU of group_id -> member set with a per-entry TTL.
+
+    Entries are dropped early when group_service publishes a membership change,
+    so the TTL only bounds staleness if an invalidation event is missed.
+    """
+
+    def __init__(self, max_groups: int, ttl_seconds: float):
+        self.max_groups = max_groups
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, group_id: str) -> Optional[FrozenSet[str]]:
+        entry = self._entries.get(group_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, members = entry
+        if expires_at < time.monotonic():
+            del self._entries[group_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(group_id)
+        self.hits += 1
+        return members
+
+    def put(self, group_id: str, members) -> FrozenSet[str]:
+        members = frozenset(members)
+        self._entries[group_id] = (time.monotonic() + self.ttl_seconds, members)
+        self._entries.move_to_end(group_id)
+        while len(self._entries) > self.max_groups:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return members
+
+    def invalidate(self, group_id: str):
+        if self._entries.pop(group_id, None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_groups": self.max_groups,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+membership_cache = MembershipCache(
+    max_groups=settings.MEMBERSHIP_CACHE_MAX_GROUPS,
+    ttl_seconds=settings.MEMBERSHIP_CACHE_TTL_SECONDS,
+)
+
+async def get_group_members(db, group_id: ObjectId) -> Optional[FrozenSet[str]]:
+    """Returns the group's member set, or None if the group does not exist."""
+    members = membership_cache.get(str(group_id))
+    if members is not None:
+        return members
+
+    group_doc = await db["groups"].find_one({"_id": group_id}, {"members": 1})
+    if not group_doc:
+        return None
+    return membership_cache.put(str(group_id), group_doc.get("members", []))
@@ -0,0 +1,22 @@
+from typing import List
+from splitwise_common.outbox import OutboxRelay, outbox_entry  # noqa: F401 (re-exported)
+from app.core.config import settings
+from app.core.database import mongo
+from app.core.rabbitmq import publisher
+
+# Expense events go through the shared transactional outbox (splitwise_common/outbox.py).
+
+outbox_relay = OutboxRelay(
+    mongo,
+    publisher,
+    batch_size=settings.OUTBOX_BATCH_SIZE,
+    poll_interval=settings.OUTBOX_POLL_INTERVAL_SECONDS,
+    lease_seconds=settings.OUTBOX_LEASE_SECONDS,
+    max_attempts=settings.OUTBOX_MAX_ATTEMPTS,
+)
+
+async def insert_with_outbox(db, collection_name: str, docs: List[dict], entries: List[dict]):
+    await outbox_relay.insert_with_outbox(db, collection_name, docs, entries)
+
+async def enqueue(db, entries: List[dict], session=None):
+    await outbox_relay.enqueue(db, entries, session=session)
@@ -0,0 +1,39 @@
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+from bson import ObjectId
+
+# Keyset pagination over (created_at, _id), newest first.
+# The cursor is an opaque token so clients never build it themselves.
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+KEYSET_SORT = [("created_at", -1), ("_id", -1)]
+
+def encode_cursor(doc: dict) -> str:
+    raw = f"{doc['created_at'].isoformat()}|{doc['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    """Raises ValueError if the cursor was not produced by encode_cursor."""
+    try:
+        created_at_raw, oid_raw = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        created_at = datetime.fromisoformat(created_at_raw)
+    except Exception:
+        raise ValueError("Malformed pagination cursor")
+    if not ObjectId.is_valid(oid_raw):
+        raise ValueError("Malformed pagination cursor")
+    return created_at, ObjectId(oid_raw)
+
+def keyset_filter(after: Optional[str]) -> dict:
+    """Filter selecting documents that sort strictly after the given cursor."""
+    if not after:
+        return {}
+    created_at, oid = decode_cursor(after)
+    return {
+        "$or": [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": oid}},
+        ]
+    }
@@ -1,5 +1,6 @@
 import aio_pika
 import asyncio
+from splitwise_common.publisher import EventPublisher
 from app.core.config import settings
 
 connection = None
@@ -12,7 +13,7 @@ async def connect_to_rabbitmq(retries: int = 10, delay: int = 5):
         try:
             print(f"[RabbitMQ] Attempt {attempt} to connect to {settings.RABBITMQ_URL}")
             connection = await aio_pika.connect_robust(settings.RABBITMQ_URL)
-            channel = await connection.channel()
+            channel = await connection.channel(publisher_confirms=True)
             print(f"[RabbitMQ] ✅ Connected to RabbitMQ at {settings.RABBITMQ_URL}")
             return
         except aio_pika.exceptions.AMQPConnectionError as e:
@@ -28,14 +29,24 @@ async def close_rabbitmq_connection():
         await connection.close()
         print("[RabbitMQ] 🔒 Connection closed.")
 
+publisher = EventPublisher(max_in_flight=settings.RABBITMQ_PUBLISH_MAX_IN_FLIGHT, get_channel=lambda: channel)
+
 async def publish_message(exchange_name: str, routing_key: str, message: str):
+    await publisher.publish(exchange_name, routing_key, message)
+
+async def consume_group_events(callback):
+    """
+    Subscribes this process to group membership events.
+
+    Each service instance keeps its own membership cache, so the queue is
+    exclusive and server-named: every instance receives every event.
+    """
     if not channel:
-        print("[RabbitMQ] ⚠️ Channel not available. Message not published.")
+        print("[RabbitMQ] ⚠️ Channel not available. Not subscribing to group events.")
         return
 
-    exchange = await channel.declare_exchange(exchange_name, aio_pika.ExchangeType.TOPIC, durable=True)
-    await exchange.publish(
-        aio_pika.Message(body=message.encode()),
-        routing_key=routing_key
-    )
-    print(f"[RabbitMQ] 📤 Published to {exchange_name} [{routing_key}]: {message}")
+    exchange = await channel.declare_exchange("group_events", aio_pika.ExchangeType.TOPIC, durable=True)
+    queue = await channel.declare_queue(exclusive=True, auto_delete=True)
+    await queue.bind(exchange, "group.#")
+    await queue.consume(callback)
+    print("[RabbitMQ] 📥 Subscribed to group_events [group.#]")
@@ -0,0 +1,108 @@
+import heapq
+from typing import Dict, List, Tuple
+
+# Settle-up plans: who pays whom so every member of a group ends at zero.
+#
+# Input is the group's net balances in integer cents (> 0: the group owes them), which
+# always sum to zero. Two planners:
+#
+#   greedy_settlement  pairs exactly opposite balances, then repeatedly matches the
+#                      largest creditor with the largest debtor using two heaps.
+#                      O(n log n) and at most n - 1 transfers.
+#   exact_settlement   the fewest possible transfers. That is n minus the largest number
+#                      of disjoint zero-sum subsets the members can be split into, found
+#                      with a DP over subsets, so it is only usable for small groups.
+
+Transfer = Tuple[str, str, int] # (from_user, to_user, cents)
+
+def greedy_settlement(balances: Dict[str, int]) -> List[Transfer]:
+    transfers = []
+
+    # A debtor and a creditor with exactly opposite balances settle in one transfer that
+    # closes both; pairing them first is free and often saves transfers later
+    waiting = {} # cents -> creditors not yet paired
+    for user, cents in sorted(balances.items()):
+        if cents > 0:
+            waiting.setdefault(cents, []).append(user)
+    paired = set()
+    for user, cents in sorted(balances.items()):
+        if cents < 0 and waiting.get(-cents):
+            creditor = waiting[-cents].pop()
+            transfers.append((user, creditor, -cents))
+            paired.update((user, creditor))
+
+    # Max-heaps via negated amounts; names break ties so plans are deterministic
+    creditors = [(-cents, user) for user, cents in balances.items() if cents > 0 and user not in paired]
+    debtors = [(cents, user) for user, cents in balances.items() if cents < 0 and user not in paired]
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+
+    while creditors and debtors:
+        credit, creditor = heapq.heappop(creditors)
+        debt, debtor = heapq.heappop(debtors)
+        amount = min(-credit, -debt)
+        transfers.append((debtor, creditor, amount))
+        if -credit > amount:
+            heapq.heappush(creditors, (credit + amount, creditor))
+        if -debt > amount:
+            heapq.heappush(debtors, (debt + amount, debtor))
+    return transfers
+
+def exact_settlement(balances: Dict[str, int]) -> List[Transfer]:
+    """Minimum-transfer plan; O(2^n * n) for n members with a non-zero balance."""
+    users = sorted(user for user, cents in balances.items() if cents)
+    n = len(users)
+    if n == 0:
+        return []
+    amounts = [balances[user] for user in users]
+
+    full = (1 << n) - 1
+    sums = [0] * (full + 1)
+    # best[mask]: most zero-sum groups the members in mask can be split into
+    best = [0] * (full + 1)
+    for mask in range(1, full + 1):
+        low = mask & -mask
+        sums[mask] = sums[mask ^ low] + amounts[low.bit_length() - 1]
+        top = 0
+        rest = mask
+        while rest:
+            bit = rest & -rest
+            if best[mask ^ bit] > top:
+                top = best[mask ^ bit]
+            rest ^= bit
+        best[mask] = top + (sums[mask] == 0)
+
+    # Walk back from the full set; each zero-sum mask on the way closes one group
+    groups = []
+    mask, closed = full, full
+    while mask:
+        rest = mask
+        while rest:
+            bit = rest & -rest
+            if best[mask ^ bit] == best[mask] - (sums[mask] == 0):
+                break
+            rest ^= bit
+        mask ^= bit
+        if sums[mask] == 0:
+            groups.append(closed ^ mask)
+            closed = mask
+
+    # Within a group that has no smaller zero-sum part, greedy needs exactly size - 1 transfers
+    transfers = []
+    for group in groups:
+        transfers.extend(greedy_settlement({users[i]: amounts[i] for i in range(n) if group >> i & 1}))
+    return transfers
+
+def settle(balances: Dict[str, int], mode: str, exact_max_members: int) -> Tuple[str, List[Transfer]]:
+    """
+    Plans transfers with `mode` "greedy", "exact" or "auto" (exact when at most
+    exact_max_members have a non-zero balance). Returns the mode used and the plan.
+    """
+    if sum(balances.values()) != 0:
+        raise ValueError("Balances must sum to zero")
+    nonzero = sum(1 for cents in balances.values() if cents)
+    if mode == "exact" and nonzero > exact_max_members:
+        raise ValueError(f"Exact settlement is limited to {exact_max_members} members with a balance; this group has {nonzero}")
+    if mode == "exact" or (mode == "auto" and nonzero <= exact_max_members):
+        return "exact", exact_settlement(balances)
+    return "greedy", greedy_settlement(balances)
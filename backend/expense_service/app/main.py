@@ -1,14 +1,34 @@
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
-from app.core.database import connect_to_mongo, close_mongo_connection
-from app.core.rabbitmq import connect_to_rabbitmq, close_rabbitmq_connection
+from app.core.database import connect_to_mongo, close_mongo_connection, get_database, get_pool_metrics
+from app.core.indexes import ensure_indexes
+from app.core.rabbitmq import connect_to_rabbitmq, close_rabbitmq_connection, consume_group_events, publisher
+from app.core.membership_cache import membership_cache
+from app.core.outbox import outbox_relay
 from app.api.v1.endpoints import expenses
+import aio_pika
+import json
+
+async def on_group_event(message: aio_pika.IncomingMessage):
+    async with message.process():
+        try:
+            event_data = json.loads(message.body.decode())
+        except json.JSONDecodeError:
+            print("Expense Service: Received malformed group event.")
+            return
+        group_id = event_data.get("group_id")
+        if group_id:
+            membership_cache.invalidate(group_id)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await connect_to_rabbitmq() # Connect RabbitMQ before app startup
-    connect_to_mongo()
+    await connect_to_mongo()
+    await ensure_indexes(get_database())
+    await consume_group_events(on_group_event) # Keeps the membership cache fresh
+    await outbox_relay.start() # Publishes expense events written to the outbox
     yield
+    await outbox_relay.stop()
     close_mongo_connection()
     await close_rabbitmq_connection() # Close RabbitMQ after app shutdown
 
@@ -23,4 +43,14 @@ app.include_router(expenses.router, prefix="/expenses", tags=["Expenses"])
 
 @app.get("/health")
 async def health_check():
-    return {"status": "ok", "service": "Expense Service"}
\ No newline at end of file
+    return {"status": "ok", "service": "Expense Service"}
+
+@app.get("/metrics")
+async def metrics():
+    return {
+        "service": "Expense Service",
+        "mongo_pool": get_pool_metrics(),
+        "membership_cache": membership_cache.stats(),
+        "publisher": publisher.metrics(),
+        "outbox": await outbox_relay.metrics(),
+    }
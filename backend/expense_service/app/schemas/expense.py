@@ -19,4 +19,32 @@ class ExpenseResponse(BaseModel):
     created_at: str
 
 class ExpenseUpdateSplit(BaseModel):
-    split: Dict[str, float]
\ No newline at end of file
+    split: Dict[str, float]
+
+class BulkRowError(BaseModel):
+    row: int # 1-based data row (CSV header excluded)
+    error: str
+
+class BulkImportResult(BaseModel):
+    received: int
+    inserted: int
+    failed: int
+    errors: List[BulkRowError]
+    errors_truncated: bool = False # True when more rows failed than are listed in errors
+
+class GroupDebt(BaseModel):
+    from_user: str
+    to_user: str
+    amount: float
+
+class GroupBalances(BaseModel):
+    group_id: str
+    balances: Dict[str, float] # username -> net amount; positive means the group owes them
+    debts: List[GroupDebt]
+
+
+class GroupSettlement(BaseModel):
+    group_id: str
+    mode: str # "exact" (fewest transfers) or "greedy"
+    transfer_count: int
+    transfers: List[GroupDebt]
\ No newline at end of file
@@ -0,0 +1,60 @@
+import asyncio
+import pytest
+from app.core.bulk_import import LineTooLong, iter_lines, iter_rows
+
+async def stream(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+def collect(agen):
+    async def run():
+        return [item async for item in agen]
+    return asyncio.run(run())
+
+def test_lines_split_across_chunks():
+    lines = collect(iter_lines(stream(b"ab", b"c\r\nde", b"f\n", b"gh"), max_line_bytes=16))
+    assert lines == [b"abc", b"def", b"gh"]
+
+def test_line_at_the_limit_is_accepted():
+    assert collect(iter_lines(stream(b"x" * 8 + b"\n"), max_line_bytes=8)) == [b"x" * 8]
+
+def test_long_complete_line_is_rejected():
+    with pytest.raises(LineTooLong):
+        collect(iter_lines(stream(b"ok\n" + b"x" * 9 + b"\n"), max_line_bytes=8))
+
+def test_unterminated_line_is_rejected_before_the_body_ends():
+    chunks_read = 0
+
+    async def endless():
+        nonlocal chunks_read
+        while True:
+            chunks_read += 1
+            yield b"x" * 4
+
+    with pytest.raises(LineTooLong):
+        collect(iter_lines(endless(), max_line_bytes=10))
+    assert chunks_read == 3
+
+def test_rows_stop_at_the_long_line():
+    rows = []
+
+    async def run():
+        body = stream(b'{"amount": 1}\n', b'{"amount": 2}\n', b"[" * 64 + b"\n")
+        async for row in iter_rows(body, "ndjson", max_line_bytes=32):
+            rows.append(row)
+
+    with pytest.raises(LineTooLong):
+        asyncio.run(run())
+    assert rows == [(1, {"amount": 1}), (2, {"amount": 2})]
+
+def test_csv_rows_use_the_header():
+    body = stream(b"\xef\xbb\xbfgroup_id,amount,participants,description\r\n", b"g1,12.5,a; b,lunch\n\n")
+    assert collect(iter_rows(body, "csv", max_line_bytes=128)) == [
+        (1, {"group_id": "g1", "amount": "12.5", "participants": ["a", "b"], "description": "lunch"})
+    ]
+
+def test_invalid_utf8_fails_only_its_row():
+    body = stream(b"group_id,amount,participants,description\n", b"g1,5,a,caf\xe9\n", b"g2,7,b,tea\n")
+    rows = collect(iter_rows(body, "csv", max_line_bytes=128))
+    assert rows[0][0] == 1 and isinstance(rows[0][1], UnicodeDecodeError)
+    assert rows[1] == (2, {"group_id": "g2", "amount": "7", "participants": ["b"], "description": "tea"})
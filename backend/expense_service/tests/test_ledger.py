@@ -0,0 +1,33 @@
+from collections import Counter
+from app.core.ledger import ledger_balances_cents, ledger_view
+from splitwise_common.ledger import ledger_delta, member_from_key, member_key
+
+def as_document(inc):
+    doc = {"balances": {}, "pairs": {}}
+    for field, cents in inc.items():
+        parts = field.split(".")
+        if parts[0] == "balances":
+            doc["balances"][parts[1]] = cents
+        else:
+            doc["pairs"].setdefault(parts[1], {})[parts[2]] = cents
+    return doc
+
+def test_awkward_usernames_round_trip():
+    for name in ["a.b", "$x", "100%", "p%2Eq"]:
+        assert "." not in member_key(name) and "$" not in member_key(name)
+        assert member_from_key(member_key(name)) == name
+
+def test_adding_then_removing_a_split_cancels_out():
+    split = {"alice": 10.0, "bob.smith": 12.34, "carol": 7.66}
+    total = Counter(ledger_delta("alice", split))
+    total.update(ledger_delta("alice", split, sign=-1))
+    assert not any(total.values())
+
+def test_view_of_one_expense():
+    doc = as_document(ledger_delta("alice", {"alice": 10.0, "bob.smith": 12.34, "carol": 7.66}))
+    assert ledger_balances_cents(doc) == {"alice": 2000, "bob.smith": -1234, "carol": -766}
+    view = ledger_view(doc)
+    assert sorted(view["debts"], key=lambda d: d["from_user"]) == [
+        {"from_user": "bob.smith", "to_user": "alice", "amount": 12.34},
+        {"from_user": "carol", "to_user": "alice", "amount": 7.66},
+    ]
@@ -0,0 +1,91 @@
+import asyncio
+from splitwise_common.outbox import OutboxRelay, outbox_entry
+
+class FakeOutbox:
+    def __init__(self):
+        self.update_many_calls = []
+        self.bulk_ops = []
+
+    async def update_many(self, filter, update):
+        self.update_many_calls.append((filter, update))
+
+    async def bulk_write(self, ops, ordered=True):
+        self.bulk_ops.extend(ops)
+
+class FakeMongo:
+    service_name = "Test Service"
+
+    def __init__(self):
+        self.outbox = FakeOutbox()
+        self.db = {"outbox": self.outbox}
+
+class FakePublisher:
+    def __init__(self, fail_keys=()):
+        self.fail_keys = set(fail_keys)
+        self.published = []
+
+    async def publish(self, exchange, routing_key, body):
+        if routing_key in self.fail_keys:
+            raise ConnectionError("broker unavailable")
+        self.published.append(routing_key)
+
+def make_relay(entries, publisher, max_attempts=3):
+    relay = OutboxRelay(FakeMongo(), publisher, batch_size=10, poll_interval=1, lease_seconds=30, max_attempts=max_attempts)
+
+    async def claim(db):
+        return entries
+    relay._claim_batch = claim
+    return relay
+
+def entry(_id, routing_key, attempts=0, event=None):
+    e = outbox_entry("expense_events", routing_key, event if event is not None else {"id": _id})
+    e.update(_id=_id, attempts=attempts)
+    return e
+
+def test_failed_publish_backs_off_then_gives_up():
+    entries = [entry(1, "ok"), entry(2, "down"), entry(3, "down", attempts=2)]
+    relay = make_relay(entries, FakePublisher(fail_keys={"down"}))
+    assert asyncio.run(relay.relay_once()) == 3
+
+    [(sent_filter, _)] = relay.mongo.outbox.update_many_calls
+    assert sent_filter == {"_id": {"$in": [1]}}
+    retry, given_up = [op._doc["$set"] for op in relay.mongo.outbox.bulk_ops]
+    assert retry["attempts"] == 1 and retry["lease_owner"] == "retry" and "status" not in retry
+    assert "ConnectionError" in retry["last_error"]
+    assert given_up["status"] == "failed" and given_up["attempts"] == 3
+    assert (relay.relayed, relay.publish_failures, relay.failed) == (1, 2, 1)
+
+def test_unserializable_event_fails_only_its_entry():
+    entries = [entry(1, "ok"), entry(2, "ok", event={"at": object()})]
+    relay = make_relay(entries, FakePublisher())
+    asyncio.run(relay.relay_once())
+    assert relay.publisher.published == ["ok"]
+    assert [op._filter for op in relay.mongo.outbox.bulk_ops] == [{"_id": 2}]
+
+def test_retry_delay_is_capped():
+    relay = make_relay([], FakePublisher())
+    assert relay.retry_delay(0) == 1
+    assert relay.retry_delay(3) == 8
+    assert relay.retry_delay(30) == 300
+
+def test_run_survives_unexpected_errors():
+    relay = make_relay([], FakePublisher())
+    relay.poll_interval = 0.001
+    calls = []
+
+    async def relay_once():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("boom")
+        if len(calls) == 3:
+            raise asyncio.CancelledError()
+        return 0
+    relay.relay_once = relay_once
+
+    async def run():
+        try:
+            await relay._run()
+        except asyncio.CancelledError:
+            pass
+    asyncio.run(run())
+    assert len(calls) == 3 and relay.relay_errors == 1
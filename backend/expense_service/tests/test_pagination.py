@@ -0,0 +1,44 @@
+import random
+from datetime import datetime, timedelta
+import pytest
+from bson import ObjectId
+from app.core.pagination import decode_cursor, encode_cursor, keyset_filter
+
+def matches(doc, query):
+    """Evaluates the two filter shapes keyset_filter produces."""
+    if not query:
+        return True
+    for clause in query["$or"]:
+        created_at = clause["created_at"]
+        if isinstance(created_at, dict):
+            if doc["created_at"] < created_at["$lt"]:
+                return True
+        elif doc["created_at"] == created_at and doc["_id"] < clause["_id"]["$lt"]:
+            return True
+    return False
+
+def test_cursor_round_trip():
+    doc = {"created_at": datetime(2024, 5, 1, 12, 30, 15, 123000), "_id": ObjectId()}
+    assert decode_cursor(encode_cursor(doc)) == (doc["created_at"], doc["_id"])
+
+@pytest.mark.parametrize("cursor", ["", "not base64!", "bm9waXBl", encode_cursor({"created_at": datetime(2024, 1, 1), "_id": "x"})])
+def test_malformed_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+def test_pages_visit_every_document_once_in_order():
+    rng = random.Random(2)
+    start = datetime(2024, 1, 1)
+    # Few distinct timestamps so many documents tie on created_at
+    docs = [{"created_at": start + timedelta(seconds=rng.randint(0, 5)), "_id": ObjectId()} for _ in range(97)]
+    ordered = sorted(docs, key=lambda d: (d["created_at"], d["_id"]), reverse=True)
+
+    seen, after = [], None
+    while True:
+        query = keyset_filter(after)
+        page = [doc for doc in ordered if matches(doc, query)][:10]
+        if not page:
+            break
+        seen.extend(page)
+        after = encode_cursor(page[-1])
+    assert seen == ordered
@@ -0,0 +1,70 @@
+import itertools
+import random
+import pytest
+from app.core.settlement import exact_settlement, greedy_settlement, settle
+
+def random_balances(rng, members):
+    balances = {f"u{i}": rng.randint(-5000, 5000) for i in range(members - 1)}
+    balances[f"u{members - 1}"] = -sum(balances.values())
+    return balances
+
+def apply(balances, transfers):
+    left = dict(balances)
+    for debtor, creditor, cents in transfers:
+        assert cents > 0
+        left[debtor] += cents
+        left[creditor] -= cents
+    return left
+
+def fewest_transfers(balances):
+    """n minus the most disjoint zero-sum groups, by trying every partition."""
+    amounts = [cents for cents in balances.values() if cents]
+
+    def most_groups(rest):
+        if not rest:
+            return 0
+        first, others = rest[0], rest[1:]
+        best = 0
+        for size in range(len(others) + 1):
+            for picked in itertools.combinations(range(len(others)), size):
+                if first + sum(others[i] for i in picked) == 0:
+                    remaining = [a for i, a in enumerate(others) if i not in picked]
+                    best = max(best, 1 + most_groups(remaining))
+        return best
+
+    return len(amounts) - most_groups(amounts)
+
+@pytest.mark.parametrize("planner", [greedy_settlement, exact_settlement])
+def test_plans_settle_every_balance(planner):
+    rng = random.Random(22)
+    for _ in range(300):
+        balances = random_balances(rng, rng.randint(1, 9))
+        transfers = planner(balances)
+        assert all(cents == 0 for cents in apply(balances, transfers).values())
+        assert len(transfers) <= max(sum(1 for c in balances.values() if c) - 1, 0)
+
+def test_exact_uses_the_fewest_transfers():
+    rng = random.Random(17)
+    for _ in range(200):
+        # Small amounts so zero-sum subsets are common
+        balances = {f"u{i}": rng.randint(-4, 4) for i in range(rng.randint(2, 7))}
+        balances["last"] = -sum(balances.values())
+        assert len(exact_settlement(balances)) == fewest_transfers(balances)
+
+def test_greedy_pairs_opposite_balances_first():
+    balances = {"a": 500, "b": -500, "c": 300, "d": -200, "e": -100}
+    transfers = greedy_settlement(balances)
+    assert ("b", "a", 500) in transfers
+    assert len(transfers) == 3
+
+def test_settle_picks_the_mode():
+    balances = {"a": 100, "b": -100}
+    assert settle(balances, "auto", exact_max_members=2)[0] == "exact"
+    assert settle({**balances, "c": 1, "d": -1}, "auto", exact_max_members=2)[0] == "greedy"
+    assert settle(balances, "greedy", exact_max_members=2) == ("greedy", [("b", "a", 100)])
+
+def test_settle_rejects_bad_input():
+    with pytest.raises(ValueError):
+        settle({"a": 100, "b": -99}, "auto", exact_max_members=10)
+    with pytest.raises(ValueError):
+        settle({"a": 1, "b": 1, "c": -2}, "exact", exact_max_members=2)
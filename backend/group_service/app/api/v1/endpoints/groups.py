@@ -1,6 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from typing import List, Optional # Added Optional as it might be used in schemas/models
+from app.core.config import settings
 from app.core.database import get_database
+from splitwise_common.fast_json import FastJSONResponse, projection, to_jsonable, to_jsonable_many
+from app.core.outbox import outbox_relay
+from splitwise_common.outbox import outbox_entry
 from app.models.group import GroupInDB
 from app.schemas.group import GroupCreate, GroupResponse, AddRemoveMembers, MemberStatus
 
@@ -13,10 +17,19 @@ from app.core.security import get_current_user # Import from YOUR service's loca
 from app.schemas.auth import CurrentUser      # Import from YOUR service's local schemas/auth.py
 
 from bson import ObjectId
+from pymongo import ReturnDocument
 
 
 router = APIRouter()
 
+GROUP_FIELDS = ("id", "name", "members", "created_at", "created_by")
+GROUP_PROJECTION = projection(GROUP_FIELDS)
+
+def membership_event(routing_key: str, group_id: str, usernames: List[str]) -> dict:
+    # Consumed by expense_service to invalidate its cached member sets; written to the
+    # outbox with the membership change and published by the relay
+    return outbox_entry("group_events", routing_key, {"group_id": group_id, "usernames": usernames})
+
 @router.post("/groups", response_model=GroupResponse, status_code=status.HTTP_201_CREATED)
 async def create_group(group_data: GroupCreate, current_user: CurrentUser = Depends(get_current_user)):
     db = get_database()
@@ -28,8 +41,10 @@ async def create_group(group_data: GroupCreate, current_user: CurrentUser = Depe
         created_by=current_user.username
     )
     
-    result = await db["groups"].insert_one(group_in_db.dict(by_alias=True))
-    created_group = await db["groups"].find_one({"_id": result.inserted_id})
+    # The inserted document is already final; no need to read it back
+    created_group = group_in_db.dict(by_alias=True)
+    result = await db["groups"].insert_one(created_group)
+    created_group["_id"] = result.inserted_id
     
     return GroupResponse(
         id=str(created_group["_id"]),
@@ -46,13 +61,16 @@ async def get_group_details(group_id: str, current_user: CurrentUser = Depends(g
     if not ObjectId.is_valid(group_id):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid Group ID format.")
 
-    group = await db["groups"].find_one({"_id": ObjectId(group_id)})
+    group = await db["groups"].find_one({"_id": ObjectId(group_id)}, GROUP_PROJECTION)
     if not group:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Group not found.")
     
     if current_user.username not in group["members"]:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are not a member of this group.")
 
+    if settings.FAST_JSON_RESPONSES:
+        return FastJSONResponse(to_jsonable(group, GROUP_FIELDS))
+
     return GroupResponse(
         id=str(group["_id"]),
         name=group["name"],
@@ -65,7 +83,10 @@ async def get_group_details(group_id: str, current_user: CurrentUser = Depends(g
 async def get_user_groups(current_user: CurrentUser = Depends(get_current_user)):
     db = get_database()
     
-    groups = await db["groups"].find({"members": current_user.username}).to_list(None)
+    groups = await db["groups"].find({"members": current_user.username}, GROUP_PROJECTION).to_list(None)
+
+    if settings.FAST_JSON_RESPONSES:
+        return FastJSONResponse(to_jsonable_many(groups, GROUP_FIELDS))
     
     return [
         GroupResponse(
@@ -104,15 +125,21 @@ async def add_group_members(group_id: str, member_data: AddRemoveMembers, curren
             detail=f"Some users do not exist: {', '.join(non_existent_members)}"
         )
 
-    update_result = await db["groups"].update_one(
-        {"_id": ObjectId(group_id)},
-        {"$addToSet": {"members": {"$each": member_data.usernames}}}
-    )
+    async with outbox_relay.transaction() as session:
+        updated_group = await db["groups"].find_one_and_update(
+            {"_id": ObjectId(group_id)},
+            {"$addToSet": {"members": {"$each": member_data.usernames}}},
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+
+        if updated_group is None or (
+            len(updated_group["members"]) == len(group["members"]) and not any(m in group["members"] for m in member_data.usernames)
+        ):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No new members were added or group not found.")
 
-    if update_result.modified_count == 0 and not any(m in group["members"] for m in member_data.usernames):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No new members were added or group not found.")
+        await outbox_relay.enqueue(db, [membership_event("group.members.added", group_id, member_data.usernames)], session=session)
 
-    updated_group = await db["groups"].find_one({"_id": ObjectId(group_id)})
     return MemberStatus(message="Members added successfully.", group_name=updated_group["name"], members=updated_group["members"])
 
 
@@ -140,15 +167,19 @@ async def remove_group_members(group_id: str, member_data: AddRemoveMembers, cur
           raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cannot remove the last member if they are the creator. Delete the group instead.")
 
 
-    update_result = await db["groups"].update_one(
-        {"_id": ObjectId(group_id)},
-        {"$pullAll": {"members": member_data.usernames}}
-    )
+    async with outbox_relay.transaction() as session:
+        updated_group = await db["groups"].find_one_and_update(
+            {"_id": ObjectId(group_id)},
+            {"$pullAll": {"members": member_data.usernames}},
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+
+        if updated_group is None or len(updated_group["members"]) == len(group["members"]):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No members were removed or group not found.")
+
+        await outbox_relay.enqueue(db, [membership_event("group.members.removed", group_id, member_data.usernames)], session=session)
 
-    if update_result.modified_count == 0:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No members were removed or group not found.")
-    
-    updated_group = await db["groups"].find_one({"_id": ObjectId(group_id)})
     return MemberStatus(message="Members removed successfully.", group_name=updated_group["name"], members=updated_group["members"])
 
 @router.delete("/groups/{group_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -166,8 +197,11 @@ async def delete_group(group_id: str, current_user: CurrentUser = Depends(get_cu
     if group["created_by"] != current_user.username:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only the group creator can delete this group.")
 
-    delete_result = await db["groups"].delete_one({"_id": ObjectId(group_id)})
-    if delete_result.deleted_count == 0:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Group not found.")
+    async with outbox_relay.transaction() as session:
+        delete_result = await db["groups"].delete_one({"_id": ObjectId(group_id)}, session=session)
+        if delete_result.deleted_count == 0:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Group not found.")
+
+        await outbox_relay.enqueue(db, [membership_event("group.deleted", group_id, group["members"])], session=session)
     
     return {} # No content for 204
\ No newline at end of file
@@ -0,0 +1,36 @@
+import asyncio
+import sys
+from pymongo import ASCENDING, IndexModel
+from splitwise_common import indexes as registry
+from splitwise_common.outbox import OUTBOX_HOT_QUERY, outbox_indexes
+from app.core.config import settings
+from app.core.database import mongo
+
+# Index registry for Group Service, applied by splitwise_common/indexes.py on every startup.
+# Running this module checks that every hot query below is served by an index:
+#   python -m app.core.indexes
+
+INDEXES = {
+    "groups": [
+        # Multikey: one entry per member, serves "groups I belong to"
+        IndexModel([("members", ASCENDING)], name="members"),
+    ],
+    "users": [
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "outbox": outbox_indexes(settings.OUTBOX_RETENTION_SECONDS),
+}
+
+HOT_QUERIES = [
+    # (label, collection, filter, sort)
+    ("groups for user", "groups", {"members": "__explain__"}, None),
+    ("validate new members", "users", {"username": {"$in": ["__explain_a__", "__explain_b__"]}}, None),
+    OUTBOX_HOT_QUERY,
+]
+
+async def ensure_indexes(db):
+    await registry.ensure_indexes(db, INDEXES, mongo.service_name)
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(registry.run_check(mongo, INDEXES, HOT_QUERIES)))
@@ -0,0 +1,15 @@
+from splitwise_common.outbox import OutboxRelay
+from app.core.config import settings
+from app.core.database import mongo
+from app.core.rabbitmq import publisher
+
+# Membership events go through the shared transactional outbox (splitwise_common/outbox.py)
+
+outbox_relay = OutboxRelay(
+    mongo,
+    publisher,
+    batch_size=settings.OUTBOX_BATCH_SIZE,
+    poll_interval=settings.OUTBOX_POLL_INTERVAL_SECONDS,
+    lease_seconds=settings.OUTBOX_LEASE_SECONDS,
+    max_attempts=settings.OUTBOX_MAX_ATTEMPTS,
+)
@@ -0,0 +1,32 @@
+import aio_pika
+import asyncio
+from splitwise_common.publisher import EventPublisher
+from app.core.config import settings
+
+connection = None
+channel = None
+
+async def connect_to_rabbitmq(retries: int = 10, delay: int = 5):
+    global connection, channel
+
+    for attempt in range(1, retries + 1):
+        try:
+            print(f"[RabbitMQ] Attempt {attempt} to connect to {settings.RABBITMQ_URL}")
+            connection = await aio_pika.connect_robust(settings.RABBITMQ_URL)
+            channel = await connection.channel(publisher_confirms=True)
+            print(f"[RabbitMQ] ✅ Connected to RabbitMQ at {settings.RABBITMQ_URL}")
+            return
+        except aio_pika.exceptions.AMQPConnectionError as e:
+            print(f"[RabbitMQ] ❌ Connection failed: {e}")
+            if attempt == retries:
+                print("[RabbitMQ] ❌ Max retries reached. Exiting.")
+                exit(1)
+            await asyncio.sleep(delay)
+
+async def close_rabbitmq_connection():
+    global connection
+    if connection:
+        await connection.close()
+        print("[RabbitMQ] 🔒 Connection closed.")
+
+publisher = EventPublisher(max_in_flight=settings.RABBITMQ_PUBLISH_MAX_IN_FLIGHT, get_channel=lambda: channel)
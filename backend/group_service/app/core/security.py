@@ -2,6 +2,7 @@
 from jose import JWTError, jwt
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
+from pydantic import EmailStr
 from app.schemas.auth import CurrentUser # Import CurrentUser from local schemas
 from app.core.config import settings # Import settings to get JWT_SECRET_KEY
 
@@ -1,13 +1,21 @@
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
-from app.core.database import connect_to_mongo, close_mongo_connection
+from app.core.database import connect_to_mongo, close_mongo_connection, get_database, get_pool_metrics
+from app.core.indexes import ensure_indexes
+from app.core.rabbitmq import connect_to_rabbitmq, close_rabbitmq_connection, publisher
+from app.core.outbox import outbox_relay
 from app.api.v1.endpoints import groups
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    connect_to_mongo()
+    await connect_to_rabbitmq() # Membership changes are published to group_events
+    await connect_to_mongo()
+    await ensure_indexes(get_database())
+    await outbox_relay.start() # Publishes membership events written to the outbox
     yield
+    await outbox_relay.stop()
     close_mongo_connection()
+    await close_rabbitmq_connection()
 
 app = FastAPI(
     title="Group Service",
@@ -20,4 +28,13 @@ app.include_router(groups.router, prefix="/groups", tags=["Groups"])
 
 @app.get("/health")
 async def health_check():
-    return {"status": "ok", "service": "Group Service"}
\ No newline at end of file
+    return {"status": "ok", "service": "Group Service"}
+
+@app.get("/metrics")
+async def metrics():
+    return {
+        "service": "Group Service",
+        "mongo_pool": get_pool_metrics(),
+        "publisher": publisher.metrics(),
+        "outbox": await outbox_relay.metrics(),
+    }
@@ -1,9 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
+import asyncio
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from typing import List, Optional
+from app.core.balances import apply_payment, apply_payments, get_pair_balances
+from app.core.config import settings
 from app.core.database import get_database
-from app.core.stripe_api import create_dummy_payment_intent, confirm_dummy_payment_intent
+from splitwise_common.fast_json import FastJSONResponse, projection, to_jsonable_many
+from app.core.stripe_api import create_dummy_payment_intent, confirm_dummy_payment_intent, make_idempotency_key
 from app.models.payment import PaymentInDB
-from app.schemas.payment import PaymentCreate, PaymentResponse, UserBalance, BalanceDue
+from app.schemas.payment import (
+    PaymentCreate, PaymentResponse, UserBalance, BalanceDue,
+    PaymentBatchCreate, PaymentBatchItem, PaymentBatchResponse,
+    PaymentBatchConfirm, PaymentConfirmItem, PaymentConfirmBatchResponse
+)
 
 # REMOVE THESE TWO LINES:
 # from auth_service.app.api.v1.endpoints.auth import get_current_user # Re-use get_current_user
@@ -14,25 +22,60 @@ from app.core.security import get_current_user # Import from YOUR service's loca
 from app.schemas.auth import CurrentUser      # Import from YOUR service's local schemas/auth.py
 
 from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
 from datetime import datetime, timezone
 
 router = APIRouter()
 
+PAYMENT_FIELDS = ("id", "payer", "payee", "amount", "method", "status", "stripe_payment_intent_id", "created_at", "completed_at")
+PAYMENT_PROJECTION = projection(PAYMENT_FIELDS)
+
+def _payment_response(payment: dict) -> PaymentResponse:
+    return PaymentResponse(
+        id=str(payment["_id"]),
+        payer=payment["payer"],
+        payee=payment["payee"],
+        amount=payment["amount"],
+        method=payment["method"],
+        status=payment["status"],
+        stripe_payment_intent_id=payment["stripe_payment_intent_id"],
+        created_at=payment["created_at"].isoformat(),
+        completed_at=payment["completed_at"].isoformat() if payment["completed_at"] else None
+    )
+
 @router.post("/payments", response_model=PaymentResponse, status_code=status.HTTP_201_CREATED)
-async def create_payment(payment_data: PaymentCreate, current_user: CurrentUser = Depends(get_current_user)):
+async def create_payment(
+    payment_data: PaymentCreate,
+    current_user: CurrentUser = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255)
+):
+    """
+    Creates a payment and its Stripe PaymentIntent. Retrying with the same
+    Idempotency-Key header returns the payment created by the first attempt.
+    """
     db = get_database()
 
     if current_user.username == payment_data.payee:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cannot make a payment to yourself.")
 
+    if idempotency_key:
+        existing = await db["payments"].find_one({"payer": current_user.username, "idempotency_key": idempotency_key})
+        if existing:
+            return _payment_response(existing)
+
     # Check if payee exists (optional, could rely on Auth/User Service for full validation)
     payee_user = await db["users"].find_one({"username": payment_data.payee})
     if not payee_user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Payee user not found.")
 
+    # The _id is assigned up front: without a client key it identifies this request to Stripe
+    payment_id = ObjectId()
+    stripe_key = make_idempotency_key("payment_intent", current_user.username, idempotency_key or str(payment_id))
+
     try:
         # Simulate Stripe PaymentIntent creation
-        stripe_intent_info = await create_dummy_payment_intent(payment_data.amount)
+        stripe_intent_info = await create_dummy_payment_intent(payment_data.amount, idempotency_key=stripe_key)
         
         payment_in_db = PaymentInDB(
             payer=current_user.username,
@@ -40,27 +83,207 @@ async def create_payment(payment_data: PaymentCreate, current_user: CurrentUser
             amount=payment_data.amount,
             method="stripe_test",
             status=stripe_intent_info["status"], # e.g., 'requires_payment_method'
-            stripe_payment_intent_id=stripe_intent_info["id"]
+            stripe_payment_intent_id=stripe_intent_info["id"],
+            idempotency_key=idempotency_key
         )
 
-        result = await db["payments"].insert_one(payment_in_db.dict(by_alias=True))
-        created_payment = await db["payments"].find_one({"_id": result.inserted_id})
-        
-        return PaymentResponse(
-            id=str(created_payment["_id"]),
-            payer=created_payment["payer"],
-            payee=created_payment["payee"],
-            amount=created_payment["amount"],
-            method=created_payment["method"],
-            status=created_payment["status"],
-            stripe_payment_intent_id=created_payment["stripe_payment_intent_id"],
-            created_at=created_payment["created_at"].isoformat(),
-            completed_at=created_payment["completed_at"].isoformat() if created_payment["completed_at"] else None
-        )
+        # The inserted document is already final; no need to read it back
+        created_payment = payment_in_db.dict(by_alias=True)
+        created_payment["_id"] = payment_id
+        await db["payments"].insert_one(created_payment)
+
+        return _payment_response(created_payment)
+    except DuplicateKeyError:
+        # A concurrent request with the same Idempotency-Key won; Stripe gave both the same intent
+        return _payment_response(await db["payments"].find_one({"payer": current_user.username, "idempotency_key": idempotency_key}))
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Payment processing error: {e}")
 
 
+def _batch_item_key(idempotency_key: str, index: int) -> str:
+    # Item i of a batch behaves like a single POST /payments with this Idempotency-Key
+    return f"{idempotency_key}:{index}"
+
+# Registered before /payments/{payment_id}/confirm so "batch" is not taken for an id
+@router.post("/payments/batch", response_model=PaymentBatchResponse)
+async def create_payments_batch(
+    batch: PaymentBatchCreate,
+    current_user: CurrentUser = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=240)
+):
+    """
+    Creates one payment per item of a settlement plan. Payees are checked with one
+    query, the Stripe PaymentIntents are created concurrently (at most
+    PAYMENT_BATCH_CONCURRENCY at a time) and the payments are written with one insert.
+    Items fail independently: each result carries either the payment or an error.
+    Retrying with the same Idempotency-Key header returns the payments created by the
+    first attempt and only retries the items that failed.
+    """
+    db = get_database()
+    payer = current_user.username
+    items = batch.payments
+
+    if len(items) > settings.PAYMENT_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"A batch holds at most {settings.PAYMENT_BATCH_MAX_ITEMS} payments.")
+
+    results = [PaymentBatchItem(index=i, payee=item.payee) for i, item in enumerate(items)]
+    item_keys = [_batch_item_key(idempotency_key, i) if idempotency_key else None for i in range(len(items))]
+
+    try:
+        existing = {}
+        if idempotency_key:
+            async for payment in db["payments"].find({"payer": payer, "idempotency_key": {"$in": item_keys}}):
+                existing[payment["idempotency_key"]] = payment
+
+        payees = list({item.payee for item in items if item.payee != payer})
+        known_payees = set()
+        if payees:
+            async for user in db["users"].find({"username": {"$in": payees}}, {"_id": 0, "username": 1}):
+                known_payees.add(user["username"])
+    except PyMongoError as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Payment processing error: {e}")
+
+    pending = []
+    for i, item in enumerate(items):
+        if item_keys[i] in existing:
+            results[i].payment = _payment_response(existing[item_keys[i]])
+        elif item.payee == payer:
+            results[i].error = "Cannot make a payment to yourself."
+        elif item.payee not in known_payees:
+            results[i].error = "Payee user not found."
+        else:
+            pending.append(i)
+
+    payment_ids = {i: ObjectId() for i in pending}
+    slots = asyncio.Semaphore(settings.PAYMENT_BATCH_CONCURRENCY)
+
+    async def create_intent(i: int) -> dict:
+        stripe_key = make_idempotency_key("payment_intent", payer, item_keys[i] or str(payment_ids[i]))
+        async with slots:
+            return await create_dummy_payment_intent(items[i].amount, idempotency_key=stripe_key)
+
+    intents = await asyncio.gather(*(create_intent(i) for i in pending), return_exceptions=True)
+
+    docs = {}
+    for i, intent in zip(pending, intents):
+        if isinstance(intent, Exception):
+            results[i].error = f"Payment processing error: {intent}"
+            continue
+        doc = PaymentInDB(
+            payer=payer,
+            payee=items[i].payee,
+            amount=items[i].amount,
+            method="stripe_test",
+            status=intent["status"],
+            stripe_payment_intent_id=intent["id"],
+            idempotency_key=item_keys[i]
+        ).dict(by_alias=True)
+        doc["_id"] = payment_ids[i]
+        docs[i] = doc
+
+    if docs:
+        order = list(docs)
+        raced = []
+        try:
+            await db["payments"].insert_many([docs[i] for i in order], ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                i = order[error["index"]]
+                del docs[i]
+                if error.get("code") == 11000 and item_keys[i]:
+                    # A concurrent retry of this batch inserted the item first
+                    raced.append(i)
+                else:
+                    results[i].error = f"Payment processing error: {error.get('errmsg')}"
+        except PyMongoError as e:
+            for i in order:
+                results[i].error = f"Payment processing error: {e}"
+            docs = {}
+
+        for i, doc in docs.items():
+            results[i].payment = _payment_response(doc)
+        if raced:
+            winners = {}
+            try:
+                async for payment in db["payments"].find({"payer": payer, "idempotency_key": {"$in": [item_keys[i] for i in raced]}}):
+                    winners[payment["idempotency_key"]] = payment
+            except PyMongoError as e:
+                print(f"Payment Service: could not read back batch payments: {e}")
+            for i in raced:
+                if item_keys[i] in winners:
+                    results[i].payment = _payment_response(winners[item_keys[i]])
+                else:
+                    results[i].error = "Payment processing error: concurrent request with the same Idempotency-Key"
+
+    created = sum(1 for result in results if result.payment is not None)
+    return PaymentBatchResponse(created=created, failed=len(results) - created, results=results)
+
+@router.post("/payments/batch/confirm", response_model=PaymentConfirmBatchResponse)
+async def confirm_payments_batch(batch: PaymentBatchConfirm, current_user: CurrentUser = Depends(get_current_user)):
+    """
+    Confirms several of the current user's payments with one read, one update and one
+    balance write. Each result carries either the payment or an error; payments that
+    already succeeded are returned as they are.
+    """
+    db = get_database()
+    username = current_user.username
+
+    if len(batch.payment_ids) > settings.PAYMENT_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"A batch holds at most {settings.PAYMENT_BATCH_MAX_ITEMS} payments.")
+
+    object_ids = {payment_id: ObjectId(payment_id) for payment_id in batch.payment_ids if ObjectId.is_valid(payment_id)}
+    payments = {}
+    try:
+        if object_ids:
+            async for payment in db["payments"].find({"_id": {"$in": list(object_ids.values())}}):
+                payments[payment["_id"]] = payment
+
+        to_confirm = [
+            payment["_id"] for payment in payments.values()
+            if payment["payer"] == username and payment["status"] != "succeeded"
+        ]
+        flipped = []
+        if to_confirm:
+            # The confirmation_id tells the payments this request marked succeeded from
+            # those a concurrent confirmation got to first, so each counts once
+            confirmation_id = ObjectId()
+            await db["payments"].update_many(
+                {"_id": {"$in": to_confirm}, "status": {"$ne": "succeeded"}},
+                {"$set": {"status": "succeeded", "completed_at": datetime.now(timezone.utc), "confirmation_id": confirmation_id}}
+            )
+            async for payment in db["payments"].find({"_id": {"$in": to_confirm}}):
+                payments[payment["_id"]] = payment
+                if payment.get("confirmation_id") == confirmation_id:
+                    flipped.append(payment)
+    except PyMongoError as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Payment confirmation error: {e}")
+
+    if flipped:
+        try:
+            await apply_payments(db, flipped)
+        except PyMongoError as e:
+            # The payments stand; `python -m app.core.balances rebuild` restores the balances
+            print(f"Payment Service: could not apply {len(flipped)} batch-confirmed payment(s) to balances: {e}")
+
+    results = []
+    for payment_id in batch.payment_ids:
+        result = PaymentConfirmItem(payment_id=payment_id)
+        payment = payments.get(object_ids.get(payment_id))
+        if payment_id not in object_ids:
+            result.error = "Invalid Payment ID format."
+        elif payment is None:
+            result.error = "Payment not found."
+        elif payment["payer"] != username:
+            result.error = "You are not authorized to confirm this payment."
+        elif payment["status"] != "succeeded":
+            result.error = "Failed to confirm payment."
+        else:
+            result.payment = _payment_response(payment)
+        results.append(result)
+
+    confirmed = sum(1 for result in results if result.payment is not None)
+    return PaymentConfirmBatchResponse(confirmed=confirmed, failed=len(results) - confirmed, results=results)
+
 @router.post("/payments/{payment_id}/confirm", response_model=PaymentResponse)
 async def confirm_payment(payment_id: str, current_user: CurrentUser = Depends(get_current_user)):
     db = get_database()
@@ -97,15 +320,22 @@ async def confirm_payment(payment_id: str, current_user: CurrentUser = Depends(g
         updated_status = "succeeded" # Force to succeeded for dummy confirmation
         completed_at = datetime.now(timezone.utc)
 
-        update_result = await db["payments"].update_one(
-            {"_id": ObjectId(payment_id)},
-            {"$set": {"status": updated_status, "completed_at": completed_at}}
+        updated_payment = await db["payments"].find_one_and_update(
+            {"_id": ObjectId(payment_id), "status": {"$ne": updated_status}},
+            {"$set": {"status": updated_status, "completed_at": completed_at}},
+            return_document=ReturnDocument.AFTER
         )
 
-        if update_result.modified_count == 0:
+        if updated_payment is None:
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to confirm payment.")
 
-        updated_payment = await db["payments"].find_one({"_id": ObjectId(payment_id)})
+        # Only the request that flipped the status gets here, so the payment counts once
+        try:
+            await apply_payment(db, updated_payment)
+        except PyMongoError as e:
+            # The payment stands; `python -m app.core.balances rebuild` restores the balance
+            print(f"Payment Service: could not apply payment {payment_id} to balances: {e}")
+
         return PaymentResponse(
             id=str(updated_payment["_id"]),
             payer=updated_payment["payer"],
@@ -127,7 +357,10 @@ async def get_payment_history(current_user: CurrentUser = Depends(get_current_us
     
     payments = await db["payments"].find({
         "$or": [{"payer": current_user.username}, {"payee": current_user.username}]
-    }).sort("created_at", -1).to_list(None)
+    }, PAYMENT_PROJECTION).sort("created_at", -1).to_list(None)
+
+    if settings.FAST_JSON_RESPONSES:
+        return FastJSONResponse(to_jsonable_many(payments, PAYMENT_FIELDS))
 
     return [
         PaymentResponse(
@@ -153,62 +386,26 @@ async def get_user_balances(user_id: str, current_user: CurrentUser = Depends(ge
     
     username = current_user.username
 
-    # Aggregation pipeline to calculate balances
-    # We need to query both expenses and payments collections
-    # This example focuses only on payments for simplicity, assuming expenses are settled via payments.
-    # A full balance calculation would involve summing up 'split' from expenses and 'amount' from payments.
+    # One materialized row per counterparty, kept up to date from expense splits and
+    # confirmed payments (app/core/balances.py); > 0 means the counterparty owes us
+    rows = await get_pair_balances(db, username)
 
-    # This part needs data from Expense Service to truly reflect balances.
-    # For now, we'll calculate based *only* on successful payments.
-    # In a fully integrated system, the Reporting Service or a dedicated 'Balance Service'
-    # would aggregate data from Expense and Payment services.
-    
-    # For now, let's simulate a simple balance based on payments recorded here:
-    
-    pipeline = [
-        {"$match": {"$or": [{"payer": username}, {"payee": username}], "status": "succeeded"}},
-        {"$group": {
-            "_id": None,
-            "total_paid_out": {"$sum": {"$cond": [{"$eq": ["$payer", username]}, "$amount", 0]}},
-            "total_paid_in": {"$sum": {"$cond": [{"$eq": ["$payee", username]}, "$amount", 0]}},
-            "payments_made": {"$push": {"$cond": [{"$eq": ["$payer", username]}, {"payee": "$payee", "amount": "$amount"}, "$$REMOVE"]}},
-            "payments_received": {"$push": {"$cond": [{"$eq": ["$payee", username]}, {"payer": "$payer", "amount": "$amount"}, "$$REMOVE"]}},
-        }}
-    ]
-
-    balance_summary = await db["payments"].aggregate(pipeline).to_list(1)
-
-    owes = 0.0
-    owed_by = 0.0
+    owes_cents = 0
+    owed_by_cents = 0
     balances_to_settle: List[BalanceDue] = []
-    
-    if balance_summary:
-        summary = balance_summary[0]
-        owes = summary.get("total_paid_out", 0.0)
-        owed_by = summary.get("total_paid_in", 0.0)
-
-        # Calculate net amounts owed/owing per individual
-        net_individual_balances = {}
-        for p in summary.get("payments_made", []):
-            net_individual_balances.setdefault(p["payee"], 0.0)
-            net_individual_balances[p["payee"]] -= p["amount"] # User paid, so owes less (or other user is owed less)
-
-        for p in summary.get("payments_received", []):
-            net_individual_balances.setdefault(p["payer"], 0.0)
-            net_individual_balances[p["payer"]] += p["amount"] # User received, so is owed more (or other user owes more)
-        
-        for other_user, net_amount in net_individual_balances.items():
-            if net_amount < 0: # Current user owes 'other_user'
-                balances_to_settle.append(BalanceDue(from_user=username, to_user=other_user, amount=abs(net_amount)))
-            elif net_amount > 0: # 'other_user' owes current user
-                balances_to_settle.append(BalanceDue(from_user=other_user, to_user=username, amount=net_amount))
-
-    net_balance = round(owed_by - owes, 2)
+    for row in rows:
+        cents = row["net_cents"]
+        if cents < 0: # Current user owes the counterparty
+            owes_cents -= cents
+            balances_to_settle.append(BalanceDue(from_user=username, to_user=row["counterparty"], amount=-cents / 100))
+        else: # The counterparty owes the current user
+            owed_by_cents += cents
+            balances_to_settle.append(BalanceDue(from_user=row["counterparty"], to_user=username, amount=cents / 100))
 
     return UserBalance(
         username=username,
-        owes=round(owes, 2),
-        owed_by=round(owed_by, 2),
-        net_balance=net_balance,
+        owes=owes_cents / 100,
+        owed_by=owed_by_cents / 100,
+        net_balance=(owed_by_cents - owes_cents) / 100,
         balances_to_settle=balances_to_settle
     )
\ No newline at end of file
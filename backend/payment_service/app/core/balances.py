@@ -0,0 +1,290 @@
+import argparse
+import asyncio
+import json
+import sys
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Tuple
+import aio_pika
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from splitwise_common.retry import RetryPolicy, backoff_delays
+from app.core import rabbitmq
+from app.core.config import settings
+from app.core.database import connect_to_mongo, close_mongo_connection, get_client, get_database
+from app.core.netting import pair_netting_pipeline
+
+# Pairwise balances between users, combining expense splits and confirmed payments.
+#
+# `pair_balances` holds two mirrored rows per pair of users who ever shared money:
+#
+#   {"user": a, "counterparty": b, "net_cents": n, "applied": {expense_id: version}, "updated_at": datetime}
+#   {"user": b, "counterparty": a, "net_cents": -n, ...}
+#
+# n > 0 means b owes a. Amounts are integer cents so repeated $inc never drifts, and a
+# user's balances are the rows with user == them: one row per counterparty.
+#
+# Rows change incrementally:
+#   - expense.split_changed events (published by expense_service and the AI splitter)
+#     carry an expense's whole current split and its split_version. `applied_splits`
+#     remembers the last version applied per expense, so the delta (new - old) is applied
+#     once, and duplicate or out-of-order events are dropped. Each row also records the
+#     last version of every expense it took (applied.<expense_id>), which makes finishing
+#     a half-applied delta safe.
+#   - a payment applies its amount when it is confirmed.
+#
+# An event that fails to apply is retried from delay queues and dead-lettered to
+# payment_balance_queue.dlq after BALANCE_EVENTS_MAX_ATTEMPTS (splitwise_common/retry.py).
+#
+# Anything lost on the way (e.g. a crash between two writes) is repaired by replaying the
+# history, the expenses in EXPENSE_DB_NAME and the succeeded payments:
+#
+#   python -m app.core.balances verify     report rows that differ from the history
+#   python -m app.core.balances rebuild    rewrite pair_balances from the history
+
+PAIR_BALANCES_COLLECTION = "pair_balances"
+APPLIED_SPLITS_COLLECTION = "applied_splits"
+BALANCE_QUEUE = "payment_balance_queue"
+
+balance_retry_policy = RetryPolicy(
+    BALANCE_QUEUE,
+    backoff_delays(
+        settings.BALANCE_EVENTS_RETRY_BASE_DELAY_SECONDS, settings.BALANCE_EVENTS_RETRY_BACKOFF_FACTOR,
+        settings.BALANCE_EVENTS_MAX_ATTEMPTS
+    ),
+    get_channel=lambda: rabbitmq.channel,
+    service_name="Payment Service",
+)
+
+def to_cents(amount: float) -> int:
+    return int(round(amount * 100))
+
+def split_debts(paid_by: str, split_cents: Dict[str, int], sign: int = 1) -> Counter:
+    """(creditor, debtor) -> cents owed, for one expense's split."""
+    debts = Counter()
+    for debtor, cents in split_cents.items():
+        if debtor != paid_by and cents:
+            debts[(paid_by, debtor)] += sign * cents
+    return debts
+
+def payment_debts(payer: str, payee: str, amount: float) -> Counter:
+    # Paying someone is the same as them owing you the amount
+    return Counter({(payer, payee): to_cents(amount)})
+
+def pair_rows(debts: Counter) -> Dict[Tuple[str, str], int]:
+    """Mirrored (user, counterparty) -> net_cents changes for a set of debts."""
+    rows = Counter()
+    for (creditor, debtor), cents in debts.items():
+        rows[(creditor, debtor)] += cents
+        rows[(debtor, creditor)] -= cents
+    return {pair: cents for pair, cents in rows.items() if cents}
+
+async def apply_debts(db, debts: Counter):
+    rows = pair_rows(debts)
+    if not rows:
+        return
+    now = datetime.utcnow()
+    await db[PAIR_BALANCES_COLLECTION].bulk_write([
+        UpdateOne(
+            {"user": user, "counterparty": counterparty},
+            {"$inc": {"net_cents": cents}, "$set": {"updated_at": now}},
+            upsert=True
+        )
+        for (user, counterparty), cents in rows.items()
+    ], ordered=False)
+
+async def apply_payment(db, payment: dict):
+    """Applies a payment that has just been confirmed (call once per payment)."""
+    await apply_debts(db, payment_debts(payment["payer"], payment["payee"], payment["amount"]))
+
+async def apply_payments(db, payments: List[dict]):
+    """Applies payments that have just been confirmed, in one bulk write."""
+    debts = Counter()
+    for payment in payments:
+        debts.update(payment_debts(payment["payer"], payment["payee"], payment["amount"]))
+    await apply_debts(db, debts)
+
+def _split_cents(split: dict) -> List[list]:
+    # Usernames may contain '.', so splits are stored as [user, cents] pairs
+    return [[user, to_cents(amount)] for user, amount in (split or {}).items()]
+
+async def _apply_split_rows(db, expense_id: str, version: int, rows: List[list]):
+    """
+    Applies one split version's [user, counterparty, cents] row changes. Every row
+    remembers the last version of each expense it took (`applied.<expense_id>`), so
+    running this again after a partial failure only changes the rows that were missed.
+    """
+    if not rows:
+        return
+    field = f"applied.{expense_id}"
+    now = datetime.utcnow()
+    ops = [
+        UpdateOne(
+            {"user": user, "counterparty": counterparty, field: {"$not": {"$gte": version}}},
+            {"$inc": {"net_cents": cents}, "$set": {field: version, "updated_at": now}},
+            upsert=True
+        )
+        for user, counterparty, cents in rows
+    ]
+    for attempt in range(2):
+        try:
+            await db[PAIR_BALANCES_COLLECTION].bulk_write(ops, ordered=False)
+            return
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if e.details.get("writeConcernErrors") or any(err.get("code") != 11000 for err in errors):
+                raise
+            # A duplicate key means the row exists but did not match: it took this version
+            # already, or a concurrent upsert created it first. Now that it exists, one more
+            # pass tells the two apart.
+            if attempt:
+                return
+            ops = [ops[err["index"]] for err in errors]
+
+async def apply_split_event(db, event: dict) -> bool:
+    """
+    Applies one expense.split_changed event. Returns False if this version (or a newer
+    one) of the expense's split was applied already.
+
+    The row changes are first stored with the new state under `pending` and removed once
+    every row has taken them; a redelivery or the next version finishes any that a
+    failure left half done.
+    """
+    expense_id = event["expense_id"]
+    version = int(event["split_version"])
+    state = {
+        "paid_by": event["paid_by"],
+        "split": _split_cents(event["split"]),
+        "version": version,
+        "deleted": bool(event.get("deleted")),
+        "updated_at": datetime.utcnow(),
+    }
+    applied = db[APPLIED_SPLITS_COLLECTION]
+
+    while True:
+        current = await applied.find_one({"_id": expense_id})
+        if current is not None and current["version"] >= version:
+            if current["version"] == version and current.get("pending"):
+                pending = current["pending"]
+                break
+            return False
+
+        debts = split_debts(state["paid_by"], dict(state["split"]))
+        if current is not None:
+            debts.update(split_debts(current["paid_by"], dict(current["split"]), sign=-1))
+        rows = [[user, counterparty, cents] for (user, counterparty), cents in pair_rows(debts).items()]
+        pending = (current or {}).get("pending", []) + [{"version": version, "rows": rows}]
+        try:
+            if current is None:
+                await applied.insert_one({"_id": expense_id, **state, "pending": pending})
+                break
+            # Only if no other event moved the expense on since it was read
+            result = await applied.update_one({"_id": expense_id, "version": current["version"]}, {"$set": {**state, "pending": pending}})
+            if result.matched_count:
+                break
+        except DuplicateKeyError:
+            pass
+
+    for step in pending:
+        await _apply_split_rows(db, expense_id, step["version"], step["rows"])
+    await applied.update_one({"_id": expense_id, "version": version}, {"$unset": {"pending": ""}})
+    return True
+
+async def process_split_changed(message: aio_pika.IncomingMessage):
+    # Failures wait in a delay queue instead of being redelivered at once; the version
+    # check makes a repeat harmless
+    try:
+        event = json.loads(message.body.decode())
+        event["expense_id"], event["paid_by"], event["split_version"]
+    except (ValueError, KeyError, TypeError) as e:
+        print(f"Payment Service: malformed expense.split_changed event ({e}): {message.body[:200]!r}")
+        await balance_retry_policy.handle_failure(message, e, permanent=True)
+        return
+    try:
+        applied = await apply_split_event(get_database(), event)
+    except Exception as e:
+        print(f"Payment Service: could not apply split v{event['split_version']} of expense {event['expense_id']}: {e}")
+        await balance_retry_policy.handle_failure(message, e)
+        return
+    await message.ack()
+    if applied:
+        print(f"Payment Service: applied split v{event['split_version']} of expense {event['expense_id']}")
+
+async def get_pair_balances(db, username: str) -> List[dict]:
+    """The user's non-zero balance rows, one per counterparty."""
+    return await db[PAIR_BALANCES_COLLECTION].find(
+        {"user": username, "net_cents": {"$ne": 0}},
+        {"_id": 0, "counterparty": 1, "net_cents": 1}
+    ).to_list(None)
+
+async def replay_history(db, expense_db) -> Tuple[Dict[Tuple[str, str], int], Dict[str, dict]]:
+    """Pair rows recomputed from every expense and succeeded payment, plus each expense's applied state."""
+    debts = Counter()
+    applied = {}
+    async for expense in expense_db["expenses"].find({}, {"paid_by": 1, "split": 1, "split_version": 1}):
+        split = _split_cents(expense.get("split"))
+        debts.update(split_debts(expense["paid_by"], dict(split)))
+        applied[str(expense["_id"])] = {
+            "paid_by": expense["paid_by"], "split": split, "version": expense.get("split_version", 0), "deleted": False,
+        }
+    # Payments are netted per pair by the server, so this reads one document per pair
+    async for pair in db["payments"].aggregate(pair_netting_pipeline(), allowDiskUse=True):
+        debts[(pair["_id"]["lo"], pair["_id"]["hi"])] += pair["net_cents"]
+    return pair_rows(debts), applied
+
+async def verify(db, expense_db, show: int = 20) -> int:
+    """Number of pair rows that differ from the replayed history."""
+    expected, _ = await replay_history(db, expense_db)
+    stored = {}
+    async for row in db[PAIR_BALANCES_COLLECTION].find({"net_cents": {"$ne": 0}}, {"user": 1, "counterparty": 1, "net_cents": 1}):
+        stored[(row["user"], row["counterparty"])] = row["net_cents"]
+
+    mismatches = [
+        (pair, stored.get(pair, 0), expected.get(pair, 0))
+        for pair in sorted(set(stored) | set(expected))
+        if stored.get(pair, 0) != expected.get(pair, 0)
+    ]
+    for (user, counterparty), have, want in mismatches[:show]:
+        print(f"  {user} / {counterparty}: stored {have} cents, history says {want}")
+    print(f"{len(expected)} expected row(s), {len(stored)} stored, {len(mismatches)} mismatch(es).")
+    return len(mismatches)
+
+async def rebuild(db, expense_db) -> int:
+    """
+    Rewrites pair_balances and applied_splits from the history. Events applied while it
+    runs can be lost or counted twice; run it with the consumer stopped, or follow it
+    with verify.
+    """
+    rows, applied = await replay_history(db, expense_db)
+    now = datetime.utcnow()
+
+    # Expenses that no longer exist keep their applied version, with an empty split
+    await db[APPLIED_SPLITS_COLLECTION].update_many({}, {"$set": {"split": [], "deleted": True, "updated_at": now}, "$unset": {"pending": ""}})
+    ops = [ReplaceOne({"_id": expense_id}, {**state, "updated_at": now}, upsert=True) for expense_id, state in applied.items()]
+    for start in range(0, len(ops), 1000):
+        await db[APPLIED_SPLITS_COLLECTION].bulk_write(ops[start:start + 1000], ordered=False)
+
+    await db[PAIR_BALANCES_COLLECTION].delete_many({})
+    docs = [{"user": user, "counterparty": counterparty, "net_cents": cents, "updated_at": now} for (user, counterparty), cents in rows.items()]
+    for start in range(0, len(docs), 1000):
+        await db[PAIR_BALANCES_COLLECTION].insert_many(docs[start:start + 1000], ordered=False)
+    return len(docs)
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description="Check or rebuild the pair balances from expenses and payments.")
+    parser.add_argument("command", choices=["verify", "rebuild"])
+    args = parser.parse_args()
+
+    await connect_to_mongo()
+    try:
+        db = get_database()
+        expense_db = get_client()[settings.EXPENSE_DB_NAME]
+        if args.command == "verify":
+            return 1 if await verify(db, expense_db) else 0
+        print(f"Rebuilt {await rebuild(db, expense_db)} pair balance row(s).")
+        return 0
+    finally:
+        close_mongo_connection()
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
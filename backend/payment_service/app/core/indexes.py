@@ -0,0 +1,39 @@
+import asyncio
+import sys
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from splitwise_common import indexes as registry
+from app.core.database import mongo
+
+# Index registry for Payment Service, applied by splitwise_common/indexes.py on every startup.
+# Running this module checks that every hot query below is served by an index:
+#   python -m app.core.indexes
+
+INDEXES = {
+    "payments": [
+        IndexModel([("payer", ASCENDING), ("created_at", DESCENDING)], name="payer_created_at"),
+        IndexModel([("payee", ASCENDING), ("created_at", DESCENDING)], name="payee_created_at"),
+        # Idempotent POST /payments; payments created without a key are not indexed
+        IndexModel([("payer", ASCENDING), ("idempotency_key", ASCENDING)], name="payer_idempotency_key_unique", unique=True,
+                   partialFilterExpression={"idempotency_key": {"$type": "string"}}),
+    ],
+    "pair_balances": [
+        IndexModel([("user", ASCENDING), ("counterparty", ASCENDING)], name="user_counterparty_unique", unique=True),
+    ],
+    "users": [
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+}
+
+HOT_QUERIES = [
+    # (label, collection, filter, sort)
+    ("payment history", "payments", {"$or": [{"payer": "__explain__"}, {"payee": "__explain__"}]}, [("created_at", DESCENDING)]),
+    ("payee lookup", "users", {"username": "__explain__"}, None),
+    ("user balances", "pair_balances", {"user": "__explain__", "net_cents": {"$ne": 0}}, None),
+]
+
+async def ensure_indexes(db):
+    await registry.ensure_indexes(db, INDEXES, mongo.service_name)
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(registry.run_check(mongo, INDEXES, HOT_QUERIES)))
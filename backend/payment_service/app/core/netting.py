@@ -0,0 +1,28 @@
+# Aggregation pipeline that nets succeeded payments inside MongoDB.
+#
+# Amounts are signed with $cond and summed per pair of users in a single $group, in
+# integer cents, so the result has one document per pair instead of carrying every
+# payment back to Python. It is a full pass over the succeeded payments (status alone
+# selects most of the collection, so no index would help) and only runs in the pair
+# balance verify/rebuild jobs (app/core/balances.py).
+
+def _cents(field: str) -> dict:
+    return {"$toLong": {"$round": [{"$multiply": [field, 100]}, 0]}}
+
+def pair_netting_pipeline() -> list:
+    """
+    Net payments per unordered pair of users: {"_id": {"lo": a, "hi": b}, "net_cents": n}
+    with a < b; n > 0 means a paid b more than b paid a.
+    """
+    payer_is_lo = {"$lt": ["$payer", "$payee"]}
+    return [
+        {"$match": {"status": "succeeded"}},
+        {"$group": {
+            "_id": {
+                "lo": {"$cond": [payer_is_lo, "$payer", "$payee"]},
+                "hi": {"$cond": [payer_is_lo, "$payee", "$payer"]},
+            },
+            "net_cents": {"$sum": {"$cond": [payer_is_lo, _cents("$amount"), {"$multiply": [-1, _cents("$amount")]}]}},
+        }},
+        {"$match": {"net_cents": {"$ne": 0}}},
+    ]
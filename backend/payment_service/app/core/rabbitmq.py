@@ -0,0 +1,36 @@
+import aio_pika
+from app.core.config import settings
+
+connection = None
+channel = None
+
+async def connect_to_rabbitmq():
+    global connection, channel
+    try:
+        connection = await aio_pika.connect_robust(settings.RABBITMQ_URL)
+        channel = await connection.channel()
+        print(f"Payment Service: Connected to RabbitMQ at {settings.RABBITMQ_URL}")
+        return channel
+    except aio_pika.exceptions.AMQPConnectionError as e:
+        print(f"Payment Service: Could not connect to RabbitMQ: {e}")
+        return None
+
+async def close_rabbitmq_connection():
+    global connection
+    if connection:
+        await connection.close()
+        print("Payment Service: RabbitMQ connection closed.")
+
+async def consume_messages(queue_name: str, routing_key: str, callback, prefetch_count: int):
+    """Starts consuming `queue_name` bound to `routing_key` on expense_events; returns the consumer tag."""
+    if not channel:
+        print("Payment Service: RabbitMQ channel not available for consumption.")
+        return None
+
+    await channel.set_qos(prefetch_count=prefetch_count)
+    exchange = await channel.declare_exchange("expense_events", aio_pika.ExchangeType.TOPIC, durable=True)
+    queue = await channel.declare_queue(queue_name, durable=True)
+    await queue.bind(exchange, routing_key)
+
+    print(f"Payment Service: Consuming from queue: {queue_name} with routing key {routing_key}")
+    return await queue.consume(callback)
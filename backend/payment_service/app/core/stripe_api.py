@@ -1,21 +1,98 @@
+import asyncio
+import hashlib
+import time
+from typing import Optional
 import stripe
 from app.core.config import settings
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
+# Non-blocking Stripe adapter.
+#
+# One StripeClient for the process, using the library's async API over an httpx
+# AsyncClient, so calls never block the event loop and reuse keep-alive connections
+# from a single pool. At most STRIPE_MAX_CONCURRENT_CALLS calls are in flight (the
+# rest wait for a slot), and each call, including that wait and the library's own
+# network retries, must finish within STRIPE_TIMEOUT_SECONDS.
+#
+# Creates carry an idempotency key, so a retried request (ours or the library's) never
+# creates a second PaymentIntent. STRIPE_API_BASE points the client at a stand-in such
+# as app/fake_stripe.py for offline load tests.
 
-async def create_dummy_payment_intent(amount: float, currency: str = "usd") -> dict:
+client = stripe.StripeClient(
+    settings.STRIPE_SECRET_KEY,
+    http_client=stripe.HTTPXClient(timeout=settings.STRIPE_TIMEOUT_SECONDS),
+    max_network_retries=settings.STRIPE_MAX_NETWORK_RETRIES,
+    **({"base_addresses": {"api": settings.STRIPE_API_BASE}} if settings.STRIPE_API_BASE else {}),
+)
+
+class StripeTimeoutError(Exception):
+    """A Stripe call did not finish within STRIPE_TIMEOUT_SECONDS."""
+
+class StripeMetrics:
+    def __init__(self, max_concurrent_calls: int):
+        self.slots = asyncio.Semaphore(max_concurrent_calls)
+        self.max_concurrent_calls = max_concurrent_calls
+        self.in_flight = 0
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self._total_ms = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent_calls": self.max_concurrent_calls,
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "avg_latency_ms": round(self._total_ms / self.calls, 2) if self.calls else 0.0,
+        }
+
+stripe_metrics = StripeMetrics(settings.STRIPE_MAX_CONCURRENT_CALLS)
+
+async def _call(coro_fn, *args, **kwargs):
+    started = time.monotonic()
+
+    async def bounded():
+        async with stripe_metrics.slots:
+            stripe_metrics.in_flight += 1
+            try:
+                return await coro_fn(*args, **kwargs)
+            finally:
+                stripe_metrics.in_flight -= 1
+
+    stripe_metrics.calls += 1
+    try:
+        return await asyncio.wait_for(bounded(), timeout=settings.STRIPE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        stripe_metrics.timeouts += 1
+        raise StripeTimeoutError(f"Stripe call exceeded {settings.STRIPE_TIMEOUT_SECONDS}s")
+    except Exception:
+        stripe_metrics.errors += 1
+        raise
+    finally:
+        stripe_metrics._total_ms += (time.monotonic() - started) * 1000
+
+def make_idempotency_key(*parts: str) -> str:
+    """Stable Stripe idempotency key for the request identified by `parts`."""
+    return "splitwise-" + hashlib.sha256("\x00".join(parts).encode()).hexdigest()[:48]
+
+async def create_dummy_payment_intent(amount: float, currency: str = "usd", idempotency_key: Optional[str] = None) -> dict:
     """
     Simulates creating a Stripe PaymentIntent in test mode.
     This will create a PaymentIntent that needs confirmation from the client-side,
     but for backend testing, we are mostly interested in the initial creation.
     """
+    options = {"idempotency_key": idempotency_key} if idempotency_key else {}
     try:
-        # Amount in cents
-        intent = stripe.PaymentIntent.create(
-            amount=int(amount * 100),
-            currency=currency,
-            payment_method_types=["card"], # Can be adjusted
-            description=f"Payment for {amount} {currency}"
+        intent = await _call(
+            client.payment_intents.create_async,
+            params={
+                "amount": int(round(amount * 100)), # Amount in cents
+                "currency": currency,
+                "payment_method_types": ["card"], # Can be adjusted
+                "description": f"Payment for {amount} {currency}",
+            },
+            options=options,
         )
         return {"id": intent.id, "client_secret": intent.client_secret, "status": intent.status, "amount": amount}
     except stripe.error.StripeError as e:
@@ -35,18 +112,18 @@ async def confirm_dummy_payment_intent(payment_intent_id: str) -> dict:
         # For simplicity, we just retrieve and return status, assuming client-side handles confirmation.
         # To truly simulate success, you might want to call stripe.PaymentIntent.confirm
         # with a dummy payment method, but that's more complex for a test.
-        intent = stripe.PaymentIntent.retrieve(payment_intent_id)
-        
+        intent = await _call(client.payment_intents.retrieve_async, payment_intent_id)
+
         # For testing, we'll mark it as successful if it's currently 'requires_payment_method' or 'requires_confirmation'
         # In a real app, this is where you'd integrate the actual payment method ID and confirm
         # Example for direct confirmation for testing purposes:
         # if intent.status in ['requires_payment_method', 'requires_confirmation']:
-        #    intent = stripe.PaymentIntent.confirm(payment_intent_id, payment_method="pm_card_visa") # A test card
-        
+        #    intent = await _call(client.payment_intents.confirm_async, payment_intent_id, params={"payment_method": "pm_card_visa"}) # A test card
+
         return {"id": intent.id, "status": intent.status, "amount": intent.amount / 100}
     except stripe.error.StripeError as e:
         print(f"Stripe Error: {e}")
         raise e
     except Exception as e:
         print(f"Unexpected error confirming payment intent: {e}")
-        raise e
\ No newline at end of file
+        raise e
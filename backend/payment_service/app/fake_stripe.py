@@ -0,0 +1,93 @@
+"""
+Local stand-in for the parts of the Stripe API the payment service uses, for load
+tests without network access or a Stripe account:
+
+    uvicorn app.fake_stripe:app --port 12111
+    STRIPE_API_BASE=http://localhost:12111 uvicorn app.main:app
+
+POST /v1/payment_intents and GET /v1/payment_intents/{id} return PaymentIntent objects
+after a simulated latency (log-normal, median FAKE_STRIPE_LATENCY_MS, spread
+FAKE_STRIPE_LATENCY_SIGMA), fail with a 500 with probability FAKE_STRIPE_ERROR_RATE,
+and replay the stored response for a repeated Idempotency-Key like Stripe does. Any
+API key is accepted. State lives in memory.
+"""
+import asyncio
+import math
+import os
+import random
+import time
+import uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+LATENCY_MS = float(os.getenv("FAKE_STRIPE_LATENCY_MS", 250))
+LATENCY_SIGMA = float(os.getenv("FAKE_STRIPE_LATENCY_SIGMA", 0.4))
+ERROR_RATE = float(os.getenv("FAKE_STRIPE_ERROR_RATE", 0.0))
+
+app = FastAPI(title="Fake Stripe", description="In-memory PaymentIntent API for offline load tests")
+
+intents = {}
+idempotent_responses = {} # Idempotency-Key -> (status_code, body)
+requests_served = 0
+
+async def _simulate():
+    global requests_served
+    requests_served += 1
+    await asyncio.sleep(random.lognormvariate(math.log(max(LATENCY_MS, 0.001)), LATENCY_SIGMA) / 1000)
+    if random.random() < ERROR_RATE:
+        return JSONResponse(status_code=500, content={"error": {"type": "api_error", "message": "Simulated failure"}})
+    return None
+
+def _error(status_code: int, message: str) -> JSONResponse:
+    return JSONResponse(status_code=status_code, content={"error": {"type": "invalid_request_error", "message": message}})
+
+@app.post("/v1/payment_intents")
+async def create_payment_intent(request: Request):
+    key = request.headers.get("Idempotency-Key")
+    if key and key in idempotent_responses:
+        status_code, body = idempotent_responses[key]
+        return JSONResponse(status_code=status_code, content=body, headers={"Idempotent-Replayed": "true"})
+
+    failure = await _simulate()
+    if failure is not None:
+        return failure
+
+    form = await request.form()
+    try:
+        amount = int(form["amount"])
+    except (KeyError, ValueError):
+        return _error(400, "Missing or invalid amount")
+    if amount < 50:
+        return _error(400, "Amount must be at least 50 cents")
+
+    intent_id = "pi_fake_" + uuid.uuid4().hex[:24]
+    intent = {
+        "id": intent_id,
+        "object": "payment_intent",
+        "amount": amount,
+        "currency": form.get("currency", "usd"),
+        "description": form.get("description"),
+        "payment_method_types": form.getlist("payment_method_types[0]") or ["card"],
+        "client_secret": f"{intent_id}_secret_{uuid.uuid4().hex[:16]}",
+        "status": "requires_payment_method",
+        "created": int(time.time()),
+        "livemode": False,
+    }
+    intents[intent_id] = intent
+    if key:
+        idempotent_responses[key] = (200, intent)
+    return intent
+
+@app.get("/v1/payment_intents/{intent_id}")
+async def retrieve_payment_intent(intent_id: str):
+    failure = await _simulate()
+    if failure is not None:
+        return failure
+    intent = intents.get(intent_id)
+    if intent is None:
+        return _error(404, f"No such payment_intent: '{intent_id}'")
+    return intent
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "service": "Fake Stripe", "intents": len(intents), "requests": requests_served}
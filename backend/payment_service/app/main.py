@@ -1,12 +1,25 @@
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
-from app.core.database import connect_to_mongo, close_mongo_connection
+from app.core.database import connect_to_mongo, close_mongo_connection, get_database, get_pool_metrics
+from app.core.indexes import ensure_indexes
+from app.core import rabbitmq
+from app.core.balances import BALANCE_QUEUE, balance_retry_policy, process_split_changed
+from app.core.config import settings
+from app.core.stripe_api import stripe_metrics
+from app.core.rabbitmq import connect_to_rabbitmq, close_rabbitmq_connection, consume_messages
 from app.api.v1.endpoints import payments
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    connect_to_mongo()
+    await connect_to_mongo()
+    await ensure_indexes(get_database())
+    # Expense split changes feed the pair balances (app/core/balances.py)
+    await connect_to_rabbitmq()
+    if rabbitmq.channel is not None:
+        await balance_retry_policy.declare()
+    await consume_messages(BALANCE_QUEUE, "expense.split_changed", process_split_changed, settings.BALANCE_EVENTS_PREFETCH)
     yield
+    await close_rabbitmq_connection()
     close_mongo_connection()
 
 app = FastAPI(
@@ -20,4 +33,13 @@ app.include_router(payments.router, prefix="/payments", tags=["Payments"])
 
 @app.get("/health")
 async def health_check():
-    return {"status": "ok", "service": "Payment Service"}
\ No newline at end of file
+    return {"status": "ok", "service": "Payment Service"}
+
+@app.get("/metrics")
+async def metrics():
+    return {
+        "service": "Payment Service",
+        "mongo_pool": get_pool_metrics(),
+        "stripe": stripe_metrics.stats(),
+        "balance_event_retries": balance_retry_policy.stats(),
+    }
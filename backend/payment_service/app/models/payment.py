@@ -26,8 +26,10 @@ class PaymentInDB(BaseModel):
     method: str = "stripe_test"
     status: str # e.g., "pending", "success", "failed"
     stripe_payment_intent_id: Optional[str] = None
+    idempotency_key: Optional[str] = None # Client's Idempotency-Key header, unique per payer
     created_at: datetime = Field(default_factory=datetime.utcnow)
     completed_at: Optional[datetime] = None
+    confirmation_id: Optional[PyObjectId] = None # Set by the batch confirmation that marked it succeeded
 
     class Config:
         allow_population_by_field_name = True
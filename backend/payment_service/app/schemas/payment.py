@@ -18,6 +18,34 @@ class PaymentResponse(BaseModel):
     created_at: str
     completed_at: Optional[str]
 
+class PaymentBatchCreate(BaseModel):
+    # One transfer per item, e.g. the current user's rows of a group's settlement plan
+    payments: List[PaymentCreate] = Field(min_items=1)
+
+class PaymentBatchItem(BaseModel):
+    index: int  # Position of the item in the request
+    payee: str
+    payment: Optional[PaymentResponse] = None
+    error: Optional[str] = None
+
+class PaymentBatchResponse(BaseModel):
+    created: int = 0
+    failed: int = 0
+    results: List[PaymentBatchItem] = []
+
+class PaymentBatchConfirm(BaseModel):
+    payment_ids: List[str] = Field(min_items=1)
+
+class PaymentConfirmItem(BaseModel):
+    payment_id: str
+    payment: Optional[PaymentResponse] = None
+    error: Optional[str] = None
+
+class PaymentConfirmBatchResponse(BaseModel):
+    confirmed: int = 0
+    failed: int = 0
+    results: List[PaymentConfirmItem] = []
+
 class BalanceDue(BaseModel):
     from_user: str  # The user who owes
     to_user: str  # The user who is owed
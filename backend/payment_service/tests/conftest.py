@@ -0,0 +1,13 @@
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Modules import as `app.core.x` (the service runs from its own directory), and the
+# image ships backend/common next to them
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, os.path.join(HERE, "..", "..", "common"))
+
+# app.core.config refuses to load without these
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret")
+os.environ.setdefault("STRIPE_SECRET_KEY", "sk_test_dummy")
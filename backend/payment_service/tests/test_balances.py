@@ -0,0 +1,199 @@
+import asyncio
+import copy
+from collections import Counter
+import pytest
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+from app.core import balances
+from app.core.balances import APPLIED_SPLITS_COLLECTION, PAIR_BALANCES_COLLECTION, apply_split_event, pair_rows
+
+class UpdateResult:
+    def __init__(self, matched_count):
+        self.matched_count = matched_count
+
+class FakeAppliedSplits:
+    """The few applied_splits operations apply_split_event uses, with unique _id."""
+
+    def __init__(self):
+        self.docs = {}
+
+    async def find_one(self, query):
+        return copy.deepcopy(self.docs.get(query["_id"]))
+
+    async def insert_one(self, doc):
+        if doc["_id"] in self.docs:
+            raise DuplicateKeyError("E11000 duplicate key error")
+        self.docs[doc["_id"]] = copy.deepcopy(doc)
+
+    async def update_one(self, query, update):
+        doc = self.docs.get(query["_id"])
+        if doc is None or doc["version"] != query["version"]:
+            return UpdateResult(0)
+        doc.update(copy.deepcopy(update.get("$set", {})))
+        for field in update.get("$unset", {}):
+            doc.pop(field, None)
+        return UpdateResult(1)
+
+class Ledger:
+    """
+    Stands in for _apply_split_rows: keeps the pair rows and, like the real rows, the last
+    version of each expense every row took. fail_after=n writes n rows, then fails.
+    """
+
+    def __init__(self):
+        self.rows = Counter()
+        self.versions = {}
+        self.fail_after = None
+
+    async def __call__(self, db, expense_id, version, rows):
+        for user, counterparty, cents in rows:
+            if self.fail_after == 0:
+                self.fail_after = None
+                raise PyMongoError("write failed")
+            if self.fail_after is not None:
+                self.fail_after -= 1
+            if self.versions.get((user, counterparty, expense_id), 0) >= version:
+                continue
+            self.rows[(user, counterparty)] += cents
+            self.versions[(user, counterparty, expense_id)] = version
+
+    def net(self):
+        return {pair: cents for pair, cents in self.rows.items() if cents}
+
+@pytest.fixture
+def ledger(monkeypatch):
+    ledger = Ledger()
+    monkeypatch.setattr(balances, "_apply_split_rows", ledger)
+    return ledger
+
+@pytest.fixture
+def db():
+    return {APPLIED_SPLITS_COLLECTION: FakeAppliedSplits()}
+
+def event(version, split, paid_by="alice", deleted=False):
+    return {"expense_id": "e1", "split_version": version, "paid_by": paid_by, "split": split, "deleted": deleted}
+
+def apply(db, *events):
+    async def run():
+        return [await apply_split_event(db, e) for e in events]
+    return asyncio.run(run())
+
+def test_first_version_applies_the_whole_split(db, ledger):
+    assert apply(db, event(1, {"alice": 10.0, "bob": 20.0})) == [True]
+    assert ledger.net() == {("alice", "bob"): 2000, ("bob", "alice"): -2000}
+
+def test_newer_version_applies_only_the_difference(db, ledger):
+    apply(db, event(1, {"alice": 10.0, "bob": 20.0}), event(2, {"alice": 5.0, "bob": 15.0, "carol": 10.0}))
+    assert ledger.net() == {
+        ("alice", "bob"): 1500, ("bob", "alice"): -1500,
+        ("alice", "carol"): 1000, ("carol", "alice"): -1000,
+    }
+
+def test_payer_change_moves_the_debts(db, ledger):
+    apply(db, event(1, {"alice": 15.0, "bob": 15.0}), event(2, {"alice": 15.0, "bob": 15.0}, paid_by="bob"))
+    assert ledger.net() == {("bob", "alice"): 1500, ("alice", "bob"): -1500}
+
+def test_duplicate_and_stale_events_are_dropped(db, ledger):
+    assert apply(db, event(2, {"alice": 10.0, "bob": 20.0}), event(2, {"alice": 10.0, "bob": 20.0}), event(1, {"bob": 30.0})) == [True, False, False]
+    assert ledger.net() == {("alice", "bob"): 2000, ("bob", "alice"): -2000}
+
+def test_deletion_clears_the_expense(db, ledger):
+    apply(db, event(1, {"alice": 10.0, "bob": 20.0}), event(2, {}, deleted=True))
+    assert ledger.net() == {}
+    assert db[APPLIED_SPLITS_COLLECTION].docs["e1"]["deleted"] is True
+
+def test_half_applied_version_is_finished_by_the_redelivery(db, ledger):
+    apply(db, event(1, {"alice": 10.0, "bob": 20.0}))
+    ledger.fail_after = 1
+    with pytest.raises(PyMongoError):
+        apply(db, event(2, {"bob": 10.0, "carol": 20.0}))
+    assert db[APPLIED_SPLITS_COLLECTION].docs["e1"]["pending"]
+
+    assert apply(db, event(2, {"bob": 10.0, "carol": 20.0})) == [True]
+    assert ledger.net() == {
+        ("alice", "bob"): 1000, ("bob", "alice"): -1000,
+        ("alice", "carol"): 2000, ("carol", "alice"): -2000,
+    }
+    assert "pending" not in db[APPLIED_SPLITS_COLLECTION].docs["e1"]
+    assert apply(db, event(2, {"bob": 10.0, "carol": 20.0})) == [False]
+
+def test_half_applied_version_is_finished_by_the_next_one(db, ledger):
+    apply(db, event(1, {"alice": 10.0, "bob": 20.0}))
+    ledger.fail_after = 1
+    with pytest.raises(PyMongoError):
+        apply(db, event(2, {"carol": 30.0}))
+
+    # Version 3 arrives before the redelivery of version 2
+    assert apply(db, event(3, {"bob": 5.0, "dave": 25.0}), event(2, {"carol": 30.0})) == [True, False]
+    assert ledger.net() == {
+        ("alice", "bob"): 500, ("bob", "alice"): -500,
+        ("alice", "dave"): 2500, ("dave", "alice"): -2500,
+    }
+
+def test_failed_first_write_is_finished_by_the_redelivery(db, ledger):
+    ledger.fail_after = 0
+    with pytest.raises(PyMongoError):
+        apply(db, event(1, {"bob": 30.0}))
+    assert apply(db, event(1, {"bob": 30.0})) == [True]
+    assert ledger.net() == {("alice", "bob"): 3000, ("bob", "alice"): -3000}
+
+class DuplicateOnFirstRow:
+    """bulk_write that reports a duplicate key for the first op of every call."""
+
+    def __init__(self, code=11000):
+        self.code = code
+        self.calls = []
+
+    async def bulk_write(self, ops, ordered):
+        self.calls.append(len(ops))
+        raise BulkWriteError({"writeErrors": [{"index": 0, "code": self.code, "errmsg": "E"}], "writeConcernErrors": []})
+
+def test_duplicate_rows_are_retried_once_then_taken_as_applied():
+    pairs = DuplicateOnFirstRow()
+    rows = [["alice", "bob", 100], ["bob", "alice", -100]]
+    asyncio.run(balances._apply_split_rows({PAIR_BALANCES_COLLECTION: pairs}, "e1", 2, rows))
+    assert pairs.calls == [2, 1]
+
+def test_other_row_errors_are_raised():
+    pairs = DuplicateOnFirstRow(code=121)
+    with pytest.raises(BulkWriteError):
+        asyncio.run(balances._apply_split_rows({PAIR_BALANCES_COLLECTION: pairs}, "e1", 2, [["alice", "bob", 100]]))
+
+class FakeMessage:
+    def __init__(self, body: bytes):
+        self.body = body
+        self.acked = False
+
+    async def ack(self):
+        self.acked = True
+
+@pytest.fixture
+def failures(monkeypatch):
+    calls = []
+
+    async def handle_failure(message, error, permanent=False):
+        calls.append((message, type(error), permanent))
+
+    monkeypatch.setattr(balances.balance_retry_policy, "handle_failure", handle_failure)
+    return calls
+
+def consume(message, db, monkeypatch):
+    monkeypatch.setattr(balances, "get_database", lambda: db)
+    asyncio.run(balances.process_split_changed(message))
+
+def test_consumer_acks_applied_events(db, ledger, failures, monkeypatch):
+    message = FakeMessage(b'{"expense_id": "e1", "split_version": 1, "paid_by": "alice", "split": {"bob": 5.0}}')
+    consume(message, db, monkeypatch)
+    assert message.acked and failures == []
+
+def test_consumer_dead_letters_malformed_events(db, ledger, failures, monkeypatch):
+    message = FakeMessage(b'{"expense_id": "e1"}')
+    consume(message, db, monkeypatch)
+    assert not message.acked
+    assert failures == [(message, KeyError, True)]
+
+def test_consumer_schedules_a_retry_when_applying_fails(db, ledger, failures, monkeypatch):
+    ledger.fail_after = 0
+    message = FakeMessage(b'{"expense_id": "e1", "split_version": 1, "paid_by": "alice", "split": {"bob": 5.0}}')
+    consume(message, db, monkeypatch)
+    assert not message.acked
+    assert failures == [(message, PyMongoError, False)]
@@ -22,7 +22,7 @@ async def process_expense_event(message: aio_pika.IncomingMessage):
         # print(f"Event stored for reporting: {routing_key}")
 
 async def main():
-    connect_to_mongo()
+    await connect_to_mongo()
     await connect_to_rabbitmq()
     
     # Listen to all expense events (or specific ones like 'expense.created', 'expense.split_updated')
@@ -6,6 +6,7 @@ from app.schemas.user import UserSearch, FriendRequest, FriendStatus, UserProfil
 from app.core.security import get_current_user # Correct import from THIS service's local security.py
 from app.schemas.auth import CurrentUser      # Correct import from THIS service's local schemas/auth.py (CurrentUser schema)
 from datetime import datetime # Import datetime for created_at if needed for UserProfile
+from pymongo import ReturnDocument
 
 router = APIRouter()
 
@@ -98,11 +99,15 @@ async def add_friend(friend_request: FriendRequest, current_user: CurrentUser =
     if current_user.username == friend_request.username:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cannot add yourself as a friend.")
 
-    # Add friend to current user's list if not already present
-    update_result = await users_collection.update_one(
-        {"username": current_user.username, "friends": {"$ne": friend_request.username}},
-        {"$addToSet": {"friends": friend_request.username}}
+    # Add friend to current user's list; the pre-update document tells us whether they were already friends
+    previous_user_doc = await users_collection.find_one_and_update(
+        {"username": current_user.username},
+        {"$addToSet": {"friends": friend_request.username}},
+        projection={"friends": 1},
+        return_document=ReturnDocument.BEFORE
     )
+    if previous_user_doc is None:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to add friend (unexpected).")
     
     # Also add current user to friend's list (mutual friendship)
     await users_collection.update_one(
@@ -110,17 +115,11 @@ async def add_friend(friend_request: FriendRequest, current_user: CurrentUser =
         {"$addToSet": {"friends": current_user.username}}
     )
 
-    if update_result.modified_count == 0:
-        # Check if already friends
-        current_user_doc = await users_collection.find_one({"username": current_user.username})
-        if friend_request.username in current_user_doc.get("friends", []):
-            return FriendStatus(message=f"{friend_request.username} is already your friend.", friends=current_user_doc["friends"])
-        else:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to add friend (unexpected).")
+    previous_friends = previous_user_doc.get("friends", [])
+    if friend_request.username in previous_friends:
+        return FriendStatus(message=f"{friend_request.username} is already your friend.", friends=previous_friends)
 
-    # Fetch updated friends list for current user
-    updated_user_doc = await users_collection.find_one({"username": current_user.username})
-    return FriendStatus(message=f"{friend_request.username} added to friends.", friends=updated_user_doc["friends"])
+    return FriendStatus(message=f"{friend_request.username} added to friends.", friends=previous_friends + [friend_request.username])
 
 
 @router.delete("/friends/{username}", response_model=FriendStatus)
@@ -138,9 +137,11 @@ async def delete_friend(username: str, current_user: CurrentUser = Depends(get_c
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Friend not found.")
 
     # Remove friend from current user's list
-    update_result = await users_collection.update_one(
-        {"username": current_user.username},
-        {"$pull": {"friends": username}}
+    updated_user_doc = await users_collection.find_one_and_update(
+        {"username": current_user.username, "friends": username},
+        {"$pull": {"friends": username}},
+        projection={"friends": 1},
+        return_document=ReturnDocument.AFTER
     )
 
     # Remove current user from friend's list (mutual deletion)
@@ -149,10 +150,9 @@ async def delete_friend(username: str, current_user: CurrentUser = Depends(get_c
         {"$pull": {"friends": current_user.username}}
     )
 
-    if update_result.modified_count == 0:
+    if updated_user_doc is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"{username} is not in your friend list.")
 
-    updated_user_doc = await users_collection.find_one({"username": current_user.username})
     return FriendStatus(message=f"{username} removed from friends.", friends=updated_user_doc["friends"])
 
 @router.get("/me/friends", response_model=List[UserSearch])
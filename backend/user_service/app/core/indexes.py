@@ -0,0 +1,28 @@
+import asyncio
+import sys
+from pymongo import ASCENDING, IndexModel
+from splitwise_common import indexes as registry
+from app.core.database import mongo
+
+# Index registry for User Service, applied by splitwise_common/indexes.py on every startup.
+# Running this module checks that every hot query below is served by an index:
+#   python -m app.core.indexes
+
+INDEXES = {
+    "users": [
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+}
+
+HOT_QUERIES = [
+    # (label, collection, filter, sort)
+    ("profile by username", "users", {"username": "__explain__"}, None),
+    ("friends details", "users", {"username": {"$in": ["__explain_a__", "__explain_b__"]}}, None),
+]
+
+async def ensure_indexes(db):
+    await registry.ensure_indexes(db, INDEXES, mongo.service_name)
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(registry.run_check(mongo, INDEXES, HOT_QUERIES)))
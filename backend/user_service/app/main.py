@@ -1,15 +1,15 @@
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
-from app.core.database import connect_to_mongo, close_mongo_connection
+from app.core.database import connect_to_mongo, close_mongo_connection, get_database, get_pool_metrics
+from app.core.indexes import ensure_indexes
 from app.api.v1.endpoints import users
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # connect_to_mongo is not an awaitable function in your database.py, so remove await
-    connect_to_mongo() 
+    await connect_to_mongo()
+    await ensure_indexes(get_database())
     yield
-    # close_mongo_connection is not an awaitable function
-    close_mongo_connection() 
+    close_mongo_connection()
 
 app = FastAPI(
     title="User Service",
@@ -22,4 +22,8 @@ app.include_router(users.router, prefix="/users", tags=["Users"])
 
 @app.get("/health")
 async def health_check():
-    return {"status": "ok", "service": "User Service"}
\ No newline at end of file
+    return {"status": "ok", "service": "User Service"}
+
+@app.get("/metrics")
+async def metrics():
+    return {"service": "User Service", "mongo_pool": get_pool_metrics()}